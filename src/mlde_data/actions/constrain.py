@@ -12,4 +12,13 @@ class Constrain:
 
     def __call__(self, ds):
         logger.info(f"Selecting {self.query} portion of dataset")
-        return ds.sel(self.query)
+        query = {}
+        for coord, value in self.query.items():
+            if coord in ds.coords and coord not in ds.indexes and ds[coord].ndim == 0:
+                # the selection was already applied when loading the source data
+                # leaving just a scalar coordinate behind
+                if ds[coord].item() != value:
+                    raise KeyError(f"{coord}={value} not found in dataset")
+                continue
+            query[coord] = value
+        return ds.sel(query)
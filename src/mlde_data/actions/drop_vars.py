@@ -7,10 +7,18 @@ logger = logging.getLogger(__name__)
 
 @register_action(name="drop-variables")
 class DropVariables:
-    def __init__(self, variables):
+    def __init__(self, variables, already_dropped=()):
         self.variables = variables
+        # variables left out when loading the source data so may (only) be missing
+        self.already_dropped = frozenset(already_dropped)
 
     def __call__(self, ds):
         logger.info(f"Dropping variables {self.variables}")
 
-        return ds.drop_vars(self.variables)
+        return ds.drop_vars(
+            [
+                name
+                for name in self.variables
+                if name in ds.variables or name not in self.already_dropped
+            ]
+        )
@@ -1,5 +1,5 @@
 import cf_xarray  # noqa: F401
-from functools import cached_property
+from functools import cache
 from importlib.resources import files
 import iris
 import iris.analysis
@@ -12,6 +12,18 @@ Regrid a dataset based on a given target grid file
 """
 
 
+# target grids are loaded once per process so long-lived workers (mlde-data serve) keep them
+@cache
+def _load_target_cube(target_grid_filepath):
+    return iris.load_cube(target_grid_filepath)
+
+
+@cache
+def _load_target_ds(target_grid_filepath):
+    with xr.open_dataset(target_grid_filepath) as ds:
+        return ds.load()
+
+
 @register_action(name="regrid_to_target")
 class Regrid:
 
@@ -30,13 +42,13 @@ class Regrid:
         self.variables = variables
         self.scheme = self.SCHEMES[scheme]()
 
-    @cached_property
+    @property
     def target_cube(self):
-        return iris.load_cube(self.target_grid_filepath)
+        return _load_target_cube(str(self.target_grid_filepath))
 
-    @cached_property
+    @property
     def target_ds(self):
-        return xr.open_dataset(self.target_grid_filepath)
+        return _load_target_ds(str(self.target_grid_filepath))
 
     def __call__(self, ds):
         # regrid the coarsened data to match the original horizontal grid (using NN interpolation)
@@ -81,8 +93,9 @@ class Regrid:
             vars.update(
                 {
                     variable: (
-                        [
-                            "time",
+                        # any leading dims (e.g. time and ensemble_member) are kept as they are
+                        list(ds[variable].dims[:-2])
+                        + [
                             self.target_ds.cf["Y"].name,
                             self.target_ds.cf["X"].name,
                         ],
@@ -3,6 +3,7 @@ import cf_xarray  # noqa: F401
 import logging
 import math
 import numpy as np
+import re
 
 from mlde_utils import cp_model_rotated_pole, platecarree
 from mlde_data.actions.actions_registry import register_action
@@ -44,26 +45,11 @@ class SelectDomain:
 
         size = self.size(ds.attrs.get("resolution"))
 
-        if "rotated_latitude_longitude" in ds.cf.grid_mapping_names:
-            centre_xy = self.DOMAIN_CENTRES_RP_LONG_LAT[self.domain]
-            query = dict(
-                X=centre_xy[0],
-                Y=centre_xy[1],
-            )
-        elif "latitude_longitude" in ds.cf.grid_mapping_names:
-            centre_xy = self.DOMAIN_CENTRES_LON_LAT[self.domain]
-            query = dict(
-                X=centre_xy[0],
-                Y=centre_xy[1],
-            )
-        elif "transverse_mercator" in ds.cf.grid_mapping_names:
-            centre_xy = self.DOMAIN_CENTRES_OSGB[self.domain]
-            query = dict(
-                X=centre_xy[0],
-                Y=centre_xy[1],
-            )
-        else:
-            raise ValueError(f"Unknown grid type: {self.grid}")
+        centre_xy = self.centre_xy(ds)
+        query = dict(
+            X=centre_xy[0],
+            Y=centre_xy[1],
+        )
 
         centre_ds = ds.cf.sel(query, method="nearest")
         centre_long_idx = np.where(ds.cf["X"].values == centre_ds.cf["X"].values)[
@@ -89,6 +75,19 @@ class SelectDomain:
 
         return ds
 
+    def centre_xy(self, ds):
+        """
+        Centre of the domain in the coordinates of the dataset's grid.
+        """
+        if "rotated_latitude_longitude" in ds.cf.grid_mapping_names:
+            return self.DOMAIN_CENTRES_RP_LONG_LAT[self.domain]
+        elif "latitude_longitude" in ds.cf.grid_mapping_names:
+            return self.DOMAIN_CENTRES_LON_LAT[self.domain]
+        elif "transverse_mercator" in ds.cf.grid_mapping_names:
+            return self.DOMAIN_CENTRES_OSGB[self.domain]
+        else:
+            raise ValueError(f"Unknown grid type: {ds.cf.grid_mapping_names}")
+
     def size(self, resolution):
         if resolution == "2.2km":
             return 256
@@ -98,3 +97,83 @@ class SelectDomain:
             return 13
         else:
             raise ValueError(f"Unknown resolution: {resolution}")
+
+
+# extra grid cells (at the resolution of the subdomain) to read around a subdomain
+# to allow for gradients, regridding and the approximate conversion from km to degrees
+EXTENT_PADDING_CELLS = 4
+KM_PER_DEGREE = 111.2
+
+
+def resolution_km(resolution: str) -> float:
+    """
+    Approximate grid spacing in km of a resolution like 2.2km, 2.2km-coarsened-4x or 60km.
+    """
+    coarsened = re.fullmatch(r"(.+)-coarsened-(\w+)", resolution)
+    if coarsened:
+        base, scale_factor = coarsened.groups()
+        if scale_factor == "gcm":
+            return resolution_km("60km")
+        return resolution_km(base) * int(scale_factor.removesuffix("x"))
+    native = re.fullmatch(r"([\d.]+)km", resolution)
+    if native:
+        return float(native.group(1))
+    raise ValueError(f"Unknown resolution: {resolution}")
+
+
+def _axis_coord(ds, axis):
+    try:
+        return ds.cf[axis]
+    except KeyError:
+        # lon-lat coordinates are not always labelled with an axis
+        return ds.cf[{"X": "longitude", "Y": "latitude"}[axis]]
+
+
+def extent_indexers(ds, extent) -> dict[str, slice]:
+    """
+    Index slices of a dataset's horizontal dimensions that cover a SpatialExtent (with some padding).
+
+    Slices start and stop on multiples of the extent's alignment so that coarsening the slice
+    gives the same cells as coarsening the whole grid. If the extent crosses the longitude break
+    of a global grid then all longitudes are kept.
+    """
+    centre_x, centre_y = SelectDomain(extent.domain).centre_xy(ds)
+    half_width_km = (
+        SelectDomain(extent.domain).size(extent.resolution) / 2 + EXTENT_PADDING_CELLS
+    ) * resolution_km(extent.resolution)
+
+    if "transverse_mercator" in ds.cf.grid_mapping_names:
+        half_widths = {"X": half_width_km * 1000, "Y": half_width_km * 1000}
+        periods = {"X": None, "Y": None}
+    else:
+        half_height = half_width_km / KM_PER_DEGREE
+        if "latitude_longitude" in ds.cf.grid_mapping_names:
+            # degrees of longitude shrink away from the equator
+            half_widths = {
+                "X": half_height / math.cos(math.radians(centre_y)),
+                "Y": half_height,
+            }
+        else:
+            # rotated pole grids put the domain near the equator
+            half_widths = {"X": half_height, "Y": half_height}
+        periods = {"X": 360, "Y": None}
+
+    indexers = {}
+    for axis, centre in [("X", centre_x), ("Y", centre_y)]:
+        coord = _axis_coord(ds, axis)
+        offsets = coord.values - centre
+        if periods[axis] is not None:
+            offsets = (offsets + periods[axis] / 2) % periods[axis] - periods[axis] / 2
+        inside = np.nonzero(np.abs(offsets) <= half_widths[axis])[0]
+        if len(inside) == 0:
+            raise ValueError(f"{extent} is outside the {coord.name} of the dataset")
+        if inside[-1] - inside[0] + 1 != len(inside):
+            logger.debug(f"{extent} wraps around {coord.name}, keeping all of it")
+            continue
+        start = inside[0] // extent.align * extent.align
+        stop = min(
+            math.ceil((inside[-1] + 1) / extent.align) * extent.align, coord.size
+        )
+        indexers[coord.dims[0]] = slice(start, stop)
+
+    return indexers
@@ -6,7 +6,7 @@ from pathlib import Path
 import typer
 import xarray as xr
 
-from . import dataset, etl, moose, variable
+from . import dag, dataset, etl, jobs, moose, moose_simulator, scratch, variable
 
 load_dotenv()  # take environment variables from .env.
 
@@ -15,10 +15,19 @@ logging.basicConfig(level=log_level, format="%(levelname)s %(asctime)s: %(messag
 logger = logging.getLogger(__name__)
 
 app = typer.Typer(pretty_exceptions_show_locals=False)
+app.add_typer(dag.app, name="dag")
 app.add_typer(dataset.app, name="dataset")
 app.add_typer(etl.app, name="etl")
 app.add_typer(moose.app, name="moose")
+app.add_typer(moose_simulator.app, name="moo-simulator")
+app.add_typer(scratch.app, name="scratch")
 app.add_typer(variable.app, name="variable")
+app.command()(jobs.serve)
+app.command()(jobs.requeue)
+# everything after the queue path is the command to submit, including its options
+app.command(
+    context_settings={"ignore_unknown_options": True, "allow_interspersed_args": False}
+)(jobs.submit)
 
 
 @app.command()
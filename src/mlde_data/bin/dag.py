@@ -0,0 +1,138 @@
+import logging
+from pathlib import Path
+import shlex
+import typer
+from typing import List
+
+from ..dag import Dag, batch_tasks, build_etl_dag, run_local, slurm_script
+from ..options import DomainOption
+from ..resources import parse_memory
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer()
+
+
+@app.callback()
+def callback():
+    pass
+
+
+def run_command(args: list[str]) -> None:
+    """
+    Run an mlde-data command in the current process, raising a RuntimeError if it exits with a
+    non-zero code (e.g. by raising typer.Exit(code=1) or for bad arguments).
+    """
+    import typer.main
+
+    from . import app as root_app
+
+    try:
+        typer.main.get_command(root_app).main(args)
+    except SystemExit as e:
+        # the command exits (with code 0) even when it succeeds
+        if e.code not in [0, None]:
+            raise RuntimeError(
+                f"mlde-data {shlex.join(args)} exited with code {e.code}"
+            ) from e
+
+
+@app.command()
+def plan(
+    years: List[int],
+    variable_configs: List[Path] = typer.Option(...),
+    ensemble_members: List[str] = typer.Option(...),
+    scale_factor: str = typer.Option(...),
+    domain: DomainOption = typer.Option(...),
+    thetas: List[int] = None,
+    target_resolution: str = None,
+    scenario: str = "rcp85",
+    extract_memory: str = typer.Option(
+        "4G", help="Estimated peak memory of extracting a source variable"
+    ),
+    create_memory: str = typer.Option(
+        "16G", help="Estimated peak memory of creating the variables for one year"
+    ),
+    extracts_base_dir: Path = typer.Option(
+        None, help="Directory to extract moose source data to (as for moose extract)"
+    ),
+    output: Path = typer.Option(...),
+):
+    """
+    Write a DAG of extract, create and clean tasks for the variables, ensemble members and years
+    """
+    dag = build_etl_dag(
+        years,
+        variable_configs,
+        ensemble_members,
+        scale_factor=scale_factor,
+        domain=domain.value,
+        scenario=scenario,
+        thetas=thetas,
+        target_resolution=target_resolution,
+        extract_memory=parse_memory(extract_memory),
+        create_memory=parse_memory(create_memory),
+        extracts_base_dir=extracts_base_dir,
+    )
+    dag.save(output)
+    typer.echo(f"{len(dag)} tasks in {len(dag.levels())} levels written to {output}")
+
+
+@app.command()
+def run(
+    dag_path: Path,
+    workers: int = typer.Option(1, help="Most tasks to run at once"),
+    max_memory: str = typer.Option(
+        None, help="Memory available for running tasks at once (e.g. 256G)"
+    ),
+):
+    """
+    Run a DAG's tasks on this node
+    """
+    run_local(
+        Dag.load(dag_path),
+        run_command,
+        workers=workers,
+        max_memory=parse_memory(max_memory),
+    )
+
+
+@app.command()
+def run_batch(
+    dag_path: Path,
+    level: int = typer.Option(...),
+    batch: int = typer.Option(...),
+    batches: int = typer.Option(...),
+):
+    """
+    Run one batch of a level of a DAG's tasks in turn (e.g. as an element of a Slurm array job)
+    """
+    for task in batch_tasks(Dag.load(dag_path), level, batch, batches):
+        logger.info(f"Running {task.name}")
+        run_command(task.command)
+
+
+@app.command()
+def slurm(
+    dag_path: Path,
+    output: Path = typer.Option(...),
+    max_array_size: int = typer.Option(
+        100, help="Most array elements to share each level's tasks between"
+    ),
+    sbatch_args: List[str] = typer.Option(
+        ["--time=23:00:00"], help="Extra arguments for each sbatch call"
+    ),
+):
+    """
+    Write a script to submit a DAG as one Slurm array job per level
+    """
+    output.write_text(
+        slurm_script(
+            Dag.load(dag_path),
+            dag_path.resolve(),
+            max_array_size=max_array_size,
+            sbatch_args=sbatch_args,
+        )
+    )
+    output.chmod(0o755)
+    typer.echo(f"Submit with {output}")
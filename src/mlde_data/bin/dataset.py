@@ -1,3 +1,4 @@
+import dask
 import glob
 from importlib.resources import files
 import logging
@@ -7,6 +8,7 @@ from pathlib import Path
 import shutil
 import sys
 import typer
+from typing import List
 import xarray as xr
 import yaml
 
@@ -19,6 +21,10 @@ from mlde_utils import (
 )
 
 from mlde_data import dataset as dataset_lib
+from mlde_data.dataset import extend as extend_lib
+from mlde_data.dataset import streaming
+from mlde_data.dataset import variable_store as variable_store_lib
+from mlde_data.staging import OutputStager
 
 logger = logging.getLogger(__name__)
 
@@ -37,19 +43,23 @@ def patch_stats(dataset_name: str, base_dir: Path = typer.Argument(DATASETS_PATH
 
     for var_type in ["predictands", "predictors"]:
         variables = config[var_type]["variables"]
-        for split_filepath in glob.glob(
-            os.path.join(dataset_dir, f"*/{var_type}.zarr")
+        for split_filepath in sorted(
+            glob.glob(os.path.join(dataset_dir, f"*/{var_type}.zarr"))
+            + glob.glob(
+                os.path.join(
+                    dataset_dir, f"*/{var_type}{variable_store_lib.VIEW_SUFFIX}"
+                )
+            )
         ):
             logger.info(f"Adding stats for {split_filepath}...")
-            split_ds = xr.open_dataset(split_filepath)
+            split_dir = os.path.dirname(split_filepath)
+            split_ds = variable_store_lib.open_split(split_dir, var_type)
             patched_ds = dataset_lib._calculate_statistics(
                 split_ds,
                 variables,
                 **config[var_type].get("stats", {"time_aggregation_factors": [1]}),
             )
-            split_stats_filepath = split_filepath.replace(
-                f"{var_type}.zarr", f"{var_type}_stats.zarr"
-            )
+            split_stats_filepath = os.path.join(split_dir, f"{var_type}_stats.zarr")
             patched_ds.to_zarr(split_stats_filepath, mode="w")
 
 
@@ -58,6 +68,18 @@ def create(
     config: Path,
     input_base_dir: Path = typer.Argument(DERIVED_VARIABLES_PATH),
     output_base_dir: Path = typer.Argument(DATASETS_PATH),
+    stream: bool = typer.Option(
+        False,
+        help="Fill each split's stores one ensemble member and variable at a time rather than building the whole dataset in memory",
+    ),
+    workers: int = typer.Option(
+        1,
+        help="Number of processes writing ensemble members and variables when streaming",
+    ),
+    variable_store: Path = typer.Option(
+        None,
+        help="Save each split variable to this store shared between datasets (if it is not there already) and the dataset as views of them",
+    ),
 ):
     """
     Create and save a dataset
@@ -66,7 +88,20 @@ def create(
     with open(config, "r") as f:
         config = yaml.safe_load(f)
 
-    split_sets, split_stats = dataset_lib.create(config, input_base_dir)
+    if stream and variable_store is not None:
+        raise typer.BadParameter("Streaming to a variable store is not supported")
+    if stream:
+        split_sets = streaming.plan_splits(config, input_base_dir)
+    else:
+        split_sets, split_stats = dataset_lib.create(
+            config,
+            input_base_dir,
+            load_stats=(
+                variable_store_lib.stats_loader(variable_store, config)
+                if variable_store is not None
+                else None
+            ),
+        )
 
     output_dir = DatasetMetadata(dataset_name, base_dir=output_base_dir).path()
 
@@ -77,31 +112,216 @@ def create(
         DatasetMetadata(dataset_name, base_dir=output_base_dir).config_path(), "w"
     ) as f:
         yaml.dump(config, f)
-    for var_type, var_type_splits in split_sets.items():
-        for split_name, split_ds in var_type_splits.items():
-            # rechunk to avoid issues with saving to zarr
-            times_per_day = 24 if var_type == "predictands" else 1
-            # 90 days (a season) per chunk, 10 results in too many files
-            time_chunk_size = times_per_day * 90
-            for var_name in split_ds.data_vars:
-                # ML suitable chunking: 1 day per chunk
-                new_chunks = {
-                    "ensemble_member": 1,
-                    "time": time_chunk_size,
-                    split_ds.cf["X"].name: split_ds.cf["X"].size,
-                    split_ds.cf["Y"].name: split_ds.cf["Y"].size,
-                }
-                if set(new_chunks.keys()) == set(split_ds[var_name].dims):
-                    if "chunks" in split_ds[var_name].encoding:
-                        # remove existing chunking info to avoid conflict
-                        del split_ds[var_name].encoding["chunks"]
-                    split_ds[var_name] = split_ds[var_name].chunk(new_chunks)
-            split_ds.to_zarr(
-                os.path.join(output_dir, split_name, f"{var_type}.zarr"), mode="w-"
+    # each store is written locally and moved to the output directory while the next is written
+    # (the output directory is new so nothing in it is ever replaced)
+    store_if_exists = _store_if_exists(variable_store)
+    with OutputStager(background=True) as output_stager:
+        if stream:
+            _write_streaming(
+                config, split_sets, input_base_dir, output_dir, output_stager, workers
+            )
+            return
+
+        for var_type, var_type_splits in split_sets.items():
+            for split_name, split_ds in var_type_splits.items():
+                split_dir = os.path.join(output_dir, split_name)
+                stores, variable_paths = _split_stores(
+                    config,
+                    var_type,
+                    split_name,
+                    split_ds,
+                    split_stats[var_type][split_name],
+                    split_dir,
+                    variable_store,
+                )
+                for path, store_ds in stores.items():
+                    output_stager.write(
+                        lambda local_path: store_ds.to_zarr(local_path, mode="w-"),
+                        path,
+                        if_exists=store_if_exists,
+                    )
+                if variable_paths is not None:
+                    _write_view(output_stager, variable_paths, split_dir, var_type)
+                output_stager.write(
+                    split_stats[var_type][split_name].to_zarr,
+                    os.path.join(split_dir, f"{var_type}_stats.zarr"),
+                )
+                logger.info(f"{var_type} {split_name} done")
+
+
+def _store_if_exists(variable_store):
+    """
+    What to do when publishing a store finds one already there: the paths in a variable store are
+    keyed by what they hold so a store published by another run meanwhile is the one wanted.
+    """
+    return "fail" if variable_store is None else "skip"
+
+
+def _split_stores(
+    config, var_type, split_name, split_ds, split_stats, split_dir, variable_store
+):
+    """
+    The stores to write for a split of a var type by path along with, if saving to a variable store,
+    the paths of its variables in the store.
+    """
+    split_ds = dataset_lib.rechunk(split_ds, var_type)
+    if variable_store is None:
+        return {os.path.join(split_dir, f"{var_type}.zarr"): split_ds}, None
+
+    stores = {}
+    variable_paths = {}
+    for var_name, var_ds in variable_store_lib.split_variables(
+        split_ds, config[var_type]["variables"]
+    ).items():
+        path = variable_store_lib.variable_path(
+            variable_store, config, var_type, var_name, split_name
+        )
+        variable_paths[var_name] = path
+        if path.exists():
+            logger.info(f"Reusing {path}")
+        else:
+            stores[path] = var_ds
+        stats_path = variable_store_lib.stats_path(
+            variable_store, config, var_type, var_name, split_name
+        )
+        if not stats_path.exists():
+            stores[stats_path] = split_stats.sel(variable=[var_name])
+    return stores, variable_paths
+
+
+def _write_view(output_stager, variable_paths, split_dir, var_type):
+    output_stager.write(
+        lambda path: variable_store_lib.write_view(
+            path, variable_paths, relative_to=split_dir
+        ),
+        variable_store_lib.view_path(split_dir, var_type),
+    )
+
+
+@app.command()
+def create_many(
+    configs: List[Path],
+    input_base_dir: Path = typer.Option(DERIVED_VARIABLES_PATH),
+    output_base_dir: Path = typer.Option(DATASETS_PATH),
+    variable_store: Path = typer.Option(
+        None,
+        help="Save each split variable to this store shared between datasets (if it is not there already) and the datasets as views of them",
+    ),
+):
+    """
+    Create and save several datasets, reading the variables they have in common only once
+    """
+    configs = {config.stem: yaml.safe_load(config.read_text()) for config in configs}
+
+    load_stats = None
+    if variable_store is not None:
+        load_stats = {
+            dataset_name: variable_store_lib.stats_loader(variable_store, config)
+            for dataset_name, config in configs.items()
+        }
+    datasets = dataset_lib.create_many(configs, input_base_dir, load_stats=load_stats)
+
+    for dataset_name, config in configs.items():
+        dsmeta = DatasetMetadata(dataset_name, base_dir=output_base_dir)
+        os.makedirs(dsmeta.path(), exist_ok=False)
+        with open(dsmeta.config_path(), "w") as f:
+            yaml.dump(config, f)
+
+    with OutputStager(background=True) as output_stager:
+        for var_type in ["predictands", "predictors"]:
+            stores = {}
+            views = []
+            for dataset_name, (split_sets, split_stats) in datasets.items():
+                output_dir = DatasetMetadata(
+                    dataset_name, base_dir=output_base_dir
+                ).path()
+                for split_name, split_ds in split_sets[var_type].items():
+                    split_dir = os.path.join(output_dir, split_name)
+                    split_stores, variable_paths = _split_stores(
+                        configs[dataset_name],
+                        var_type,
+                        split_name,
+                        split_ds,
+                        split_stats[var_type][split_name],
+                        split_dir,
+                        variable_store,
+                    )
+                    # a variable shared by several datasets is only written to the store once
+                    for path, store_ds in split_stores.items():
+                        stores.setdefault(str(path), store_ds)
+                    if variable_paths is not None:
+                        views.append((variable_paths, split_dir))
+                    output_stager.write(
+                        split_stats[var_type][split_name].to_zarr,
+                        os.path.join(split_dir, f"{var_type}_stats.zarr"),
+                    )
+
+            # all in one compute so data shared by several datasets is read once for all of them
+            def write_stores(paths):
+                dask.compute(
+                    *[
+                        store_ds.to_zarr(path, mode="w-", compute=False)
+                        for store_ds, path in zip(stores.values(), paths)
+                    ]
+                )
+
+            logger.info(f"Saving {var_type} to {len(stores)} stores...")
+            output_stager.write_many(
+                write_stores,
+                list(stores.keys()),
+                if_exists=_store_if_exists(variable_store),
+            )
+            for variable_paths, split_dir in views:
+                _write_view(output_stager, variable_paths, split_dir, var_type)
+            logger.info(f"{var_type} done")
+
+
+@app.command()
+def extend(
+    dataset_name: str,
+    ensemble_members: List[str] = typer.Option(
+        [], "--ensemble-member", help="Ensemble member to add"
+    ),
+    predictands: List[str] = typer.Option(
+        [], "--predictand", help="Predictand variable to add"
+    ),
+    predictors: List[str] = typer.Option(
+        [], "--predictor", help="Predictor variable to add"
+    ),
+    input_base_dir: Path = typer.Option(DERIVED_VARIABLES_PATH),
+    base_dir: Path = typer.Option(DATASETS_PATH),
+):
+    """
+    Add ensemble members or variables to a saved dataset, reading only the new data
+    """
+    config = extend_lib.extend(
+        dataset_name,
+        input_base_dir,
+        base_dir,
+        ensemble_members=ensemble_members,
+        variables={"predictands": predictands, "predictors": predictors},
+    )
+    logger.info(f"{dataset_name} now has ensemble members {config['ensemble_members']}")
+
+
+def _write_streaming(
+    config, split_sets, input_base_dir, output_dir, output_stager, workers
+):
+    for var_type in ["predictands", "predictors"]:
+        for split_name, split_days in split_sets.items():
+            stats = {}
+
+            def write_split(path):
+                stats[split_name] = streaming.write_split(
+                    config, var_type, split_days, input_base_dir, path, workers=workers
+                )
+
+            output_stager.write(
+                write_split, os.path.join(output_dir, split_name, f"{var_type}.zarr")
             )
-            split_stats[var_type][split_name].to_zarr(
+            output_stager.write(
+                stats[split_name].to_zarr,
                 os.path.join(output_dir, split_name, f"{var_type}_stats.zarr"),
-                mode="w-",
             )
             logger.info(f"{var_type} {split_name} done")
 
@@ -1,10 +1,18 @@
+from functools import partial
 import logging
 import os
+import socket
 from pathlib import Path
 from mlde_utils import RAW_MOOSE_VARIABLES_PATH
 from mlde_data.options import DomainOption, CollectionOption
 from mlde_data.bin.moose import extract, clean
-from mlde_data.bin.variable import create as create_variable
+from mlde_data.bin.variable import create as create_variable, source_filepaths
+from mlde_data.manifest import STATES, RunManifest, Task, run_tasks
+from mlde_data.moose import MoosePPVariableMetadata
+from mlde_data.resources import parse_memory
+from mlde_data.scheduler import Stage, YearScheduler, memory_slots
+from mlde_data.scratch import ScratchSpace
+from mlde_data.staging import SourceStager
 from mlde_data.variable import load_config
 from mlde_utils import VariableMetadata
 import typer
@@ -22,6 +30,132 @@ def callback():
     pass
 
 
+STAGE_OPTION = typer.Option(
+    False,
+    help="Copy each year's source files to local scratch (in TMPDIR) while the previous year is being processed",
+)
+STAGE_BUDGET_OPTION = typer.Option(
+    None, help="Most local scratch to use for staged source files (e.g. 200G)"
+)
+WORKERS_OPTION = typer.Option(1, help="Most years to create at once")
+MAX_MEMORY_OPTION = typer.Option(
+    None, help="Memory available for creating years at once (e.g. 256G)"
+)
+JOB_MEMORY_OPTION = typer.Option(
+    "16G", help="Estimated peak memory of creating the variables for one year"
+)
+
+
+MANIFEST_OPTION = typer.Option(
+    None,
+    help="Record the state of each task in this run manifest and skip those it shows are already done",
+)
+
+
+def _create_year(
+    manifest_path: Path | None,
+    variables: list[str],
+    force: bool,
+    create_kwargs: dict,
+    year: int,
+):
+    """
+    Create the variables for a year, recording it in the run manifest if there is one.
+    """
+    manifest = None if manifest_path is None else RunManifest(manifest_path)
+    tasks = [
+        Task("create", variable, create_kwargs["ensemble_member"], year)
+        for variable in variables
+    ]
+    return run_tasks(
+        manifest, tasks, create_variable, force=force, year=year, **create_kwargs
+    )
+
+
+def _create_stage(
+    create_kwargs: dict,
+    workers: int,
+    max_memory: str | None,
+    job_memory: str | None,
+    manifest_path: Path | None = None,
+    variables: list[str] = (),
+    force: bool = False,
+    stage_dir: Path | None = None,
+) -> Stage:
+    return Stage(
+        "create",
+        partial(
+            _create_year,
+            manifest_path,
+            list(variables),
+            force,
+            dict(create_kwargs, stage_dir=stage_dir),
+        ),
+        slots=memory_slots(workers, parse_memory(max_memory), parse_memory(job_memory)),
+        in_process=True,
+    )
+
+
+def _unfinished_years(
+    manifest: RunManifest | None, years: list[int], final_tasks, force: bool = False
+) -> list[int]:
+    """
+    Years whose final tasks the manifest does not show as done.
+    """
+    if manifest is None or force:
+        return years
+    unfinished = [
+        year
+        for year in years
+        if not all(manifest.is_done(task) for task in final_tasks(year))
+    ]
+    if len(unfinished) < len(years):
+        logger.info(
+            f"Skipping {sorted(set(years) - set(unfinished))}: already done according to {manifest.path}"
+        )
+    return unfinished
+
+
+def _run_staged(
+    years: list[int],
+    src_configs,
+    ensemble_member: str,
+    scenario: str,
+    stage: bool,
+    stage_budget: str | None,
+    create_stage,
+) -> None:
+    """
+    Create the variables for each year, first copying the year's source files to local scratch if stage is set.
+
+    create_stage makes the create stage given the directory the source files are staged in.
+    Staging the next year's files overlaps with creating the current one(s).
+    """
+    if not stage:
+        YearScheduler([create_stage(stage_dir=None)]).run(years)
+        return
+
+    with SourceStager(budget=parse_memory(stage_budget)) as stager:
+
+        def _stage(year):
+            stager.prefetch(
+                str(year),
+                source_filepaths(src_configs, year, ensemble_member, scenario=scenario),
+            )
+            stager.wait(str(year))
+
+        def _release(year):
+            stager.release(str(year))
+
+        YearScheduler(
+            [
+                Stage("stage", _stage),
+                create_stage(stage_dir=stager.stage_dir),
+                Stage("release", _release),
+            ]
+        ).run(years)
+
+
 # The plain moose command is the older moose pipeline which involved extracting the data from moose
 # Newer pipeline uses a seperate process to already extract the data from moose
 @app.command()
@@ -36,6 +170,14 @@ def moose(
     target_resolution: str = None,
     force: bool = False,
     cleanup: bool = True,
+    scratch_budget: str = typer.Option(
+        None,
+        help="Keep moose extracts in a managed scratch area of this size (e.g. 2T) rather than removing them straight after use",
+    ),
+    workers: int = WORKERS_OPTION,
+    max_memory: str = MAX_MEMORY_OPTION,
+    job_memory: str = JOB_MEMORY_OPTION,
+    manifest: Path = MANIFEST_OPTION,
 ):
 
     configs = [
@@ -62,56 +204,170 @@ def moose(
         src_type == "moose"
     ), "Only moose source variables supported for moose command"
 
-    for year in years:
+    def _nc_filepath(src_config, year):
+        return VariableMetadata(
+            base_dir=RAW_MOOSE_VARIABLES_PATH,
+            variable=src_config.variable,
+            frequency=src_config.frequency,
+            domain=src_config.domain,
+            resolution=src_config.resolution,
+            ensemble_member=ensemble_member,
+            scenario=scenario,
+            collection=src_config.collection,
+        ).filepath(year)
+
+    def _pp_dirpath(src_config, year):
+        return MoosePPVariableMetadata(
+            base_dir=RAW_MOOSE_VARIABLES_PATH / "pp",
+            variable=src_config.variable,
+            frequency=src_config.frequency,
+            domain=src_config.domain,
+            resolution=src_config.resolution,
+            ensemble_member=ensemble_member,
+            scenario=scenario,
+            collection=src_config.collection,
+        ).ppdata_dirpath(year)
+
+    def _clean_tasks(year):
+        return [
+            Task("clean", src_config.variable, ensemble_member, year)
+            for src_config in src_configs
+        ]
+
+    run_manifest = None if manifest is None else RunManifest(manifest)
+    variables = [config["variable"] for config in configs]
+    # a year is finished once its extracts have been cleaned up after creating the variables
+    years = _unfinished_years(run_manifest, years, _clean_tasks, force=force)
+    if run_manifest is not None:
+        run_manifest.plan(
+            [
+                Task(stage, variable, ensemble_member, year)
+                for year in years
+                for stage, stage_variables in [
+                    ("extract", [src_config.variable for src_config in src_configs]),
+                    ("create", variables),
+                    ("clean", [src_config.variable for src_config in src_configs]),
+                ]
+                for variable in stage_variables
+            ]
+        )
+
+    scratch = None
+    if scratch_budget is not None:
+        scratch = ScratchSpace(
+            RAW_MOOSE_VARIABLES_PATH, budget=parse_memory(scratch_budget)
+        )
+        scratch_job = f"etl-moose-{socket.gethostname()}-{os.getpid()}"
+        # keep extracts this run will need from being evicted by other jobs
+        scratch.reserve(
+            [
+                path_fn(src_config, year)
+                for path_fn in [_pp_dirpath, _nc_filepath]
+                for src_config in src_configs
+                for year in years
+            ],
+            scratch_job,
+        )
+
+    def _extract_source(src_config, year):
+        source_nc_filepath = _nc_filepath(src_config, year)
+        # skip extract if file already exists and not forcing an extraction
+        if os.path.exists(source_nc_filepath) and not force:
+            logger.info(f"{source_nc_filepath} already exists, skipping extraction")
+            if scratch is not None:
+                scratch.register(source_nc_filepath, kind="nc", needed_by=[scratch_job])
+            return [source_nc_filepath]
+
+        pp_dirpath = _pp_dirpath(src_config, year)
+        # reuse an extract still held in scratch from an earlier job
+        if scratch is not None and scratch.contains(pp_dirpath) and not force:
+            logger.info(f"{pp_dirpath} already in scratch, skipping extraction")
+            scratch.touch(pp_dirpath)
+            return [pp_dirpath]
+
+        extract(
+            variable=src_config.variable,
+            year=year,
+            frequency=src_config.frequency,
+            collection=CollectionOption(src_config.collection),
+            ensemble_member=ensemble_member,
+            scenario=scenario,
+            retries=0,
+            progress_interval=30.0,
+            stall_timeout=None,
+            recall_timeout=None,
+        )
+        if scratch is not None:
+            scratch.register(pp_dirpath, kind="pp", needed_by=[scratch_job])
+        return [pp_dirpath]
+
+    def _extract(year):
         # only moose sources need to extract data first (for others assumed on accessible filesystem)
         for src_config in src_configs:
-            source_nc_filepath = VariableMetadata(
-                base_dir=RAW_MOOSE_VARIABLES_PATH,
-                variable=src_config.variable,
-                frequency=src_config.frequency,
-                domain=src_config.domain,
-                resolution=src_config.resolution,
-                ensemble_member=ensemble_member,
-                scenario=scenario,
-                collection=src_config.collection,
-            ).filepath(year)
-            # skip extract if file already exists and not forcing an extraction
-            if os.path.exists(source_nc_filepath) and not force:
-                logger.info(f"{source_nc_filepath} already exists, skipping extraction")
-                continue
-
-            extract(
-                variable=src_config.variable,
+            run_tasks(
+                run_manifest,
+                [Task("extract", src_config.variable, ensemble_member, year)],
+                _extract_source,
+                force=force,
+                src_config=src_config,
                 year=year,
-                frequency=src_config.frequency,
+            )
+
+    def _clean_year(year):
+        # run clean up for moose extracts
+        if not cleanup:
+            return
+        if scratch is not None:
+            # leave the extracts in scratch for reuse but let them be evicted if space is needed
+            scratch.release(
+                scratch_job,
+                [
+                    path_fn(src_config, year)
+                    for path_fn in [_pp_dirpath, _nc_filepath]
+                    for src_config in src_configs
+                ],
+            )
+            scratch.evict()
+            return
+        for src_config in src_configs:
+            clean(
                 collection=CollectionOption(src_config.collection),
-                ensemble_member=ensemble_member,
                 scenario=scenario,
+                ensemble_member=ensemble_member,
+                variable=src_config.variable,
+                frequency=src_config.frequency,
+                year=year,
             )
 
-        # run create variable
-        create_variable(
+    def _clean(year):
+        run_tasks(run_manifest, _clean_tasks(year), _clean_year, force=force, year=year)
+
+    create_stage = _create_stage(
+        dict(
             config_paths=variable_configs,
-            year=year,
             domain=domain,
             scale_factor=scale_factor,
             ensemble_member=ensemble_member,
             scenario=scenario,
             thetas=thetas,
             target_resolution=target_resolution,
-        )
+            trusted_archive=False,
+            yearly_extracts=False,
+        ),
+        workers,
+        max_memory,
+        job_memory,
+        manifest_path=manifest,
+        variables=variables,
+        force=force,
+    )
+    # the extract for the next year overlaps with creating this one and cleaning up after the last
+    YearScheduler(
+        [Stage("extract", _extract), create_stage, Stage("clean", _clean)]
+    ).run(years)
 
-        # run clean up for moose extracts
-        if cleanup:
-            for src_config in src_configs:
-                clean(
-                    collection=CollectionOption(src_config.collection),
-                    scenario=scenario,
-                    ensemble_member=ensemble_member,
-                    variable=src_config.variable,
-                    frequency=src_config.frequency,
-                    year=year,
-                )
+    if scratch is not None:
+        scratch.release(scratch_job)
 
 
 @app.command()
@@ -126,6 +382,12 @@ def moose_extract(
     target_resolution: str = None,
     force: bool = False,
     cleanup: bool = True,
+    stage: bool = STAGE_OPTION,
+    stage_budget: str = STAGE_BUDGET_OPTION,
+    workers: int = WORKERS_OPTION,
+    max_memory: str = MAX_MEMORY_OPTION,
+    job_memory: str = JOB_MEMORY_OPTION,
+    manifest: Path = MANIFEST_OPTION,
 ):
 
     configs = [
@@ -152,20 +414,54 @@ def moose_extract(
         src_type == "moose"
     ), "Only moose source variables supported for moose-extract command"
 
-    for year in years:
-
-        # run create variable
-        create_variable(
-            config_paths=variable_configs,
-            year=year,
-            domain=domain,
-            scale_factor=scale_factor,
-            ensemble_member=ensemble_member,
-            scenario=scenario,
-            thetas=thetas,
-            target_resolution=target_resolution,
+    variables = [config["variable"] for config in configs]
+    run_manifest = None if manifest is None else RunManifest(manifest)
+    years = _unfinished_years(
+        run_manifest,
+        years,
+        lambda year: [
+            Task("create", variable, ensemble_member, year) for variable in variables
+        ],
+        force=force,
+    )
+    if run_manifest is not None:
+        run_manifest.plan(
+            [
+                Task("create", variable, ensemble_member, year)
+                for year in years
+                for variable in variables
+            ]
         )
 
+    _run_staged(
+        years,
+        src_configs,
+        ensemble_member,
+        scenario,
+        stage,
+        stage_budget,
+        partial(
+            _create_stage,
+            dict(
+                config_paths=variable_configs,
+                domain=domain,
+                scale_factor=scale_factor,
+                ensemble_member=ensemble_member,
+                scenario=scenario,
+                thetas=thetas,
+                target_resolution=target_resolution,
+                trusted_archive=False,
+                yearly_extracts=False,
+            ),
+            workers,
+            max_memory,
+            job_memory,
+            manifest_path=manifest,
+            variables=variables,
+            force=force,
+        ),
+    )
+
 
 @app.command()
 def ceda(
@@ -179,6 +475,12 @@ def ceda(
     target_resolution: str = None,
     force: bool = False,
     cleanup: bool = True,
+    stage: bool = STAGE_OPTION,
+    stage_budget: str = STAGE_BUDGET_OPTION,
+    workers: int = WORKERS_OPTION,
+    max_memory: str = MAX_MEMORY_OPTION,
+    job_memory: str = JOB_MEMORY_OPTION,
+    manifest: Path = MANIFEST_OPTION,
 ):
 
     configs = [
@@ -203,20 +505,80 @@ def ceda(
     src_type = src_type.pop()
     assert src_type == "ceda", "Only ceda source variables supported for ceda command"
 
-    for year in years:
+    variables = [config["variable"] for config in configs]
+    run_manifest = None if manifest is None else RunManifest(manifest)
+    years = _unfinished_years(
+        run_manifest,
+        years,
+        lambda year: [
+            Task("create", variable, ensemble_member, year) for variable in variables
+        ],
+        force=force,
+    )
+    if run_manifest is not None:
+        run_manifest.plan(
+            [
+                Task("create", variable, ensemble_member, year)
+                for year in years
+                for variable in variables
+            ]
+        )
 
-        # run create variable
-        create_variable(
-            config_paths=variable_configs,
-            year=year,
-            domain=domain,
-            scale_factor=scale_factor,
-            ensemble_member=ensemble_member,
-            scenario=scenario,
-            thetas=thetas,
-            target_resolution=target_resolution,
+    _run_staged(
+        years,
+        src_configs,
+        ensemble_member,
+        scenario,
+        stage,
+        stage_budget,
+        partial(
+            _create_stage,
+            dict(
+                config_paths=variable_configs,
+                domain=domain,
+                scale_factor=scale_factor,
+                ensemble_member=ensemble_member,
+                scenario=scenario,
+                thetas=thetas,
+                target_resolution=target_resolution,
+                trusted_archive=False,
+                yearly_extracts=False,
+            ),
+            workers,
+            max_memory,
+            job_memory,
+            manifest_path=manifest,
+            variables=variables,
+            force=force,
+        ),
+    )
+
+
+@app.command()
+def status(manifest: Path):
+    """
+    Show the progress of an etl run from its manifest
+    """
+    if not manifest.exists():
+        typer.echo(f"No run manifest at {manifest}", err=True)
+        raise typer.Exit(code=1)
+
+    run_manifest = RunManifest(manifest)
+    for stage, counts in run_manifest.summary().items():
+        typer.echo(
+            f"{stage}: " + ", ".join(f"{counts[state]} {state}" for state in STATES)
         )
 
+    for entry in sorted(
+        run_manifest.entries(),
+        key=lambda entry: (entry["year"], entry["stage"], entry["variable"]),
+    ):
+        task = f"{entry['stage']} {entry['variable']} {entry['ensemble_member']} {entry['year']}"
+        if entry["state"] == "failed":
+            typer.echo(f"failed: {task}: {entry['error']}")
+        elif entry["state"] == "running":
+            typer.echo(f"running: {task} on {entry['host']} (pid {entry['pid']})")
+
 
 if __name__ == "__main__":
     app()
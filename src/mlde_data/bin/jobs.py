@@ -0,0 +1,71 @@
+import logging
+from pathlib import Path
+import typer
+from typing import List
+
+from ..jobqueue import HEARTBEAT_TIMEOUT, JobQueue, serve as serve_queue
+from .dag import run_command
+
+logger = logging.getLogger(__name__)
+
+
+def serve(
+    queue_path: Path,
+    workers: int = typer.Option(1, help="Number of worker processes"),
+    poll_interval: float = typer.Option(
+        1.0, help="Seconds between checks for new jobs"
+    ),
+    idle_timeout: float = typer.Option(
+        None, help="Stop after this many seconds without a job (default: never)"
+    ),
+):
+    """
+    Run jobs submitted to a queue in long-lived worker processes
+    """
+    serve_queue(
+        queue_path,
+        run_command,
+        workers=workers,
+        poll_interval=poll_interval,
+        idle_timeout=idle_timeout,
+    )
+
+
+def requeue(
+    queue_path: Path,
+    heartbeat_timeout: float = typer.Option(
+        HEARTBEAT_TIMEOUT,
+        help="Seconds without a heartbeat after which a running job's worker is taken to be dead",
+    ),
+):
+    """
+    Put jobs left running by workers that have died back in the queue
+    """
+    for job in JobQueue(queue_path).requeue_dead(heartbeat_timeout):
+        typer.echo(f"Requeued job {job.id}: {' '.join(job.command)}")
+
+
+def submit(
+    queue_path: Path,
+    command: List[str],
+    wait: bool = typer.Option(True, help="Stream the job's log until it finishes"),
+    poll_interval: float = typer.Option(
+        0.5, help="Seconds between checks for more log output"
+    ),
+):
+    """
+    Submit an mlde-data command to a queue served by mlde-data serve
+    """
+    queue = JobQueue(queue_path)
+    job = queue.submit(command)
+    typer.echo(f"Submitted job {job.id}", err=True)
+    if not wait:
+        typer.echo(job.id)
+        return
+
+    job = queue.follow(
+        job.id, lambda output: typer.echo(output, nl=False), poll_interval
+    )
+    if job.state == "failed":
+        typer.echo(f"Job {job.id} failed: {job.error}", err=True)
+        raise typer.Exit(code=1)
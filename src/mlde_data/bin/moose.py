@@ -1,19 +1,27 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import logging
+import multiprocessing
 import os
 from pathlib import Path
+import shlex
 import shutil
 import subprocess
 
 from codetiming import Timer
 import iris
-import tempfile
 import typer
+from typing import List
 import xarray as xr
 
 from mlde_utils import VariableMetadata, RAW_MOOSE_VARIABLES_PATH
 
+from ..extract_progress import run_monitored, write_metrics
 from ..options import CollectionOption
+from ..resources import limit_memory, parse_memory
+from ..staging import OutputStager
 from ..moose import (
+    FREQ2TIMELEN,
+    expected_field_count,
     open_pp_data,
     select_query,
     moose_path,
@@ -35,12 +43,6 @@ def callback():
     pass
 
 
-FREQ2TIMELEN = {
-    "day": 360,
-    "1hr": 360 * 24,
-}
-
-
 def _domain_and_resolution_from_collection(collection: CollectionOption):
     if collection == CollectionOption.cpm:
         resolution = "2.2km"
@@ -62,9 +64,10 @@ def _clean_pp_data(
     scenario: str,
     domain: str,
     resolution: str,
+    base_dir: Path = RAW_MOOSE_VARIABLES_PATH / "pp",
 ):
     pp_path = MoosePPVariableMetadata(
-        base_dir=RAW_MOOSE_VARIABLES_PATH / "pp",
+        base_dir=base_dir,
         collection=collection,
         scenario=scenario,
         ensemble_member=ensemble_member,
@@ -102,6 +105,13 @@ def _clean_nc_data(
         os.remove(nc_path)
 
 
+def moo_command() -> list[str]:
+    """
+    Command used to run moo. Set MOO_COMMAND to use something other than the moo on the PATH (e.g. the moose simulator).
+    """
+    return shlex.split(os.getenv("MOO_COMMAND", "moo"))
+
+
 @app.command()
 @Timer(name="extract", text="{name}: {minutes:.1f} minutes", logger=logger.info)
 def extract(
@@ -112,6 +122,18 @@ def extract(
     variable: str = typer.Option(...),
     frequency: str = "day",
     base_dir: Path = None,
+    retries: int = typer.Option(0, help="Times to retry a failed or stalled select"),
+    progress_interval: float = typer.Option(
+        30.0, help="Seconds between progress reports"
+    ),
+    stall_timeout: float = typer.Option(
+        None,
+        help="Give up on a select after this many seconds without new data once data has started arriving",
+    ),
+    recall_timeout: float = typer.Option(
+        None,
+        help="Give up on a select after this many seconds without any data arriving (recalls from tape can take hours)",
+    ),
 ):
     """
     Extract data from moose
@@ -150,9 +172,6 @@ def extract(
     pp_dirpath = moose_pp_varmeta.ppdata_dirpath(year)
 
     os.makedirs(output_dirpath, exist_ok=True)
-    # remove any previous attempt at extracting the data (or else moo select will complain)
-    shutil.rmtree(pp_dirpath, ignore_errors=True)
-    os.makedirs(pp_dirpath, exist_ok=True)
 
     logger.debug(query)
     query_filepath.write_text(query)
@@ -166,21 +185,49 @@ def extract(
     )
 
     query_cmd = [
-        "moo",
+        *moo_command(),
         "select",
         query_filepath,
         moose_uri,
         os.path.join(pp_dirpath, ""),
     ]
 
-    logger.debug(f"Running {query_cmd}")
-    logger.info(f"Extracting {variable} for {year}...")
-
-    output = subprocess.run(query_cmd, capture_output=True, check=False)
-    stdout = output.stdout.decode("utf8")
-    print(stdout)
-    print(output.stderr.decode("utf8"))
-    output.check_returncode()
+    expected_fields = expected_field_count(src_config.variable, src_config.frequency)
+
+    attempts = []
+    for attempt in range(retries + 1):
+        # remove any previous attempt at extracting the data (or else moo select will complain)
+        shutil.rmtree(pp_dirpath, ignore_errors=True)
+        os.makedirs(pp_dirpath, exist_ok=True)
+
+        logger.debug(f"Running {query_cmd}")
+        logger.info(f"Extracting {variable} for {year} (attempt {attempt + 1})...")
+
+        result = run_monitored(
+            query_cmd,
+            pp_dirpath,
+            expected_fields=expected_fields,
+            interval=progress_interval,
+            stall_timeout=stall_timeout,
+            label=f"{variable} {year}",
+            recall_timeout=recall_timeout,
+        )
+        attempts.append(result)
+        print(result.stdout)
+        print(result.stderr)
+        if result.returncode == 0:
+            break
+
+    write_metrics(
+        Path(output_dirpath) / "metrics.json",
+        attempts,
+        expected_fields=expected_fields,
+        variable=variable,
+        year=year,
+        moose_uri=moose_uri,
+    )
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, query_cmd)
 
     # make sure have the correct amount of data from moose
     cubes = load_cubes(
@@ -245,35 +292,130 @@ def convert(
     output_filepath = output_var_meta.filepath(year)
 
     typer.echo(f"Saving to {output_filepath}...")
-    # ensure target directory exists
-    os.makedirs(os.path.dirname(output_filepath), exist_ok=True)
-
-    # Write to a local temporary file first, then move into place. This
-    # avoids HDF5/netCDF file-locking issues on NFS mounts where locks
-    # are unreliable. We use a system temp dir and shutil.move so the
-    # move works across filesystems.
-    tmp_path = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".nc") as tmpf:
-            tmp_path = tmpf.name
-
-        # Save to the temporary file
-        ds.to_netcdf(tmp_path)
-
-        # Move the completed file into the final location. Use shutil.move
-        # to handle cross-filesystem renames (e.g., local /tmp -> NFS).
-        shutil.move(tmp_path, output_filepath)
-        tmp_path = None
-    finally:
-        # Cleanup any leftover temp file on error
-        if tmp_path is not None and os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    _save_netcdf(ds, output_filepath)
 
     if validate:
-        assert (
-            len(xr.open_dataset(output_filepath).time)
-            == FREQ2TIMELEN[src_config.frequency]
-        )
+        _validate_converted(output_filepath, src_config.frequency)
+
+
+def _save_netcdf(ds: xr.Dataset, output_filepath: str) -> None:
+    # Write to local scratch first, then move into place. This avoids
+    # HDF5/netCDF file-locking issues on NFS mounts where locks are unreliable.
+    with OutputStager() as stager:
+        stager.write(ds.to_netcdf, output_filepath, if_exists="replace")
+
+
+def _validate_converted(output_filepath: str, frequency: str) -> None:
+    with xr.open_dataset(output_filepath) as ds:
+        assert len(ds.time) == FREQ2TIMELEN[frequency]
+
+
+def _save_converted(
+    ds: xr.Dataset, output_filepath: str, frequency: str, validate: bool
+) -> str:
+    """
+    Save (and optionally validate) a converted variable-year. Run in a worker process by convert-many.
+    """
+    _save_netcdf(ds, output_filepath)
+    if validate:
+        _validate_converted(output_filepath, frequency)
+    return output_filepath
+
+
+@app.command()
+@Timer(name="convert-many", text="{name}: {minutes:.1f} minutes", logger=logger.info)
+def convert_many(
+    collection: CollectionOption = typer.Option(...),
+    scenario: str = "rcp85",
+    ensemble_member: str = typer.Option(...),
+    years: List[int] = typer.Option(...),
+    variables: List[str] = typer.Option(...),
+    frequency: str = "day",
+    input_base_dir: Path = None,
+    output_base_dir: Path = None,
+    validate: bool = True,
+    workers: int = typer.Option(
+        os.cpu_count(), help="Number of worker processes for decoding and writing"
+    ),
+    max_memory: str = typer.Option(
+        None, help="Data memory cap per worker process, e.g. 4G (default: no cap)"
+    ),
+):
+    """
+    Convert pp data to netCDF files for several variables and years at once
+
+    PP files are decoded on a pool of worker processes and each variable-year is written
+    by a worker while the next one is being decoded. A decoded variable-year is held in memory
+    until its save has finished so at most one per worker is waiting to be saved at once.
+    """
+    if input_base_dir is None:
+        input_base_dir = RAW_MOOSE_VARIABLES_PATH / "pp"
+    if output_base_dir is None:
+        output_base_dir = RAW_MOOSE_VARIABLES_PATH
+
+    # forking a process that already has threads (e.g. from dask or netCDF) can deadlock the workers
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=limit_memory,
+        initargs=(parse_memory(max_memory),),
+    ) as executor:
+        pending_saves = {}
+
+        def _finish(futures):
+            for future in futures:
+                variable, year = pending_saves.pop(future)
+                future.result()
+                logger.info(f"Converted {variable} for {year}")
+
+        for variable in variables:
+            src_config = SourceVariableConfig(
+                src_type="moose",
+                collection=collection.value,
+                frequency=frequency,
+                variable=variable,
+            )
+            output_var_meta = VariableMetadata(
+                base_dir=output_base_dir,
+                collection=src_config.collection,
+                scenario=scenario,
+                ensemble_member=ensemble_member,
+                variable=src_config.variable,
+                frequency=src_config.frequency,
+                resolution=src_config.resolution,
+                domain=src_config.domain,
+            )
+            for year in years:
+                # a pending save's arguments (the decoded data) are kept until it finishes
+                while len(pending_saves) >= workers:
+                    finished, _ = wait(pending_saves, return_when=FIRST_COMPLETED)
+                    _finish(finished)
+                logger.info(f"Decoding {variable} for {year}...")
+                ds = open_pp_data(
+                    base_dir=input_base_dir,
+                    collection=src_config.collection,
+                    scenario=scenario,
+                    ensemble_member=ensemble_member,
+                    variable=src_config.variable,
+                    frequency=src_config.frequency,
+                    resolution=src_config.resolution,
+                    domain=src_config.domain,
+                    year=year,
+                    executor=executor,
+                )
+                output_filepath = output_var_meta.filepath(year)
+                typer.echo(f"Saving to {output_filepath}...")
+                future = executor.submit(
+                    _save_converted,
+                    ds,
+                    output_filepath,
+                    src_config.frequency,
+                    validate,
+                )
+                pending_saves[future] = (variable, year)
+                del ds
+
+        _finish(list(pending_saves))
 
 
 @app.command()
@@ -284,10 +426,14 @@ def clean(
     collection: CollectionOption = typer.Option(...),
     ensemble_member: str = typer.Option(...),
     scenario: str = "rcp85",
+    base_dir: Path = None,
 ):
     """
     Remove any unneccessary files once processing is done
     """
+    if base_dir is None:
+        base_dir = RAW_MOOSE_VARIABLES_PATH / "pp"
+
     src_config = SourceVariableConfig(
         src_type="moose",
         collection=collection.value,
@@ -303,6 +449,7 @@ def clean(
         year=year,
         domain=src_config.domain,
         resolution=src_config.resolution,
+        base_dir=base_dir,
     )
     _clean_nc_data(
         collection=src_config.collection,
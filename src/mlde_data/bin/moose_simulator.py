@@ -0,0 +1,75 @@
+import logging
+from pathlib import Path
+import typer
+from typing import List
+
+from ..moose_simulator import MooseArchiveSimulator
+from ..options import CollectionOption
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer()
+
+ARCHIVE_OPTION = typer.Option(..., envvar="MOO_SIMULATOR_ARCHIVE")
+
+
+@app.callback()
+def callback():
+    pass
+
+
+@app.command()
+def select(
+    query_filepath: Path,
+    moose_uri: str,
+    dest_dir: Path,
+    archive_dir: Path = ARCHIVE_OPTION,
+    latency: float = typer.Option(
+        0.0, envvar="MOO_SIMULATOR_LATENCY", help="Seconds per request"
+    ),
+    bandwidth: float = typer.Option(
+        None, envvar="MOO_SIMULATOR_BANDWIDTH", help="Bytes per second"
+    ),
+):
+    """
+    Stand-in for moo select that reads from a local simulated archive
+
+    Use it in place of moo by setting MOO_COMMAND="python -m mlde_data.bin.moose_simulator"
+    """
+    MooseArchiveSimulator(archive_dir, latency=latency, bandwidth=bandwidth).select(
+        query_filepath.read_text(), moose_uri, dest_dir
+    )
+
+
+@app.command()
+def populate(
+    variables: List[str] = typer.Option(...),
+    years: List[int] = typer.Option(...),
+    ensemble_members: List[str] = typer.Option(...),
+    collection: CollectionOption = CollectionOption.cpm,
+    frequency: str = "day",
+    grid_size: int = 8,
+    archive_dir: Path = ARCHIVE_OPTION,
+):
+    """
+    Fill a simulated archive with synthetic pp data
+    """
+    simulator = MooseArchiveSimulator(archive_dir)
+    for variable in variables:
+        for ensemble_member in ensemble_members:
+            for year in years:
+                stream_dirpath = simulator.populate(
+                    variable,
+                    year,
+                    ensemble_member,
+                    frequency=frequency,
+                    collection=collection.value,
+                    grid_size=grid_size,
+                )
+                typer.echo(
+                    f"Populated {variable} {ensemble_member} {year} in {stream_dirpath}"
+                )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,81 @@
+import logging
+from pathlib import Path
+import typer
+
+from mlde_utils import RAW_MOOSE_VARIABLES_PATH
+
+from ..resources import parse_memory
+from ..scratch import ScratchSpace
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer()
+
+
+@app.callback()
+def callback():
+    pass
+
+
+def _format_bytes(n: int) -> str:
+    for unit in ["B", "K", "M", "G", "T"]:
+        if abs(n) < 1024 or unit == "T":
+            return f"{n:.1f}{unit}"
+        n /= 1024
+
+
+@app.command()
+def status(base_dir: Path = RAW_MOOSE_VARIABLES_PATH, budget: str = None):
+    """
+    Report usage of the scratch area
+    """
+    usage = ScratchSpace(base_dir, budget=parse_memory(budget)).usage()
+
+    typer.echo(f"Scratch area {base_dir}")
+    for kind, kind_usage in sorted(usage["kinds"].items()):
+        typer.echo(
+            f"  {kind}: {_format_bytes(kind_usage['bytes'])} in {kind_usage['entries']} entries"
+        )
+    typer.echo(f"Total: {_format_bytes(usage['bytes'])}")
+    typer.echo(f"Needed by pending jobs: {_format_bytes(usage['pinned_bytes'])}")
+    if usage["budget"] is not None:
+        typer.echo(f"Budget: {_format_bytes(usage['budget'])}")
+
+
+@app.command()
+def evict(
+    budget: str = typer.Option(...),
+    base_dir: Path = RAW_MOOSE_VARIABLES_PATH,
+    required: str = "0",
+):
+    """
+    Remove least recently used entries that are not needed until the scratch area fits the budget
+    """
+    evicted = ScratchSpace(base_dir, budget=parse_memory(budget)).evict(
+        required_bytes=parse_memory(required)
+    )
+    for path in evicted:
+        typer.echo(f"Removed {path}")
+
+
+@app.command()
+def release(
+    job: str = typer.Argument(None),
+    stale: bool = typer.Option(
+        False,
+        help="Release the reservations of all jobs that have died or not been heard from for too long",
+    ),
+    base_dir: Path = RAW_MOOSE_VARIABLES_PATH,
+):
+    """
+    Release the entries reserved by a job (e.g. one that was killed) so they can be evicted
+    """
+    if (job is None) == (not stale):
+        raise typer.BadParameter("Give either a job or --stale")
+    scratch = ScratchSpace(base_dir)
+    if stale:
+        for released_job in scratch.release_stale():
+            typer.echo(f"Released {released_job}")
+    else:
+        scratch.release(job)
+        typer.echo(f"Released {job}")
@@ -1,10 +1,11 @@
 from codetiming import Timer
 from collections import defaultdict
 import logging
-from mlde_utils import DERIVED_VARIABLES_PATH
+from mlde_utils import DERIVED_VARIABLES_PATH, RAW_MOOSE_VARIABLES_PATH
 from mlde_data.canari_le_sprint_variable_adapter import CanariLESprintVariableAdapter
 from mlde_data.ceda_variable_adapter import CedaVariableAdapter
 from mlde_data.moose_extract_variable_adapter import MooseExtractVariableAdapter
+from mlde_data import fingerprint, variable_index
 from mlde_data.variable import validation, load_config
 from mlde_utils import VariableMetadata
 import os
@@ -16,12 +17,19 @@ import xarray as xr
 import yaml
 
 from mlde_data.actions import get_action
+from mlde_data.actions.select_domain import extent_indexers
 from mlde_data.moose import (
     remove_forecast,
     remove_pressure,
 )
 from mlde_data.options import DomainOption
-from mlde_data.variable import SourceVariableConfig
+from mlde_data.staging import OutputStager, localize
+from mlde_data.variable import (
+    SourceSelection,
+    SourceVariableConfig,
+    SpatialExtent,
+    source_selection,
+)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s %(asctime)s: %(message)s")
@@ -44,6 +52,8 @@ def open_local_source_variable(
     domain: str,
     collection: str,
     base_dir: Path,
+    extent: SpatialExtent | None = None,
+    stage_dir: Path | None = None,
 ) -> xr.Dataset:
     source_metadata = VariableMetadata(
         base_dir=base_dir,
@@ -55,9 +65,11 @@ def open_local_source_variable(
         variable=src_variable,
         collection=collection,
     )
-    source_nc_filepath = source_metadata.filepath(year)
+    [source_nc_filepath] = localize([source_metadata.filepath(year)], stage_dir)
     logger.info(f"Opening {source_nc_filepath}")
     ds = xr.open_dataset(source_nc_filepath)
+    if extent is not None:
+        ds = ds.isel(extent_indexers(ds, extent))
 
     ds = remove_pressure(ds)
 
@@ -74,6 +86,9 @@ def open_moose_extract_source_variable(
     domain: str,
     collection: str,
     base_dir: Path,
+    selection: SourceSelection | None = None,
+    stage_dir: Path | None = None,
+    yearly_extracts: bool = False,
 ) -> xr.Dataset:
     logger.info(f"Opening {src_variable} moose extract...")
     source_metadata = MooseExtractVariableAdapter(
@@ -86,6 +101,9 @@ def open_moose_extract_source_variable(
         domain=domain,
         collection=collection,
         base_dir=base_dir,
+        selection=selection,
+        stage_dir=stage_dir,
+        yearly_extracts=yearly_extracts,
     )
 
     ds = source_metadata.open()
@@ -106,15 +124,20 @@ def open_canari_le_sprint_source_variable(
     domain: str,
     collection: str,
     base_dir: Path,
+    extent: SpatialExtent | None = None,
+    stage_dir: Path | None = None,
 ) -> xr.Dataset:
     source_metadata = CanariLESprintVariableAdapter(
         frequency=frequency,
         ensemble_member=ensemble_member,
         variable=src_variable,
         year=year,
+        extent=extent,
+        stage_dir=stage_dir,
     )
 
-    ds = source_metadata.open().load()
+    # left lazy so only the chunks of the selected times and region are ever read
+    ds = source_metadata.open()
 
     return ds
 
@@ -129,6 +152,9 @@ def open_ceda_source_variable(
     domain: str,
     collection: str,
     base_dir: Path,
+    trusted: bool = False,
+    extent: SpatialExtent | None = None,
+    stage_dir: Path | None = None,
 ) -> xr.Dataset:
     logger.info(f"Opening {src_variable} from CEDA...")
     source_metadata = CedaVariableAdapter(
@@ -141,6 +167,9 @@ def open_ceda_source_variable(
         domain=domain,
         collection=collection,
         base_dir=base_dir,
+        trusted=trusted,
+        extent=extent,
+        stage_dir=stage_dir,
     )
 
     ds = source_metadata.open()
@@ -151,7 +180,7 @@ def open_ceda_source_variable(
 def combine_source_variables(sources: dict[str, xr.Dataset]) -> xr.Dataset:
     logger.info(f"Combining source variables...")
 
-    return xr.combine_by_coords(
+    return fingerprint.combine_by_coords(
         sources.values(),
         compat="no_conflicts",
         combine_attrs="drop_conflicts",
@@ -166,20 +195,37 @@ def open_source_variables(
     year: int,
     ensemble_member: str,
     base_dir: Path,
+    configs: list[dict] | None = None,
+    trusted_archive: bool = False,
+    stage_dir: Path | None = None,
+    yearly_extracts: bool = False,
 ) -> xr.Dataset:
+    # work out which fields and levels the configs' leading selection actions will keep
+    # and which subdomain they end up selecting so they can be pushed down into loading the source data
+    selection = source_selection(configs or [])
+    if selection:
+        logger.info(f"Only loading source data needed for {selection}")
+
     sources = {}
     for src_config in src_configs:
 
         src_type = src_config.src_type
 
+        strategy_kwargs = {"stage_dir": stage_dir}
         if src_type == "moose":
             source_open_strategy = open_moose_extract_source_variable
+            strategy_kwargs["selection"] = selection
+            strategy_kwargs["yearly_extracts"] = yearly_extracts
         elif src_type == "ceda":
             source_open_strategy = open_ceda_source_variable
+            strategy_kwargs["trusted"] = trusted_archive
+            strategy_kwargs["extent"] = selection.extent
         elif src_type == "local":
             source_open_strategy = open_local_source_variable
+            strategy_kwargs["extent"] = selection.extent
         elif src_type == "canari-le-sprint":
             source_open_strategy = open_canari_le_sprint_source_variable
+            strategy_kwargs["extent"] = selection.extent
         else:
             raise RuntimeError(f"Unknown source type {src_type}")
 
@@ -199,6 +245,7 @@ def open_source_variables(
             domain,
             collection,
             base_dir,
+            **strategy_kwargs,
         )
 
     logger.info(f"Combining {src_configs}...")
@@ -213,12 +260,127 @@ def open_source_variables(
     return ds
 
 
+def source_filepaths(
+    src_configs: set[SourceVariableConfig],
+    year: int,
+    ensemble_member: str,
+    base_dir: Path | None = None,
+    scenario: str = "rcp85",
+    yearly_extracts: bool = False,
+) -> list[Path]:
+    """
+    The files (or, for moose extracts, glob patterns) that opening the source variables for a year reads.
+    """
+    filepaths = []
+    for src_config in src_configs:
+        src_type = src_config.src_type
+        if src_type == "moose":
+            adapter = MooseExtractVariableAdapter.from_variable_defn(
+                src_config,
+                ensemble_member,
+                scenario,
+                year,
+                base_dir=base_dir,
+                yearly_extracts=yearly_extracts,
+            )
+        elif src_type == "ceda":
+            adapter = CedaVariableAdapter.from_variable_defn(
+                src_config, ensemble_member, scenario, year, base_dir=base_dir
+            )
+        elif src_type == "local":
+            adapter = None
+            filepaths.append(
+                Path(
+                    VariableMetadata(
+                        base_dir=base_dir or DERIVED_VARIABLES_PATH,
+                        frequency=src_config.frequency,
+                        resolution=src_config.resolution,
+                        scenario=scenario,
+                        domain=src_config.domain,
+                        ensemble_member=ensemble_member,
+                        variable=src_config.variable,
+                        collection=src_config.collection,
+                    ).filepath(year)
+                )
+            )
+        elif src_type == "canari-le-sprint":
+            adapter = CanariLESprintVariableAdapter(
+                variable=src_config.variable,
+                ensemble_member=ensemble_member,
+                frequency=src_config.frequency,
+                year=year,
+            )
+        else:
+            raise RuntimeError(f"Unknown source type {src_type}")
+
+        if adapter is not None:
+            filepaths.extend(Path(filepath) for filepath in adapter.filepaths)
+
+    return filepaths
+
+
+def open_ensemble_source_variables(
+    src_configs: set[SourceVariableConfig],
+    year: int,
+    ensemble_members: list[str] | None = None,
+    configs: list[dict] | None = None,
+) -> xr.Dataset:
+    """
+    Open the source variables for several ensemble members at once, along an ensemble_member dimension.
+    """
+    selection = source_selection(configs or [])
+
+    sources = {}
+    for src_config in src_configs:
+        if src_config.src_type != "canari-le-sprint":
+            raise RuntimeError(
+                f"Opening a whole ensemble is not supported for source type {src_config.src_type}"
+            )
+        logger.info(f"Opening {src_config.variable} for the ensemble...")
+        sources[src_config.variable] = CanariLESprintVariableAdapter.open_ensemble(
+            variable=src_config.variable,
+            frequency=src_config.frequency,
+            year=year,
+            ensemble_members=ensemble_members,
+            extent=selection.extent,
+        )
+
+    logger.info(f"Combining {src_configs}...")
+    ds = combine_source_variables(sources).assign_attrs(
+        {
+            "domain": src_config.domain,
+            "resolution": src_config.resolution,
+            "frequency": src_config.frequency,
+        }
+    )
+
+    return ds
+
+
+def source_dropped_variables(
+    src_configs: set[SourceVariableConfig], configs: list[dict] | None = None
+) -> frozenset[str]:
+    """
+    The variables open_source_variables leaves out of the source data (only moose extracts are
+    opened without the fields the configs drop).
+    """
+    if not any(src_config.src_type == "moose" for src_config in src_configs):
+        return frozenset()
+    return source_selection(configs or []).drop_variables
+
+
 def _process(
     ds: xr.Dataset,
     config: dict,
+    dropped_at_source: frozenset[str] = frozenset(),
 ) -> xr.Dataset:
     for job_spec in config["spec"]:
-        if job_spec["action"] in [
+        if job_spec["action"] == "drop-variables":
+            typer.echo(f"Doing {job_spec['action']}...")
+            ds = get_action(job_spec["action"])(
+                already_dropped=dropped_at_source, **job_spec.get("parameters", {})
+            )(ds)
+        elif job_spec["action"] in [
             "sum",
             "diff",
             "query",
@@ -228,7 +390,6 @@ def _process(
             "select-subdomain",
             "resample",
             "rename",
-            "drop-variables",
         ]:
             typer.echo(f"Doing {job_spec['action']}...")
             ds = get_action(job_spec["action"])(**job_spec.get("parameters", {}))(ds)
@@ -255,13 +416,23 @@ def _validate(ds: xr.Dataset, config: dict) -> None:
     assert ds[config["variable"]].isnull().sum().values.item() == 0
 
 
-def _save(ds: xr.Dataset, config: dict, path: str, year: int) -> None:
+def _save(
+    ds: xr.Dataset,
+    config: dict,
+    path: str,
+    year: int,
+    output_stager: OutputStager | None = None,
+) -> None:
     logger.info(f"Saving data to {path}")
     os.makedirs(os.path.dirname(path), exist_ok=True)
     ds[config["variable"]].encoding.update(
         dict(zlib=True, complevel=5, contiguous=False, shuffle=True)
     )
-    ds.to_netcdf(path)
+    if output_stager is None:
+        ds.to_netcdf(path)
+    else:
+        # like to_netcdf, a variable that is created again replaces the old one
+        output_stager.write(ds.to_netcdf, path, if_exists="replace")
     with open(
         os.path.join(os.path.dirname(path), f"{config['variable']}-{year}.yml"), "w"
     ) as f:
@@ -282,9 +453,23 @@ def create(
     input_base_dir: Path = None,
     output_base_dir: Path = None,
     validate: bool = True,
+    trusted_archive: bool = typer.Option(
+        False,
+        help="Skip consistency checks between source files (for versioned archives like CEDA's)",
+    ),
+    stage_dir: Path = typer.Option(
+        None,
+        help="Read any source files that have been staged (e.g. by etl --stage) in this directory from there",
+    ),
+    yearly_extracts: bool = typer.Option(
+        False,
+        help="Read moose sources from the year's extract made by moose extract (under --input-base-dir) rather than the MASS extracts",
+    ),
 ):
     """
     Create a variable file in project form from source data
+
+    Returns the files written for each variable.
     """
 
     configs = [
@@ -315,7 +500,10 @@ def create(
 
     if input_base_dir is None:
         if src_type == "moose":
-            input_base_dir = None
+            # where moose extract puts its extracts by default
+            input_base_dir = (
+                RAW_MOOSE_VARIABLES_PATH / "pp" if yearly_extracts else None
+            )
         elif src_type == "ceda":
             input_base_dir = None
         elif src_type == "local":
@@ -333,31 +521,143 @@ def create(
         year,
         ensemble_member,
         input_base_dir,
+        configs=configs,
+        trusted_archive=trusted_archive,
+        stage_dir=stage_dir,
+        yearly_extracts=yearly_extracts,
     )
-    for config in configs:
-        logger.info(f"Processing {config['variable']}...")
-        ds = _process(
-            src_ds,
-            config,
-        )
-        # # remove pressure related dims and encoding data that we don't need
-        # ds = remove_pressure(ds)
-
-        if validate:
-            _validate(ds, config)
-
-        output_metadata = VariableMetadata(
-            output_base_dir,
-            frequency=ds.attrs["frequency"],
-            domain=ds.attrs["domain"],
-            resolution=ds.attrs["resolution"],
-            scenario=scenario,
-            ensemble_member=ensemble_member,
-            variable=config["variable"],
-            collection=src_collection,
+    dropped_at_source = source_dropped_variables(src_configs, configs)
+    outputs = {}
+    # each file is written locally and moved to the output directory while the next is computed
+    with OutputStager(background=True) as output_stager:
+        for config in configs:
+            logger.info(f"Processing {config['variable']}...")
+            ds = _process(
+                src_ds,
+                config,
+                dropped_at_source=dropped_at_source,
+            )
+            # the source is opened lazily so compute the processed data once here rather than
+            # reading the source files again for each of validating and saving it
+            ds = ds.load()
+            # # remove pressure related dims and encoding data that we don't need
+            # ds = remove_pressure(ds)
+
+            if validate:
+                _validate(ds, config)
+
+            output_metadata = VariableMetadata(
+                output_base_dir,
+                frequency=ds.attrs["frequency"],
+                domain=ds.attrs["domain"],
+                resolution=ds.attrs["resolution"],
+                scenario=scenario,
+                ensemble_member=ensemble_member,
+                variable=config["variable"],
+                collection=src_collection,
+            )
+
+            _save(
+                ds,
+                config,
+                output_metadata.filepath(year),
+                year,
+                output_stager=output_stager,
+            )
+            outputs[config["variable"]] = [output_metadata.filepath(year)]
+
+    return outputs
+
+
+@app.command()
+@Timer(
+    name="create-ensemble-variable",
+    text="{name}: {minutes:.1f} minutes",
+    logger=logger.info,
+)
+def create_ensemble(
+    config_paths: list[Path] = typer.Option(...),
+    thetas: list[int] = None,
+    scenario="rcp85",
+    ensemble_members: list[str] = typer.Option(
+        None, help="Ensemble members to create (defaults to all of them)"
+    ),
+    year: int = typer.Option(...),
+    scale_factor: str = typer.Option(...),
+    domain: DomainOption = typer.Option(...),
+    target_resolution: str = None,
+    output_base_dir: Path = None,
+    validate: bool = True,
+):
+    """
+    Create variable files for several ensemble members at once.
+
+    The actions run once across all the members and a file is then saved for each member.
+    """
+
+    configs = [
+        load_config(
+            config_path,
+            scale_factor=scale_factor,
+            domain=domain.value,
+            theta=theta,
+            target_resolution=target_resolution,
         )
+        for config_path in config_paths
+        for theta in (thetas or [None])
+    ]
 
-        _save(ds, config, output_metadata.filepath(year), year)
+    src_configs = {src_config for config in configs for src_config in config["sources"]}
+
+    src_collection = {src_config.collection for src_config in src_configs}
+    assert (
+        len(src_collection) == 1
+    ), "All variable configs must have the same source collection"
+    src_collection = src_collection.pop()
+
+    if output_base_dir is None:
+        output_base_dir = DERIVED_VARIABLES_PATH
+
+    src_ds = open_ensemble_source_variables(
+        src_configs,
+        year,
+        ensemble_members=ensemble_members or None,
+        configs=configs,
+    )
+    with OutputStager(background=True) as output_stager:
+        for config in configs:
+            logger.info(f"Processing {config['variable']} for the ensemble...")
+            ensemble_ds = _process(
+                src_ds,
+                config,
+            )
+
+            for ensemble_member in ensemble_ds["ensemble_member"].values:
+                # computed once (a member at a time to bound memory) rather than reading the
+                # source again for each of validating and saving it
+                ds = ensemble_ds.sel(ensemble_member=ensemble_member, drop=True).load()
+
+                if validate:
+                    _validate(ds, config)
+
+                output_metadata = VariableMetadata(
+                    output_base_dir,
+                    frequency=ds.attrs["frequency"],
+                    domain=ds.attrs["domain"],
+                    resolution=ds.attrs["resolution"],
+                    scenario=scenario,
+                    ensemble_member=str(ensemble_member),
+                    variable=config["variable"],
+                    collection=src_collection,
+                )
+
+                _save(
+                    ds,
+                    config,
+                    output_metadata.filepath(year),
+                    year,
+                    output_stager=output_stager,
+                )
 
 
 @app.command()
@@ -418,3 +718,16 @@ def validate(
                         tqdm.write(
                             f"Passed validation: {var} over {variable_group['domain']} of {em} in {scenario} at {variable_group['resolution']}"
                         )
+
+
+@app.command()
+@Timer(name="index-variables", text="{name}: {minutes:.1f} minutes", logger=logger.info)
+def index(
+    base_dir: Path = typer.Argument(DERIVED_VARIABLES_PATH),
+    workers: int = typer.Option(1, help="Number of variables to index at once"),
+):
+    """
+    Write (or bring up to date) an index of the yearly files of each variable so they can be opened without reading each one
+    """
+    dsmetas = variable_index.update_indexes(base_dir, workers=workers)
+    logger.info(f"Indexed {len(dsmetas)} variables in {base_dir}")
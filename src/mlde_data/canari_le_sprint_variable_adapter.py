@@ -1,7 +1,11 @@
 import logging
 import os
+from pathlib import Path
 import xarray as xr
 from . import RangeDict
+from .actions.select_domain import extent_indexers
+from .staging import localize
+from .variable import SpatialExtent
 
 
 class CanariLESprintVariableAdapter:
@@ -101,6 +105,9 @@ class CanariLESprintVariableAdapter:
         }
     )
 
+    # about a month of daily data per chunk so a member-year is never held in memory all at once
+    CHUNKS = {"time_counter": 30}
+
     VARIABLES = {
         "psl": {"day": "m01s16i222_4"},
         "pr": {"1hr": "m01s05i216"},
@@ -110,11 +117,63 @@ class CanariLESprintVariableAdapter:
         VARIABLES[f"ywind{theta}"] = {"day": "m01s30i201_3"}
         VARIABLES[f"temp{theta}"] = {"day": "m01s30i204_3"}
 
-    def __init__(self, variable: str, ensemble_member: str, frequency: str, year: int):
+    def __init__(
+        self,
+        variable: str,
+        ensemble_member: str,
+        frequency: str,
+        year: int,
+        extent: SpatialExtent | None = None,
+        stage_dir: Path | None = None,
+    ):
         self.variable = variable
         self.ensemble_member = ensemble_member
         self.frequency = frequency
         self.year = year
+        # only read the part of the global grid needed for this extent
+        self.extent = extent
+        # read any of the files that have been staged locally from there instead
+        self.stage_dir = stage_dir
+
+    @classmethod
+    def open_ensemble(
+        cls,
+        variable: str,
+        frequency: str,
+        year: int,
+        ensemble_members: list[str] | None = None,
+        extent: SpatialExtent | None = None,
+        stage_dir: Path | None = None,
+    ) -> xr.Dataset:
+        """
+        Lazily open a year of several (by default all) ensemble members as one dataset with an ensemble_member dimension.
+        """
+        if ensemble_members is None:
+            ensemble_members = list(cls.ENSEMBLE_MEMBERS[year].keys())
+
+        member_datasets = [
+            cls(
+                variable=variable,
+                ensemble_member=ensemble_member,
+                frequency=frequency,
+                year=year,
+                extent=extent,
+                stage_dir=stage_dir,
+            ).open()
+            for ensemble_member in ensemble_members
+        ]
+        # members share a grid and times so only the variable itself gets the new dimension
+        return xr.concat(
+            member_datasets,
+            dim=xr.DataArray(
+                ensemble_members, dims="ensemble_member", name="ensemble_member"
+            ),
+            data_vars=[variable],
+            coords="minimal",
+            compat="override",
+            join="exact",
+            combine_attrs="drop_conflicts",
+        )
 
     @property
     def varcode(self) -> str:
@@ -151,10 +210,10 @@ class CanariLESprintVariableAdapter:
         logging.info(f"Opening {self.filepaths}")
         ds = xr.concat(
             [
-                xr.open_dataset(f).sel(
+                xr.open_dataset(f, chunks=self.CHUNKS).sel(
                     time_counter=slice(f"{self.year-1}-12-01", f"{self.year}-11-30")
                 )
-                for f in self.filepaths
+                for f in localize(self.filepaths, self.stage_dir)
             ],
             dim="time_counter",
             data_vars="minimal",
@@ -199,7 +258,12 @@ class CanariLESprintVariableAdapter:
 
         ds = ds.assign(
             latitude_longitude=xr.DataArray(
-                data=0, dims=[], coords=dict(), attrs=dict(earth_radius=6371229.0)
+                data=0,
+                dims=[],
+                coords=dict(),
+                attrs=dict(
+                    grid_mapping_name="latitude_longitude", earth_radius=6371229.0
+                ),
             )
         )
         ds[self.variable] = ds[self.variable].assign_attrs(
@@ -208,4 +272,7 @@ class CanariLESprintVariableAdapter:
 
         ds = ds.sel(time=slice(f"{self.year-1}-12-01", f"{self.year}-11-30"))
 
+        if self.extent is not None:
+            ds = ds.isel(extent_indexers(ds, self.extent))
+
         return ds
@@ -2,7 +2,10 @@ import logging
 from pathlib import Path
 import xarray as xr
 
-from mlde_data.variable import SourceVariableConfig
+from mlde_data.actions.select_domain import extent_indexers
+from mlde_data.fingerprint import check_consistent
+from mlde_data.staging import localize
+from mlde_data.variable import SourceVariableConfig, SpatialExtent
 
 
 class CedaVariableAdapter:
@@ -31,6 +34,9 @@ class CedaVariableAdapter:
         "land-cpm": "v20210615",
     }
 
+    # one month of hourly data per chunk
+    CHUNKS = {"time": 720}
+
     @classmethod
     def from_variable_defn(
         cls,
@@ -39,6 +45,9 @@ class CedaVariableAdapter:
         scenario: str,
         year: int,
         base_dir: Path | None = None,
+        trusted: bool = False,
+        extent: SpatialExtent | None = None,
+        stage_dir: Path | None = None,
     ):
         if defn.src_type != "ceda":
             raise ValueError(
@@ -55,6 +64,9 @@ class CedaVariableAdapter:
             scenario=scenario,
             year=year,
             base_dir=base_dir,
+            trusted=trusted,
+            extent=extent,
+            stage_dir=stage_dir,
         )
 
     def __init__(
@@ -68,7 +80,15 @@ class CedaVariableAdapter:
         scenario: str,
         year: int,
         base_dir: Path | None = None,
+        trusted: bool = False,
+        extent: SpatialExtent | None = None,
+        stage_dir: Path | None = None,
     ):
+        """
+        trusted skips checking that the files for the year are on the same grid and have the same
+        metadata (safe for the versioned CEDA archive). If an extent is given, only the part of
+        the grid needed for it is read. Any files staged in stage_dir are read from there.
+        """
         self.collection = collection
         self.ensemble_member = ensemble_member
         self.variable = variable
@@ -80,6 +100,9 @@ class CedaVariableAdapter:
         if base_dir is None:
             base_dir = self.JASMIN_CEDA_BASE_DIR
         self.base_dir = base_dir
+        self.trusted = trusted
+        self.extent = extent
+        self.stage_dir = stage_dir
 
     def __eq__(self, other):
         if not isinstance(other, CedaVariableAdapter):
@@ -145,15 +168,27 @@ class CedaVariableAdapter:
 
     def open(self) -> xr.Dataset:
         logging.debug(f"Opening {self.filepaths}")
+        # opening lazily only reads metadata, the data is then read chunk by chunk in parallel by dask
+        # (the files are not opened from several threads at once as netCDF4 is not thread-safe)
+        datasets = [
+            xr.open_dataset(f, chunks=self.CHUNKS)
+            for f in localize(self.filepaths, self.stage_dir)
+        ]
+        # rather than comparing the variables that are not along time in full,
+        # check them by fingerprint and then take them from the first file
+        if not self.trusted:
+            check_consistent(datasets, dim="time", labels=self.filepaths)
         ds = xr.concat(
-            [xr.open_dataset(f) for f in self.filepaths],
+            datasets,
             dim="time",
             data_vars="minimal",
             coords="minimal",
-            join="exact",
+            join="override" if self.trusted else "exact",
             combine_attrs="drop_conflicts",
-            compat="equals",
+            compat="override",
         ).squeeze("ensemble_member", drop=True)
+        if self.extent is not None:
+            ds = ds.isel(extent_indexers(ds, self.extent))
         # remove unwanted global attributes from CEDA files
         for k in ["contact, institution", "institution_id", "references"]:
             if k in ds.attrs:
@@ -0,0 +1,307 @@
+"""
+A DAG of mlde-data commands (extract -> create -> clean for each variable, member and year).
+
+The DAG can be run on a single node by a pool of worker processes that keeps within a memory
+budget, or turned into a script that submits one Slurm array job per level of the DAG with
+many tasks packed into each array element. Either way a worker runs many commands in the same
+Python process rather than paying the start up cost for each one.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+import json
+import logging
+import multiprocessing
+from pathlib import Path
+import shlex
+from typing import Callable
+
+from mlde_utils import RAW_MOOSE_VARIABLES_PATH
+
+from .variable import load_config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DagTask:
+    name: str
+    # arguments to the mlde-data command
+    command: list[str]
+    # estimated peak memory in bytes
+    memory: int = 0
+    depends_on: list[str] = field(default_factory=list)
+
+
+class Dag:
+    def __init__(self, tasks: list[DagTask] = None):
+        self.tasks = {}
+        for task in tasks or []:
+            self.add(task)
+
+    def add(self, task: DagTask) -> DagTask:
+        if task.name in self.tasks:
+            raise ValueError(f"Duplicate task {task.name}")
+        for dependency in task.depends_on:
+            if dependency not in self.tasks:
+                raise ValueError(f"{task.name} depends on unknown task {dependency}")
+        self.tasks[task.name] = task
+        return task
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def levels(self) -> list[list[DagTask]]:
+        """
+        Group the tasks into levels such that each task only depends on tasks in earlier levels.
+        """
+        level_of = {}
+        # tasks can only depend on tasks added before them so insertion order is topological
+        for task in self.tasks.values():
+            level_of[task.name] = 1 + max(
+                (level_of[dependency] for dependency in task.depends_on), default=-1
+            )
+        levels = [[] for _ in range(max(level_of.values(), default=-1) + 1)]
+        for task in self.tasks.values():
+            levels[level_of[task.name]].append(task)
+        return levels
+
+    def save(self, path: Path) -> None:
+        Path(path).write_text(
+            json.dumps([asdict(task) for task in self.tasks.values()], indent=2)
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "Dag":
+        return cls([DagTask(**task) for task in json.loads(Path(path).read_text())])
+
+
+def run_local(
+    dag: Dag,
+    run_fn: Callable[[list[str]], None],
+    workers: int = 1,
+    max_memory: int | None = None,
+) -> None:
+    """
+    Run the DAG's tasks with run_fn (called with each task's command) on a pool of worker processes.
+
+    A task starts once all its dependencies have succeeded, there is a free worker and, if
+    max_memory is set, the estimated memory of the running tasks leaves room for it (a task
+    bigger than max_memory runs on its own). Tasks that depend on a failed one are not run and
+    a RuntimeError listing the failures is raised at the end.
+    """
+    remaining = dict(dag.tasks)
+    done = set()
+    failed = {}
+    running = {}
+    running_memory = 0
+
+    def _fits(task):
+        if max_memory is None or not running:
+            return True
+        return running_memory + task.memory <= max_memory
+
+    # forking a process that already has threads (e.g. from dask or netCDF) can deadlock the workers
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+    ) as executor:
+        while True:
+            for name, task in list(remaining.items()):
+                if any(dependency in failed for dependency in task.depends_on):
+                    logger.warning(f"Not running {name} as a dependency failed")
+                    failed[name] = "dependency failed"
+                    del remaining[name]
+                    continue
+                if len(running) >= workers:
+                    break
+                if all(dependency in done for dependency in task.depends_on) and _fits(
+                    task
+                ):
+                    logger.info(f"Starting {name}")
+                    running[executor.submit(run_fn, task.command)] = task
+                    running_memory += task.memory
+                    del remaining[name]
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                running_memory -= task.memory
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.exception(f"{task.name} failed")
+                    failed[task.name] = f"{type(e).__name__}: {e}"
+                else:
+                    logger.info(f"Finished {task.name}")
+                    done.add(task.name)
+
+    if failed:
+        raise RuntimeError(f"Failed tasks: {failed}")
+
+
+def batch_tasks(dag: Dag, level: int, batch: int, batches: int) -> list[DagTask]:
+    """
+    The tasks of one of batches equal shares of a level of the DAG.
+    """
+    return dag.levels()[level][batch::batches]
+
+
+def _slurm_memory(memory: int) -> str:
+    return f"{max(1, -(-memory // 1024**2))}M"
+
+
+def slurm_script(
+    dag: Dag,
+    dag_path: Path,
+    max_array_size: int = 100,
+    sbatch_args: list[str] = (),
+    runner: str = "mlde-data",
+) -> str:
+    """
+    A bash script that submits a Slurm array job for each level of the DAG, each depending on the previous.
+
+    A level's tasks are shared between at most max_array_size array elements, each of which runs its
+    share one after another, and each element gets the largest memory estimate of the level's tasks.
+    """
+    lines = ["#! /usr/bin/env bash", "", "set -euo pipefail", "", "job_id=0"]
+    for level, tasks in enumerate(dag.levels()):
+        batches = min(len(tasks), max_array_size)
+        memory = max(task.memory for task in tasks)
+        run_batch = [runner, "dag", "run-batch", str(dag_path)] + [
+            "--level",
+            str(level),
+            "--batches",
+            str(batches),
+        ]
+        args = [
+            "--parsable",
+            f"--array=0-{batches - 1}",
+            f"--mem={_slurm_memory(memory)}",
+            f"--job-name=mlde-data-dag-{level}",
+        ] + list(sbatch_args)
+        lines += [
+            "",
+            f"# level {level}: {len(tasks)} tasks in {batches} array elements",
+            "dependency=()",
+            'if [ "${job_id}" != "0" ]; then',
+            '  dependency=("--dependency=afterok:${job_id}")',
+            "fi",
+            f'job_id=$(sbatch {shlex.join(args)} "${{dependency[@]}}" '
+            + f"--wrap={shlex.quote(shlex.join(run_batch) + ' --batch ${SLURM_ARRAY_TASK_ID}')})",
+            'echo "${job_id}"',
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def build_etl_dag(
+    years: list[int],
+    variable_config_paths: list[Path],
+    ensemble_members: list[str],
+    scale_factor: str,
+    domain: str,
+    scenario: str = "rcp85",
+    thetas: list[int] = None,
+    target_resolution: str = None,
+    extract_memory: int = 0,
+    create_memory: int = 0,
+    extracts_base_dir: Path | None = None,
+) -> Dag:
+    """
+    The tasks to create the variables from the given configs for each ensemble member and year.
+
+    For moose sources each source variable is extracted (to extracts_base_dir) before the
+    variables are created from the extracted pp data and then the extracted data is cleaned up.
+    Other sources are read in place so only need the create task.
+    """
+    if extracts_base_dir is None:
+        extracts_base_dir = RAW_MOOSE_VARIABLES_PATH / "pp"
+
+    configs = [
+        load_config(
+            config_path,
+            scale_factor=scale_factor,
+            domain=domain,
+            theta=theta,
+            target_resolution=target_resolution,
+        )
+        for config_path in variable_config_paths
+        for theta in (thetas or [None])
+    ]
+    src_configs = sorted(
+        {src_config for config in configs for src_config in config["sources"]},
+        key=lambda src_config: src_config.variable,
+    )
+    variables = "-".join(config["variable"] for config in configs)
+
+    create_args = [
+        arg
+        for config_path in variable_config_paths
+        for arg in ["--config-paths", str(config_path)]
+    ] + ["--scale-factor", scale_factor, "--domain", domain, "--scenario", scenario]
+    for theta in thetas or []:
+        create_args += ["--thetas", str(theta)]
+    if target_resolution is not None:
+        create_args += ["--target-resolution", target_resolution]
+    if any(src_config.src_type == "moose" for src_config in src_configs):
+        # read the extracts made by the DAG's own extract tasks
+        create_args += ["--input-base-dir", str(extracts_base_dir), "--yearly-extracts"]
+
+    dag = Dag()
+    for ensemble_member in ensemble_members:
+        for year in years:
+            moose_args = {
+                src_config: [
+                    "--collection",
+                    src_config.collection,
+                    "--scenario",
+                    scenario,
+                    "--ensemble-member",
+                    ensemble_member,
+                    "--year",
+                    str(year),
+                    "--variable",
+                    src_config.variable,
+                    "--frequency",
+                    src_config.frequency,
+                    "--base-dir",
+                    str(extracts_base_dir),
+                ]
+                for src_config in src_configs
+                if src_config.src_type == "moose"
+            }
+
+            extracts = [
+                dag.add(
+                    DagTask(
+                        f"extract/{src_config.variable}/{ensemble_member}/{year}",
+                        ["moose", "extract"] + args,
+                        memory=extract_memory,
+                    )
+                )
+                for src_config, args in moose_args.items()
+            ]
+
+            create = dag.add(
+                DagTask(
+                    f"create/{variables}/{ensemble_member}/{year}",
+                    ["variable", "create"]
+                    + create_args
+                    + ["--ensemble-member", ensemble_member, "--year", str(year)],
+                    memory=create_memory,
+                    depends_on=[extract.name for extract in extracts],
+                )
+            )
+
+            for src_config, args in moose_args.items():
+                dag.add(
+                    DagTask(
+                        f"clean/{src_config.variable}/{ensemble_member}/{year}",
+                        ["moose", "clean"] + args,
+                        depends_on=[create.name],
+                    )
+                )
+
+    return dag
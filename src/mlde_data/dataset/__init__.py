@@ -1,14 +1,22 @@
 import cf_xarray  # noqa: F401
 from collections import defaultdict
+import dask
+import dask.array
+import functools
 import gc
+import json
 import logging
 from mlde_utils import VariableMetadata
+import numpy as np
+import os
 from pathlib import Path
 import re
 import xarray as xr
 
 from mlde_utils import DatasetMetadata
 
+from .. import fingerprint, variable_index
+from .day_index import day_index, split_indices
 from .preset_split import PresetSplit
 from .random_split import RandomSplit
 from .random_season_split import RandomSeasonSplit
@@ -16,6 +24,66 @@ from .random_season_split import RandomSeasonSplit
 logger = logging.getLogger(__name__)
 
 
+STATISTICS = ["count", "mean", "std", "max", "min"]
+
+
+def _moments(values) -> tuple:
+    """
+    Count, mean, sum of squared deviations from the mean, max and min of the non-NaN values (in float64)
+    """
+    values = np.asarray(values)
+    valid = values[~np.isnan(values)] if values.dtype.kind == "f" else values.ravel()
+    count = valid.size
+    if count == 0:
+        return 0, 0.0, 0.0, np.nan, np.nan
+    mean = np.sum(valid, dtype=np.float64) / count
+    m2 = np.sum((valid - mean) ** 2, dtype=np.float64)
+    return count, mean, m2, np.max(valid), np.min(valid)
+
+
+def _merge_moments(a: tuple, b: tuple) -> tuple:
+    """
+    Combine the moments of two sets of values (Chan et al.'s parallel algorithm)
+    """
+    count_a, mean_a, m2_a, max_a, min_a = a
+    count_b, mean_b, m2_b, max_b, min_b = b
+    if count_a == 0:
+        return b
+    if count_b == 0:
+        return a
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    return (
+        count,
+        mean_a + delta * count_b / count,
+        m2_a + m2_b + delta**2 * count_a * count_b / count,
+        max(max_a, max_b),
+        min(min_a, min_b),
+    )
+
+
+def _reduce_moments(partials: list[tuple]) -> tuple:
+    return functools.reduce(_merge_moments, partials)
+
+
+def aggregation_pyramid(
+    da: xr.DataArray, time_aggregation_factors: list[int], dim: str = "time"
+) -> dict[int, xr.DataArray]:
+    """
+    Sums of da over blocks of each of the numbers of timesteps given.
+
+    Each factor is derived from the sums for the largest smaller factor that divides it (if any) so,
+    for example, daily sums of hourly data are reused for 3-day sums rather than going back to the
+    hourly values.
+    """
+    pyramid = {1: da}
+    for factor in sorted(set(time_aggregation_factors)):
+        base = max(f for f in pyramid if factor % f == 0)
+        if base != factor:
+            pyramid[factor] = pyramid[base].coarsen({dim: factor // base}).sum()
+    return {factor: pyramid[factor] for factor in time_aggregation_factors}
+
+
 def _calculate_statistics(
     split_ds: xr.Dataset, variables: list[str], time_aggregation_factors: list[int]
 ) -> xr.Dataset:
@@ -23,80 +91,204 @@ def _calculate_statistics(
     Calculate statistics for each variable in the dataset
 
     Used for transforming the data later (e.g. standardization in ML pipeline)
+
+    The moments of each chunk (and so each ensemble member) of each time aggregation are computed
+    in parallel and then merged, all in a single pass over the data.
     """
+    moments = {}
+    dtypes = {}
+    for var in variables:
+        pyramid = aggregation_pyramid(split_ds[var], time_aggregation_factors)
+        for time_factor in time_aggregation_factors:
+            aggregated = pyramid[time_factor].data
+            dtypes[(var, time_factor)] = aggregated.dtype
+            if isinstance(aggregated, dask.array.Array):
+                moments[(var, time_factor)] = dask.delayed(_reduce_moments)(
+                    [
+                        dask.delayed(_moments)(block)
+                        for block in aggregated.to_delayed().ravel()
+                    ]
+                )
+            else:
+                moments[(var, time_factor)] = _moments(aggregated)
+    (moments,) = dask.compute(moments)
+
+    stats = {stat: [] for stat in STATISTICS}
+    for var in variables:
+        for stat in STATISTICS:
+            stats[stat].append([])
+        for time_factor in time_aggregation_factors:
+            count, mean, m2, max_, min_ = moments[(var, time_factor)]
+            dtype = dtypes[(var, time_factor)]
+            stats["count"][-1].append(count)
+            stats["mean"][-1].append(mean if count > 0 else np.nan)
+            stats["std"][-1].append(np.sqrt(m2 / count) if count > 0 else np.nan)
+            stats["max"][-1].append(np.asarray(max_).astype(dtype))
+            stats["min"][-1].append(np.asarray(min_).astype(dtype))
+
+    return xr.Dataset(
+        {
+            stat: (["variable", "time_aggregation_factor"], np.array(values))
+            for stat, values in stats.items()
+        },
+        coords={
+            "variable": variables,
+            "time_aggregation_factor": time_aggregation_factors,
+        },
+    )
 
-    return xr.merge(
-        [
-            xr.merge(
-                [
-                    split_ds[var]
-                    .coarsen(time=time_factor)
-                    .sum()
-                    .count()
-                    .rename("count"),
-                    split_ds[var].coarsen(time=time_factor).sum().mean().rename("mean"),
-                    split_ds[var].coarsen(time=time_factor).sum().std().rename("std"),
-                    split_ds[var].coarsen(time=time_factor).sum().max().rename("max"),
-                    split_ds[var].coarsen(time=time_factor).sum().min().rename("min"),
-                ]
-            ).expand_dims({"variable": [var], "time_aggregation_factor": [time_factor]})
-            for var in variables
-            for time_factor in time_aggregation_factors
-        ],
+
+def time_chunk_size(var_type: str) -> int:
+    """
+    Number of timesteps in each chunk of a var type's saved splits
+    """
+    times_per_day = 24 if var_type == "predictands" else 1
+    # 90 days (a season) per chunk, 10 results in too many files
+    return times_per_day * 90
+
+
+def rechunk(split_ds: xr.Dataset, var_type: str) -> xr.Dataset:
+    """
+    Rechunk the gridded variables of a split for ML use and to avoid issues with saving to zarr
+    """
+    for var_name in split_ds.data_vars:
+        # ML suitable chunking: 1 day per chunk
+        new_chunks = {
+            "ensemble_member": 1,
+            "time": time_chunk_size(var_type),
+            split_ds.cf["X"].name: split_ds.cf["X"].size,
+            split_ds.cf["Y"].name: split_ds.cf["Y"].size,
+        }
+        if set(new_chunks.keys()) == set(split_ds[var_name].dims):
+            if "chunks" in split_ds[var_name].encoding:
+                # remove existing chunking info to avoid conflict
+                del split_ds[var_name].encoding["chunks"]
+            split_ds[var_name] = split_ds[var_name].chunk(new_chunks)
+    return split_ds
+
+
+def merge_statistics(a: xr.Dataset, b: xr.Dataset) -> xr.Dataset:
+    """
+    Statistics of the data of two sets of statistics together (e.g. of different ensemble members
+    of the same variables) from their counts, means and standard deviations rather than the data
+    """
+    a, b = xr.align(a, b, join="exact")
+    count = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    m2 = (
+        a["std"] ** 2 * a["count"]
+        + b["std"] ** 2 * b["count"]
+        + delta**2 * a["count"] * b["count"] / count
     )
+    merged = xr.Dataset(
+        {
+            "count": count,
+            "mean": a["mean"] + delta * b["count"] / count,
+            "std": np.sqrt(m2 / count),
+            "max": np.fmax(a["max"], b["max"]),
+            "min": np.fmin(a["min"], b["min"]),
+        }
+    )
+    # the statistics of no values are NaN so would spoil the merge
+    merged = xr.where(a["count"] == 0, b, merged)
+    merged = xr.where(b["count"] == 0, a, merged)
+    return merged[STATISTICS]
+
+
+def _cache_key(*parts) -> str:
+    return json.dumps(parts, sort_keys=True, default=str)
 
 
-def create(config: dict, input_base_dir: Path) -> dict:
+def create(
+    config: dict,
+    input_base_dir: Path,
+    cache: dict = None,
+    load_stats=None,
+    split_sets: dict = None,
+) -> dict:
     """
     Create a dataset
+
+    The opened variables, splits and statistics are kept in cache (if given) to be reused by
+    other datasets made from the same variables. Statistics are only calculated for the variables
+    of a split that load_stats(var_type, split, var_name) (if given) does not return. The days of
+    each split are worked out from the config unless given as split_sets. Var types without any
+    variables are left out.
     """
+    if cache is None:
+        cache = {}
     scenario = config["scenario"]
+    # only open the files for the years that the splits need
+    years = _split_years(config["split"])
 
     var_type_datasets = {}
     var_type_statistics = {}
-    split_sets = None
     for var_type in ["predictands", "predictors"]:
+        if len(config[var_type]["variables"]) == 0:
+            continue
         logger.info(f"Processing {var_type}...")
 
         var_type_datasets[var_type] = {}
         var_type_statistics[var_type] = {}
         var_type_config = config[var_type]
+        var_config = dict(
+            resolution=var_type_config["resolution"],
+            collection=var_type_config["collection"],
+            frequency=var_type_config["frequency"],
+            domain=var_type_config["domain"],
+            scenario=scenario,
+        )
         single_var_datasets = []
+        var_keys = {}
         for var_name in var_type_config["variables"]:
             logger.info(f"Processing {var_name}...")
-            single_em_var_datasets = []
-            for em in config["ensemble_members"]:
-                single_em_var_datasets.append(
-                    _single_variable(
-                        em,
-                        var_name,
-                        input_base_dir=input_base_dir,
-                        resolution=var_type_config["resolution"],
-                        collection=var_type_config["collection"],
-                        frequency=var_type_config["frequency"],
-                        domain=var_type_config["domain"],
-                        scenario=scenario,
+            var_key = _cache_key(
+                "members",
+                var_name,
+                config["ensemble_members"],
+                str(input_base_dir),
+                years,
+                var_config,
+            )
+            var_keys[var_name] = var_key
+            if var_key not in cache:
+                single_em_var_datasets = []
+                for em in config["ensemble_members"]:
+                    em_key = _cache_key(
+                        "variable", em, var_name, str(input_base_dir), years, var_config
                     )
+                    if em_key not in cache:
+                        cache[em_key] = _single_variable(
+                            em,
+                            var_name,
+                            input_base_dir=input_base_dir,
+                            years=years,
+                            **var_config,
+                        )
+                    single_em_var_datasets.append(cache[em_key])
+                logger.info(f"Combining ensemble members for {var_name}...")
+                cache[var_key] = fingerprint.concat(
+                    single_em_var_datasets,
+                    dim="ensemble_member",
+                    compat="no_conflicts",
+                    combine_attrs="drop_conflicts",
+                    join="exact",
+                    data_vars="minimal",
                 )
-            logger.info(f"Combining ensemble members for {var_name}...")
-            multi_em_ds = xr.concat(
-                single_em_var_datasets,
-                dim="ensemble_member",
-                compat="no_conflicts",
-                combine_attrs="drop_conflicts",
-                join="exact",
-                data_vars="minimal",
-            )
-            single_var_datasets.append(multi_em_ds)
 
-            del single_em_var_datasets
-            gc.collect()
+                del single_em_var_datasets
+                gc.collect()
+            multi_em_ds = cache[var_key]
+            single_var_datasets.append(multi_em_ds)
 
             if split_sets is None:
-                logger.info(f"Generating times for split sets...")
-                split_sets = _split(multi_em_ds["time"], **config["split"])
+                split_key = _cache_key("split", config["split"], var_key)
+                if split_key not in cache:
+                    logger.info(f"Generating times for split sets...")
+                    cache[split_key] = _split(multi_em_ds["time"], **config["split"])
+                split_sets = cache[split_key]
         logger.info(f"Combining variables for {var_type}...")
-        var_type_ds = xr.combine_by_coords(
+        var_type_ds = fingerprint.combine_by_coords(
             single_var_datasets,
             compat="no_conflicts",
             combine_attrs="drop_conflicts",
@@ -104,21 +296,61 @@ def create(config: dict, input_base_dir: Path) -> dict:
             data_vars="minimal",
         )
 
-        for split, split_times in split_sets.items():
-            split_ds = var_type_ds.sel(
-                time=var_type_ds["time"].dt.floor("D").isin(split_times)
-            )
+        days = day_index(var_type_ds["time"].values)
+        stats_config = config[var_type].get("stats", {"time_aggregation_factors": [1]})
+        for split, split_days in split_sets.items():
+            split_ds = var_type_ds.isel(time=split_indices(days, split_days))
             var_type_datasets[var_type][split] = split_ds
 
-            var_type_statistics[var_type][split] = _calculate_statistics(
-                split_ds,
-                var_type_config["variables"],
-                **config[var_type].get("stats", {"time_aggregation_factors": [1]}),
+            # each variable's statistics are shared by the datasets with the same splits
+            stats_keys = {
+                var_name: _cache_key(
+                    "stats", config["split"], split, stats_config, var_key
+                )
+                for var_name, var_key in var_keys.items()
+            }
+            missing = [var for var, key in stats_keys.items() if key not in cache]
+            if load_stats is not None:
+                for var_name in list(missing):
+                    stats = load_stats(var_type, split, var_name)
+                    if stats is not None:
+                        cache[stats_keys[var_name]] = stats
+                        missing.remove(var_name)
+            if len(missing) > 0:
+                stats = _calculate_statistics(split_ds, missing, **stats_config)
+                for var_name in missing:
+                    cache[stats_keys[var_name]] = stats.sel(variable=[var_name])
+            var_type_statistics[var_type][split] = xr.concat(
+                [cache[key] for key in stats_keys.values()], dim="variable"
             )
 
     return var_type_datasets, var_type_statistics
 
 
+def create_many(
+    configs: dict[str, dict], input_base_dir: Path, load_stats: dict = None
+) -> dict:
+    """
+    Create several datasets, opening each variable of each ensemble member, working out each split
+    and calculating each variable's statistics only once for all of them.
+
+    Returns the split datasets and statistics of each dataset by name. The datasets share their
+    lazily loaded data so writing them together (e.g. in one dask.compute) reads it only once.
+    load_stats optionally gives (by name) each dataset's function for loading previously
+    calculated statistics (see create).
+    """
+    cache = {}
+    return {
+        name: create(
+            config,
+            input_base_dir,
+            cache=cache,
+            load_stats=(load_stats or {}).get(name),
+        )
+        for name, config in configs.items()
+    }
+
+
 def validate(dataset: str) -> defaultdict:
     """
     Validate a dataset
@@ -314,37 +546,56 @@ def check_time_encoding(ds, dataset, split, ds_config):
 
 
 def _single_variable(
-    em: str, var_name, input_base_dir: Path, **var_config: dict
+    em: str, var_name, input_base_dir: Path, years: list[int] = None, **var_config: dict
 ) -> xr.Dataset:
     """
     Combine predictor and predictand variables for a given ensemble into a single dataset
+
+    Only the files for the given years are opened (all years that exist if years is None). If the
+    variable has an up to date index then it is used instead of opening each file.
     """
 
     dsmeta = VariableMetadata(
         input_base_dir, ensemble_member=em, variable=var_name, **var_config
     )
 
-    variable_ds = xr.open_mfdataset(
-        dsmeta.existing_filepaths(),
-        data_vars="minimal",
-        combine="by_coords",
-        compat="no_conflicts",
-        combine_attrs="drop_conflicts",
-    )
+    index = variable_index.load_index(dsmeta)
+    if index is not None and variable_index.stale_files(dsmeta, index, years):
+        logger.warning(
+            f"Index of {dsmeta.dirpath()} is out of date, opening its files instead"
+        )
+        index = None
+
+    if index is not None:
+        variable_ds = variable_index.open_indexed(dsmeta, years, index=index)
+    else:
+        if years is None:
+            filepaths = dsmeta.existing_filepaths()
+        else:
+            filepaths = [
+                dsmeta.filepath(year)
+                for year in years
+                if os.path.exists(dsmeta.filepath(year))
+            ]
+            if len(filepaths) == 0:
+                raise FileNotFoundError(
+                    f"No files for years {years} in {dsmeta.dirpath()}"
+                )
+
+        variable_ds = xr.open_mfdataset(
+            filepaths,
+            data_vars="minimal",
+            combine="by_coords",
+            compat="no_conflicts",
+            combine_attrs="drop_conflicts",
+        )
     variable_ds[dsmeta.variable] = variable_ds[dsmeta.variable].expand_dims(
         dict(ensemble_member=[em])
     )
     return variable_ds
 
 
-def _split(
-    time_da: xr.DataArray,
-    scheme: str,
-    **splitter_kwargs: dict,
-):
-    """
-    Split data into train, validation and test subsets
-    """
+def _splitter(scheme: str, **splitter_kwargs: dict):
     if scheme == "random":
         splitter = RandomSplit
     elif scheme == "random-season":
@@ -353,6 +604,23 @@ def _split(
         splitter = PresetSplit
     else:
         raise RuntimeError(f"Unknown split scheme {scheme}")
+    return splitter(**splitter_kwargs)
+
+
+def _split_years(split_config: dict) -> list[int]:
+    """
+    The project years of data needed by a split config
+    """
+    return _splitter(**split_config).years()
+
 
+def _split(
+    time_da: xr.DataArray,
+    scheme: str,
+    **splitter_kwargs: dict,
+):
+    """
+    Split data into train, validation and test subsets
+    """
     logger.info(f"Splitting data...")
-    return splitter(**splitter_kwargs).run(time_da)
+    return _splitter(scheme, **splitter_kwargs).run(time_da)
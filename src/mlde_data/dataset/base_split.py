@@ -1,7 +1,33 @@
 import abc
+import numpy as np
 import xarray as xr
 
 
+def project_year(date: str, end: bool = False) -> int:
+    """
+    The project year (December to November) of a date string like 1980-12-01 (or 1980-12 or 1980).
+
+    For the end of a period a date without a month is taken to mean the end of that year.
+    """
+    parts = [int(part) for part in date.split("-")[:2]]
+    year = parts[0]
+    month = parts[1] if len(parts) > 1 else (12 if end else 1)
+    return year + 1 if month == 12 else year
+
+
+def period_years(time_periods: list[list[str]]) -> list[int]:
+    """
+    The project years covered by [start, end] time periods.
+    """
+    return sorted(
+        {
+            year
+            for start, end in time_periods
+            for year in range(project_year(start), project_year(end, end=True) + 1)
+        }
+    )
+
+
 class BaseSplit(abc.ABC):
     def __init__(
         self,
@@ -15,5 +41,14 @@ class BaseSplit(abc.ABC):
         self.seed = seed
         self.time_periods = time_periods
 
+    def years(self) -> list[int]:
+        """
+        The project years of data that the split needs.
+        """
+        return period_years(self.time_periods)
+
     @abc.abstractmethod
-    def run(self, combined_dataset: xr.Dataset) -> dict[str, xr.Dataset]: ...
+    def run(self, time_da: xr.DataArray) -> dict[str, np.ndarray]:
+        """
+        The sorted day indices (see day_index) of the days in each split.
+        """
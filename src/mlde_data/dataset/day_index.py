@@ -0,0 +1,53 @@
+"""
+Integer day indices for selecting splits of a dataset's times.
+
+Comparing cftime objects (e.g. with .dt.floor("D") and isin) is slow for the hundreds of thousands
+of timesteps in an hourly dataset so splits are worked out and selected using the number of whole
+days since 1970-01-01 (in the times' own calendar) instead.
+"""
+
+import cftime
+import numpy as np
+import xarray as xr
+
+UNITS = "days since 1970-01-01"
+
+
+def day_index(times) -> np.ndarray:
+    """
+    The whole number of days since 1970-01-01 of each of times (cftime objects or datetime64s).
+    """
+    times = np.asarray(times)
+    if times.size == 0:
+        return np.array([], dtype=np.int64)
+    if times.dtype.kind == "M":
+        return times.astype("datetime64[D]").astype(np.int64)
+    first = times.flat[0]
+    return np.floor(cftime.date2num(times, UNITS, calendar=first.calendar)).astype(
+        np.int64
+    )
+
+
+def day_times(days, calendar: str = "360_day") -> np.ndarray:
+    """
+    The (midnight) cftime datetimes of day indices.
+    """
+    return cftime.num2date(np.asarray(days), UNITS, calendar=calendar)
+
+
+def period_slice(time_da: xr.DataArray, period: list) -> slice:
+    """
+    Positions of the times within a [start, end] period given as date strings (inclusive, as for .sel).
+    """
+    return time_da.indexes["time"].slice_indexer(period[0], period[1])
+
+
+def split_indices(days: np.ndarray, split_days: np.ndarray) -> np.ndarray:
+    """
+    Positions in days of the ones that are in split_days (which must be sorted).
+    """
+    split_days = np.asarray(split_days)
+    positions = np.searchsorted(split_days, days)
+    found = positions < len(split_days)
+    found[found] = split_days[positions[found]] == days[found]
+    return np.flatnonzero(found)
@@ -0,0 +1,254 @@
+"""
+Extend a saved dataset with more ensemble members or variables.
+
+Only the new data is read: the new members (or variables) are split using the days already in the
+dataset's stored splits, staged locally, then appended to each split's zarr store and their
+statistics merged with (rather than recalculated along with) the stored ones. Splits already
+extended by an earlier, failed run of the same extension are skipped.
+"""
+
+import copy
+import logging
+import numpy as np
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import xarray as xr
+import yaml
+
+from mlde_utils import DatasetMetadata
+
+from . import create, merge_statistics, rechunk
+from .day_index import day_index
+from .variable_store import VIEW_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+
+def _split_dirs(dataset_dir: Path, var_type: str) -> dict:
+    return {
+        path.parent.name: path.parent
+        for path in sorted(Path(dataset_dir).glob(f"*/{var_type}.zarr"))
+    }
+
+
+def stored_split_days(dataset_dir: Path) -> dict:
+    """
+    The days in each of the splits of a saved dataset.
+    """
+    for var_type in ["predictands", "predictors"]:
+        split_days = {}
+        for split, split_dir in _split_dirs(dataset_dir, var_type).items():
+            with xr.open_zarr(split_dir / f"{var_type}.zarr") as split_ds:
+                split_days[split] = np.unique(day_index(split_ds["time"].values))
+        if len(split_days) > 0:
+            return split_days
+    raise ValueError(f"No splits saved in {dataset_dir}")
+
+
+def _drop_conflicts(a: dict, b: dict) -> dict:
+    return {k: v for k, v in a.items() if k not in b or b[k] == v} | {
+        k: v for k, v in b.items() if k not in a
+    }
+
+
+def _check_same(name: str, stored: xr.DataArray, new: xr.DataArray, path: Path):
+    if not np.array_equal(stored.values, new.values):
+        raise ValueError(f"{name} of new data do not match those in {path}")
+
+
+def _already_added(path: Path, new_ds: xr.Dataset, dim: str) -> bool:
+    """
+    Whether the split store at path already holds new_ds, i.e. an earlier run that failed part-way
+    got as far as adding it.
+
+    Raise if the store holds only some of new_ds or different data under the same names as adding
+    them again would duplicate them.
+    """
+    if not path.exists():
+        return False
+    with xr.open_zarr(path) as stored_ds:
+        if dim == "ensemble_member":
+            names = list(new_ds["ensemble_member"].values)
+            stored = set(stored_ds["ensemble_member"].values)
+        else:
+            names = list(new_ds.data_vars)
+            stored = set(stored_ds.data_vars)
+        added = sorted(stored & set(names))
+        if len(added) == 0:
+            return False
+        if len(added) != len(names):
+            raise ValueError(
+                f"{path} already has {added} of {names} (partly extended by an earlier run)"
+            )
+        if dim == "ensemble_member":
+            stored_ds = stored_ds.sel(ensemble_member=names)
+        for name in new_ds.data_vars:
+            if not stored_ds[name].variable.equals(new_ds[name].variable):
+                raise ValueError(
+                    f"{path} already has {added} but with different {name} data"
+                )
+    return True
+
+
+def _replace(src: Path, dst: Path) -> None:
+    """
+    Replace the store at dst with the one at src.
+
+    A run interrupted part-way leaves src in place to be moved on the next one.
+    """
+    old = dst.with_name(f".{dst.name}.old")
+    if dst.exists():
+        shutil.rmtree(old, ignore_errors=True)
+        dst.rename(old)
+    src.rename(dst)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _write_split(
+    path: Path, new_ds: xr.Dataset, new_stats: xr.Dataset, var_type: str, dim: str
+) -> None:
+    """
+    Append new_ds to the split store at path, along ensemble_member when adding members or as new
+    variables, and merge new_stats into the split's statistics.
+
+    The merged statistics are written next to the stored ones before appending and only swapped in
+    afterwards so a split that an earlier run failed part-way through can be completed by skipping
+    the data it already appended.
+    """
+    stats_path = path.with_name(f"{var_type}_stats.zarr")
+    merged_stats_path = path.with_name(f".{var_type}_stats.zarr.new")
+    if _already_added(path, new_ds, dim):
+        logger.info(f"{path} already extended")
+        if merged_stats_path.exists():
+            _replace(merged_stats_path, stats_path)
+        return
+    if not path.exists():
+        # the first variables of a var type
+        logger.info(f"Creating {path}")
+        new_stats.to_zarr(stats_path, mode="w")
+        new_ds.to_zarr(path, mode="w-")
+        return
+    with xr.open_zarr(stats_path) as stats:
+        stats = stats.load()
+
+    with xr.open_zarr(path) as stored_ds:
+        _check_same("Times", stored_ds["time"], new_ds["time"], path)
+        new_ds.attrs = _drop_conflicts(stored_ds.attrs, new_ds.attrs)
+        if dim == "ensemble_member":
+            new_ds = new_ds.drop_vars(
+                [
+                    name
+                    for name, variable in new_ds.variables.items()
+                    if "ensemble_member" not in variable.dims
+                ]
+            )
+            for variable in new_ds.variables.values():
+                # the stored encoding is used for the appended data
+                variable.encoding = {}
+            append = dict(append_dim="ensemble_member")
+            stats = merge_statistics(stats, new_stats)
+        else:
+            _check_same(
+                "Ensemble members",
+                stored_ds["ensemble_member"],
+                new_ds["ensemble_member"],
+                path,
+            )
+            new_ds = new_ds.drop_vars(
+                [name for name in new_ds.variables if name in stored_ds.variables]
+            )
+            append = dict(mode="a")
+            stats = xr.concat([stats, new_stats], dim="variable")
+
+    stats.to_zarr(merged_stats_path, mode="w")
+    logger.info(f"Extending {path}")
+    new_ds.to_zarr(path, **append)
+    _replace(merged_stats_path, stats_path)
+
+
+def extend(
+    dataset_name: str,
+    input_base_dir: Path,
+    base_dir: Path,
+    ensemble_members: list[str] = (),
+    variables: dict = None,
+) -> dict:
+    """
+    Add ensemble members and variables (lists of names by var type) to a saved dataset and return its new config.
+
+    New members are added for the dataset's existing variables and new variables for all its
+    (existing and new) members.
+    """
+    dsmeta = DatasetMetadata(dataset_name, base_dir=base_dir)
+    dataset_dir = dsmeta.path()
+    config = dsmeta.config()
+    variables = variables or {}
+    if any(dataset_dir.glob(f"*/*{VIEW_SUFFIX}")):
+        raise ValueError(
+            "Extending a dataset saved as views of a variable store is not supported"
+        )
+    existing = set(config["ensemble_members"]) & set(ensemble_members)
+    for var_type, var_names in variables.items():
+        existing |= set(config[var_type]["variables"]) & set(var_names)
+    if len(existing) > 0:
+        raise ValueError(f"{dataset_name} already has {sorted(existing)}")
+
+    split_sets = stored_split_days(dataset_dir)
+
+    steps = []
+    if len(ensemble_members) > 0:
+        members_config = copy.deepcopy(config)
+        members_config["ensemble_members"] = list(ensemble_members)
+        steps.append(("ensemble_member", members_config))
+    config["ensemble_members"] = config["ensemble_members"] + list(ensemble_members)
+    if any(len(var_names) > 0 for var_names in variables.values()):
+        variables_config = copy.deepcopy(config)
+        for var_type in ["predictands", "predictors"]:
+            variables_config[var_type]["variables"] = list(variables.get(var_type, []))
+            config[var_type]["variables"] = config[var_type]["variables"] + list(
+                variables.get(var_type, [])
+            )
+        steps.append(("variable", variables_config))
+
+    # the new data goes in stores of its own first so nothing is added to the dataset until all of
+    # it has been read and a failure while reading (by far the longest part) leaves the dataset as
+    # it was. A failure while adding it can be recovered from by running the same extension again.
+    with tempfile.TemporaryDirectory(
+        prefix="mlde-extend-", dir=os.getenv("TMPDIR")
+    ) as stage_dir:
+        staged = []
+        for dim, step_config in steps:
+            new_splits, new_stats = create(
+                step_config, input_base_dir, split_sets=split_sets
+            )
+            for var_type, var_type_splits in new_splits.items():
+                for split, split_ds in var_type_splits.items():
+                    staged_path = Path(stage_dir) / dim / split / f"{var_type}.zarr"
+                    logger.info(f"Staging {var_type} {split} in {staged_path}")
+                    rechunk(split_ds, var_type).to_zarr(staged_path)
+                    new_stats[var_type][split].to_zarr(
+                        staged_path.with_name(f"{var_type}_stats.zarr")
+                    )
+                    staged.append((dim, var_type, split, staged_path))
+
+        for dim, var_type, split, staged_path in staged:
+            with (
+                xr.open_zarr(staged_path) as new_ds,
+                xr.open_zarr(
+                    staged_path.with_name(f"{var_type}_stats.zarr")
+                ) as new_stats,
+            ):
+                _write_split(
+                    dataset_dir / split / f"{var_type}.zarr",
+                    new_ds,
+                    new_stats.load(),
+                    var_type,
+                    dim,
+                )
+
+    # the config is only updated once all the data has been added
+    with open(dsmeta.config_path(), "w") as f:
+        yaml.dump(config, f)
+    return config
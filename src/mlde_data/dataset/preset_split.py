@@ -1,14 +1,17 @@
 from collections import defaultdict
 import logging
 from mlde_utils import DATA_PATH
+import numpy as np
 import xarray as xr
 
+from .day_index import day_index
+
 logger = logging.getLogger(__name__)
 
 
 class PresetSplit:
     """
-    Implements a split strategy that returns the dates used by a pre-saved set of splits. The splits are expected to be saved as netCDF files in `DATA_PATH/splits/{preset_name}/{split}.nc`, where `{preset_name}` is the name of the preset (e.g. the name of another dataset). Each netCDF split file should contain a single variable "time" which contains the floor of the time dimension in that split.
+    Implements a split strategy that returns the dates used by a pre-saved set of splits. The splits are expected to be saved as netCDF files in `DATA_PATH/splits/{preset_name}/{split}.nc`, where `{preset_name}` is the name of the preset (e.g. the name of another dataset). Each netCDF split file should contain a single variable "time" which contains the floor of the time dimension in that split. The days of each split that are in the given times are returned as day indices (see day_index).
     """
 
     def __init__(
@@ -17,23 +20,35 @@ class PresetSplit:
     ) -> None:
         self.preset_name = preset_name
 
-    def run(self, time_da: xr.DataArray) -> dict[str, xr.DataArray]:
-        preset_path = (
-            DATA_PATH / "preset-dataset-splits" / self.preset_name
-        ).absolute()
+    @property
+    def preset_path(self):
+        return (DATA_PATH / "preset-dataset-splits" / self.preset_name).absolute()
+
+    def years(self) -> list[int]:
+        """
+        The project years (December to November) of the days in the preset's splits.
+        """
+        years = set()
+        for split_path in self.preset_path.glob("*.nc"):
+            with xr.open_dataset(split_path) as split_ds:
+                years.update(
+                    split_ds["time"].dt.year.values
+                    + (split_ds["time"].dt.month.values == 12)
+                )
+        return sorted(int(year) for year in years)
+
+    def run(self, time_da: xr.DataArray) -> dict[str, np.ndarray]:
+        preset_path = self.preset_path
         split_paths = preset_path.glob("*.nc")
+        days = np.unique(day_index(time_da["time"].values))
         splits = defaultdict()
         for split_path in split_paths:
             split_name = split_path.stem
-            preset_split_times = xr.open_dataset(split_path)["time"]
+            preset_split_days = day_index(xr.open_dataset(split_path)["time"].values)
 
-            # time_da = time_da["time"].dt.floor("D")
-            # split_times = time_da.where(time_da.isin(preset_split_times), drop=True)
-            split_times = preset_split_times.where(
-                preset_split_times.isin(time_da["time"].dt.floor("D")), drop=True
+            splits[split_name] = np.sort(
+                preset_split_days[np.isin(preset_split_days, days)]
             )
-
-            splits[split_name] = split_times
         assert len(splits) > 0, f"No splits found for preset {preset_path}"
 
         return splits
@@ -1,44 +1,34 @@
-import cftime
 from collections import defaultdict
 import logging
 import numpy as np
 import xarray as xr
 
 from .base_split import BaseSplit
+from .day_index import day_index, period_slice
 
 logger = logging.getLogger(__name__)
 
+SEASONS = ["DJF", "MAM", "JJA", "SON"]
+
 
 class RandomSeasonSplit(BaseSplit):
-    def run(self, time_da: xr.DataArray) -> dict[str, list[cftime.Datetime360Day]]:
+    def run(self, time_da: xr.DataArray) -> dict[str, np.ndarray]:
         rng = np.random.default_rng(seed=self.seed)
-
-        from xarray.groupers import SeasonResampler
+        days = day_index(time_da["time"].values)
 
         splits = defaultdict(list)
         for tp in self.time_periods:
-            tp_time_da = time_da.sel(time=slice(tp[0], tp[1]))
-            seasons = xr.merge(
-                [
-                    tp_time_da.resample(
-                        time=SeasonResampler(
-                            ["DJF", "MAM", "JJA", "SON"], drop_incomplete=False
-                        )
-                    )
-                    .min()
-                    .dt.floor("D"),
-                    tp_time_da.resample(
-                        time=SeasonResampler(
-                            ["DJF", "MAM", "JJA", "SON"], drop_incomplete=False
-                        )
-                    )
-                    .max()
-                    .dt.ceil("D"),
-                ]
-            )
-
-            for season, season_time_ds in seasons.groupby("time.season"):
-                nyears = len(season_time_ds["time"])
+            tp_days = np.unique(days[period_slice(time_da, tp)])
+            # in a 360 day calendar each season of each year is a block of 90 days starting on
+            # 1 Dec (DJF), 1 Mar (MAM), 1 Jun (JJA) or 1 Sep (SON)
+            season_years = (tp_days + 30) // 90
+
+            # seasons in the (alphabetical) order they used to be grouped by so seeds give the same splits
+            for season in sorted(SEASONS):
+                season_year_ids = np.unique(
+                    season_years[season_years % 4 == SEASONS.index(season)]
+                )
+                nyears = len(season_year_ids)
                 p = rng.permutation(nyears)
 
                 split_sizes = {
@@ -49,37 +39,12 @@ class RandomSeasonSplit(BaseSplit):
                 split_sizes["train"] = nyears - sum(split_sizes.values())
 
                 for split, split_size in split_sizes.items():
-                    split_times = np.unique(
-                        np.concatenate(
-                            [
-                                time_da.where(
-                                    (time_da.time >= season_time_ds["floor"][idx])
-                                    & (time_da.time < season_time_ds["ceil"][idx]),
-                                    drop=True,
-                                )
-                                .dt.floor("D")
-                                .values
-                                for idx in p[:split_size]
-                            ]
-                        )
-                    )
+                    split_times = tp_days[
+                        np.isin(season_years, season_year_ids[p[:split_size]])
+                    ]
 
                     splits[split].append(split_times)
                     p = p[split_size:]
                 assert len(p) == 0, "Some times were not assigned to a split"
 
         return {k: np.sort(np.concatenate(v)) for k, v in splits.items()}
-
-    def _season_start_date(self, season: str, year: int) -> cftime.Datetime360Day:
-        if season == "DJF":
-            return cftime.Datetime360Day(
-                year - 1, 12, 1, 0, 0, 0, 0, has_year_zero=True
-            )
-        elif season == "MAM":
-            return cftime.Datetime360Day(year, 3, 1, 0, 0, 0, 0, has_year_zero=True)
-        elif season == "JJA":
-            return cftime.Datetime360Day(year, 6, 1, 0, 0, 0, 0, has_year_zero=True)
-        elif season == "SON":
-            return cftime.Datetime360Day(year, 9, 1, 0, 0, 0, 0, has_year_zero=True)
-        else:
-            raise ValueError(f"Unknown season: {season}")
@@ -3,20 +3,24 @@ import logging
 import numpy as np
 import xarray as xr
 
-from .base_split import BaseSplit
+from .base_split import BaseSplit, period_years
+from .day_index import day_index, period_slice
 
 logger = logging.getLogger(__name__)
 
 
 class RandomSplit(BaseSplit):
-    def run(self, time_da: xr.DataArray) -> dict[str, xr.DataArray]:
+    def years(self) -> list[int]:
+        # run only splits the first time period
+        return period_years(self.time_periods[:1])
+
+    def run(self, time_da: xr.DataArray) -> dict[str, np.ndarray]:
         rng = np.random.default_rng(seed=self.seed)
+        days = day_index(time_da["time"].values)
 
         splits = defaultdict(list)
         for tp in self.time_periods:
-            tp_time_da = time_da.sel(time=slice(tp[0], tp[1]))
-
-            tc = np.unique(tp_time_da.dt.floor("D"))
+            tc = np.unique(days[period_slice(time_da, tp)])
 
             ntimes = len(tc)
 
@@ -0,0 +1,168 @@
+"""
+Write a dataset's splits to zarr without holding all its ensemble members in memory.
+
+Each split's store is first created from the metadata of the (lazily opened) source variables
+and then its data is filled in one (ensemble member, variable) region at a time. Regions are
+independent so can be written in parallel, and each worker only has a few chunks of one member's
+variable in memory at once.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import dask
+import logging
+import multiprocessing
+from pathlib import Path
+import xarray as xr
+
+from .. import fingerprint
+from . import (
+    _calculate_statistics,
+    _single_variable,
+    _split,
+    _split_years,
+    rechunk,
+)
+from .day_index import day_index, split_indices
+
+logger = logging.getLogger(__name__)
+
+
+def _var_config(config: dict, var_type: str) -> dict:
+    return {
+        k: config[var_type][k]
+        for k in ["resolution", "collection", "frequency", "domain"]
+    } | {"scenario": config["scenario"], "years": _split_years(config["split"])}
+
+
+def _select_split(ds, split_days):
+    return ds.isel(time=split_indices(day_index(ds["time"].values), split_days))
+
+
+def plan_splits(config: dict, input_base_dir: Path) -> dict:
+    """
+    The days in each split, from the times of the first predictand.
+    """
+    var_type = "predictands"
+    ds = _single_variable(
+        config["ensemble_members"][0],
+        config[var_type]["variables"][0],
+        input_base_dir,
+        **_var_config(config, var_type),
+    )
+    return _split(ds["time"], **config["split"])
+
+
+def split_template(
+    config: dict, var_type: str, split_days, input_base_dir: Path
+) -> xr.Dataset:
+    """
+    A lazy dataset of a split of the variables of var_type, chunked as it will be stored.
+    """
+    var_config = _var_config(config, var_type)
+    single_var_datasets = []
+    for var_name in config[var_type]["variables"]:
+        single_var_datasets.append(
+            fingerprint.concat(
+                [
+                    _single_variable(em, var_name, input_base_dir, **var_config)
+                    for em in config["ensemble_members"]
+                ],
+                dim="ensemble_member",
+                compat="no_conflicts",
+                combine_attrs="drop_conflicts",
+                join="exact",
+                data_vars="minimal",
+            )
+        )
+    var_type_ds = fingerprint.combine_by_coords(
+        single_var_datasets,
+        compat="no_conflicts",
+        combine_attrs="drop_conflicts",
+        join="exact",
+        data_vars="minimal",
+    )
+    return rechunk(_select_split(var_type_ds, split_days), var_type)
+
+
+def _write_region(
+    path: Path,
+    em_index: int,
+    em: str,
+    var_name: str,
+    split_days,
+    chunks: dict,
+    input_base_dir: Path,
+    var_config: dict,
+) -> None:
+    logger.info(f"Writing {var_name} for {em} to {path}")
+    # one chunk at a time so a worker's memory use does not grow with the data
+    with dask.config.set(scheduler="synchronous"):
+        da = _select_split(
+            _single_variable(em, var_name, input_base_dir, **var_config)[var_name],
+            split_days,
+        )
+        da = da.drop_vars(list(da.coords)).chunk(chunks)
+        da.encoding = {}
+        da.to_dataset(name=var_name).to_zarr(
+            path,
+            region={
+                "ensemble_member": slice(em_index, em_index + 1),
+                "time": slice(0, da.sizes["time"]),
+            },
+        )
+
+
+def write_split(
+    config: dict,
+    var_type: str,
+    split_days,
+    input_base_dir: Path,
+    path: Path,
+    workers: int = 1,
+) -> xr.Dataset:
+    """
+    Write a split of the variables of var_type to a zarr store at path and return its statistics.
+    """
+    template = split_template(config, var_type, split_days, input_base_dir)
+    # the small variables that are the same for all members (time_bnds, grid mappings etc.) are
+    # written along with the metadata, the data of the others is filled in below
+    for variable in template.variables.values():
+        if "ensemble_member" not in variable.dims:
+            variable.load()
+    logger.info(f"Creating {path}")
+    template.to_zarr(path, mode="w-", compute=False)
+
+    var_config = _var_config(config, var_type)
+    regions = [
+        (
+            path,
+            em_index,
+            em,
+            var_name,
+            split_days,
+            {dim: sizes[0] for dim, sizes in template[var_name].chunksizes.items()},
+            input_base_dir,
+            var_config,
+        )
+        for em_index, em in enumerate(config["ensemble_members"])
+        for var_name in config[var_type]["variables"]
+    ]
+    if workers == 1:
+        for region in regions:
+            _write_region(*region)
+    else:
+        # forking a process that already has threads (e.g. from dask or netCDF) can deadlock the workers
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+        ) as executor:
+            for future in [
+                executor.submit(_write_region, *region) for region in regions
+            ]:
+                future.result()
+
+    with xr.open_zarr(path) as split_ds:
+        return _calculate_statistics(
+            split_ds,
+            config[var_type]["variables"],
+            **config[var_type].get("stats", {"time_aggregation_factors": [1]}),
+        ).compute()
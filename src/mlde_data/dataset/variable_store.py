@@ -0,0 +1,136 @@
+"""
+A store of the split variables of datasets that is shared between them.
+
+Many datasets differ only in some of their predictors, so rather than each saving its own copy of
+every variable, each variable of a split is written once to a shared store under a key made from
+everything that determines its contents (the variable and its source, the ensemble members, the
+split and the chunking). A dataset's split then only holds a small view file for each var type
+listing the stores of its variables, which open_split assembles into the same dataset as a
+var type's zarr store.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import xarray as xr
+
+from .. import fingerprint
+from . import time_chunk_size
+
+VIEW_SUFFIX = ".view.json"
+
+
+def variable_key(config: dict, var_type: str, var_name: str, split: str) -> str:
+    """
+    Key of the store of a variable of a split of a dataset config.
+    """
+    var_type_config = config[var_type]
+    return hashlib.sha256(
+        json.dumps(
+            {
+                "variable": var_name,
+                "scenario": config["scenario"],
+                "source": {
+                    k: var_type_config[k]
+                    for k in ["collection", "domain", "resolution", "frequency"]
+                },
+                "ensemble_members": config["ensemble_members"],
+                "split": config["split"],
+                "split_name": split,
+                "time_chunk_size": time_chunk_size(var_type),
+            },
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+
+
+def variable_path(
+    store_dir: Path, config: dict, var_type: str, var_name: str, split: str
+) -> Path:
+    return (
+        Path(store_dir)
+        / var_name
+        / f"{variable_key(config, var_type, var_name, split)}.zarr"
+    )
+
+
+def stats_path(
+    store_dir: Path, config: dict, var_type: str, var_name: str, split: str
+) -> Path:
+    """
+    Path of the statistics of a variable of a split (which also depend on the config's stats options).
+    """
+    stats_config = config[var_type].get("stats", {"time_aggregation_factors": [1]})
+    stats_key = hashlib.sha256(
+        json.dumps(stats_config, sort_keys=True).encode()
+    ).hexdigest()[:16]
+    data_path = variable_path(store_dir, config, var_type, var_name, split)
+    return data_path.with_name(f"{data_path.stem}_stats_{stats_key}.zarr")
+
+
+def stats_loader(store_dir: Path, config: dict):
+    """
+    A function to load the statistics of a variable of a split from the store, if they are there, for dataset.create.
+    """
+
+    def load_stats(var_type: str, split: str, var_name: str) -> xr.Dataset | None:
+        path = stats_path(store_dir, config, var_type, var_name, split)
+        if not path.exists():
+            return None
+        with xr.open_zarr(path) as stats:
+            return stats.load()
+
+    return load_stats
+
+
+def split_variables(split_ds: xr.Dataset, variables: list[str]) -> dict:
+    """
+    Each of the variables of a split along with the variables that they share (time bounds, grid mappings etc).
+    """
+    shared = [name for name in split_ds.data_vars if name not in variables]
+    return {var_name: split_ds[[var_name] + shared] for var_name in variables}
+
+
+def view_path(split_dir: Path, var_type: str) -> Path:
+    return Path(split_dir) / f"{var_type}{VIEW_SUFFIX}"
+
+
+def write_view(path: Path, variable_paths: dict, relative_to: Path = None) -> None:
+    """
+    Write a view of the variables at variable_paths (stored relative to where the view will be published).
+    """
+    relative_to = Path(path).parent if relative_to is None else Path(relative_to)
+    Path(path).write_text(
+        json.dumps(
+            {
+                "variables": {
+                    var_name: os.path.relpath(variable_path, relative_to)
+                    for var_name, variable_path in variable_paths.items()
+                }
+            },
+            indent=2,
+        )
+    )
+
+
+def open_split(split_dir: Path, var_type: str) -> xr.Dataset:
+    """
+    Open the var type of a split of a dataset, whether saved as a zarr store or as a view of a variable store.
+    """
+    split_dir = Path(split_dir)
+    path = view_path(split_dir, var_type)
+    if not path.exists():
+        return xr.open_zarr(split_dir / f"{var_type}.zarr")
+
+    variables = json.loads(path.read_text())["variables"]
+    return fingerprint.combine_by_coords(
+        [
+            xr.open_zarr(split_dir / variable_path)
+            for variable_path in variables.values()
+        ],
+        compat="no_conflicts",
+        combine_attrs="drop_conflicts",
+        join="exact",
+        data_vars="minimal",
+    )
@@ -0,0 +1,230 @@
+"""
+Progress monitoring for moo select extracts.
+
+moo select writes pp files into the target directory as fields are recalled, so progress can
+be followed by watching that directory. Fields are counted from the fortran record markers
+of each pp file rather than by loading it, so polling a large extract is cheap.
+"""
+
+from dataclasses import asdict, dataclass
+import json
+import logging
+import os
+from pathlib import Path
+import struct
+import subprocess
+import time
+
+logger = logging.getLogger(__name__)
+
+MB = 1000**2
+
+
+def _read_record_length(pp_file, offset: int) -> int:
+    pp_file.seek(offset)
+    return struct.unpack(">i", pp_file.read(4))[0]
+
+
+def count_pp_fields(filepath: Path, offset: int = 0) -> tuple[int, int]:
+    """
+    Count the complete fields in a pp file starting from byte offset.
+
+    Each field is a header record followed by a data record, each wrapped in 4 byte length
+    markers. A field that is still being written is not counted.
+    Returns the number of fields found and the offset just after the last complete field.
+    """
+    size = os.path.getsize(filepath)
+    nfields = 0
+    with open(filepath, "rb") as pp_file:
+        while offset + 4 <= size:
+            data_offset = offset + 4 + _read_record_length(pp_file, offset) + 4
+            if data_offset + 4 > size:
+                break
+            field_end = data_offset + 4 + _read_record_length(pp_file, data_offset) + 4
+            if field_end > size:
+                break
+            nfields += 1
+            offset = field_end
+    return nfields, offset
+
+
+@dataclass
+class ProgressSnapshot:
+    fields: int
+    bytes: int
+    elapsed: float
+    expected_fields: int | None = None
+
+    @property
+    def rate(self) -> float:
+        """Bytes per second received so far."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.bytes / self.elapsed
+
+    @property
+    def eta(self) -> float | None:
+        """Seconds until all the expected fields have arrived at the current field rate."""
+        if self.expected_fields is None or self.fields == 0:
+            return None
+        remaining = max(self.expected_fields - self.fields, 0)
+        return remaining * self.elapsed / self.fields
+
+    def __str__(self):
+        if self.expected_fields is None:
+            fields = f"{self.fields} fields"
+        else:
+            fields = f"{self.fields}/{self.expected_fields} fields"
+        eta = "unknown" if self.eta is None else f"{self.eta / 60:.1f} minutes"
+        return (
+            f"{fields}, {self.bytes / MB:.1f} MB, {self.rate / MB:.2f} MB/s, ETA {eta}"
+        )
+
+
+class ExtractProgress:
+    """
+    Tracks the pp fields arriving in an extract directory.
+    """
+
+    def __init__(self, pp_dirpath: Path, expected_fields: int | None = None):
+        self.pp_dirpath = Path(pp_dirpath)
+        self.expected_fields = expected_fields
+        self.start_time = time.monotonic()
+        self.last_change_time = self.start_time
+        # nothing arrives until moose has recalled the data from tape, which can take hours
+        self.first_data_time = None
+        # per file: (bytes scanned up to, fields found in those bytes)
+        self._scanned = {}
+        self._latest = None
+
+    def poll(self) -> ProgressSnapshot:
+        nbytes = 0
+        nfields = 0
+        for pp_filepath in sorted(self.pp_dirpath.glob("*.pp")):
+            try:
+                offset, file_fields = self._scanned.get(pp_filepath, (0, 0))
+                new_fields, offset = count_pp_fields(pp_filepath, offset)
+                file_bytes = pp_filepath.stat().st_size
+            except (FileNotFoundError, struct.error):
+                # file moved or truncated underneath us, pick it up on the next poll
+                continue
+            file_fields += new_fields
+            self._scanned[pp_filepath] = (offset, file_fields)
+            nbytes += file_bytes
+            nfields += file_fields
+
+        now = time.monotonic()
+        snapshot = ProgressSnapshot(
+            fields=nfields,
+            bytes=nbytes,
+            elapsed=now - self.start_time,
+            expected_fields=self.expected_fields,
+        )
+        if self._latest is None or (snapshot.bytes, snapshot.fields) != (
+            self._latest.bytes,
+            self._latest.fields,
+        ):
+            self.last_change_time = now
+        if self.first_data_time is None and snapshot.bytes > 0:
+            self.first_data_time = now
+        self._latest = snapshot
+        return snapshot
+
+    def stalled_for(self) -> float:
+        """Seconds since any new data arrived (0 until the first data has arrived)."""
+        if self.first_data_time is None:
+            return 0.0
+        return time.monotonic() - self.last_change_time
+
+    def waiting_for(self) -> float:
+        """Seconds spent waiting for the first data to arrive (0 once it has)."""
+        if self.first_data_time is not None:
+            return 0.0
+        return time.monotonic() - self.start_time
+
+
+@dataclass
+class ExtractAttempt:
+    returncode: int
+    fields: int
+    bytes: int
+    duration: float
+    stalled: bool = False
+    stdout: str = ""
+    stderr: str = ""
+
+
+def run_monitored(
+    cmd: list,
+    pp_dirpath: Path,
+    expected_fields: int | None = None,
+    interval: float = 30.0,
+    stall_timeout: float | None = None,
+    label: str = "extract",
+    recall_timeout: float | None = None,
+) -> ExtractAttempt:
+    """
+    Run an extract command, logging progress in pp_dirpath every interval seconds.
+
+    If stall_timeout is set, the command is terminated once data has started arriving but no new
+    data has arrived for that long. The wait for the first data (while the data is recalled from
+    tape) is only limited by recall_timeout, if set.
+    """
+    progress = ExtractProgress(pp_dirpath, expected_fields=expected_fields)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stalled = False
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=interval)
+            break
+        except subprocess.TimeoutExpired:
+            snapshot = progress.poll()
+            logger.info(f"{label}: {snapshot}")
+            reason = None
+            if stall_timeout is not None and progress.stalled_for() > stall_timeout:
+                reason = f"no new data for {progress.stalled_for():.0f}s"
+            elif recall_timeout is not None and progress.waiting_for() > recall_timeout:
+                reason = f"no data after {progress.waiting_for():.0f}s"
+            if reason is not None:
+                logger.warning(f"{label}: {reason}, stopping")
+                stalled = True
+                process.terminate()
+                stdout, stderr = process.communicate()
+                break
+
+    snapshot = progress.poll()
+    logger.info(f"{label}: finished with {snapshot}")
+    return ExtractAttempt(
+        returncode=process.returncode,
+        fields=snapshot.fields,
+        bytes=snapshot.bytes,
+        duration=snapshot.elapsed,
+        stalled=stalled,
+        stdout=stdout.decode("utf8"),
+        stderr=stderr.decode("utf8"),
+    )
+
+
+def write_metrics(
+    filepath: Path, attempts: list[ExtractAttempt], expected_fields=None, **info
+) -> dict:
+    """
+    Record the outcome of an extract (across all its attempts) as JSON.
+    """
+    final = attempts[-1]
+    metrics = dict(
+        **info,
+        bytes=final.bytes,
+        fields=final.fields,
+        expected_fields=expected_fields,
+        duration=sum(attempt.duration for attempt in attempts),
+        mb_per_s=(final.bytes / MB / final.duration if final.duration > 0 else 0.0),
+        retries=len(attempts) - 1,
+        succeeded=final.returncode == 0,
+        attempts=[
+            {k: v for k, v in asdict(attempt).items() if k not in ["stdout", "stderr"]}
+            for attempt in attempts
+        ],
+    )
+    Path(filepath).write_text(json.dumps(metrics, indent=2))
+    return metrics
@@ -0,0 +1,180 @@
+"""
+Cheap fingerprints of dataset variables for consistency checks between files.
+
+Comparing the variables shared by a set of files with full equality means reading every one of
+them from every file. A fingerprint instead combines a variable's dims, shape, dtype and
+attributes with its values at a handful of evenly spaced positions (or all of its values if it
+is small), which is enough to catch files on a different grid or with different metadata.
+
+Datasets whose coordinates all have the same fingerprint can also be concatenated or combined
+without xarray comparing their other shared variables element by element.
+"""
+
+import cftime
+import hashlib
+import logging
+import numpy as np
+import xarray as xr
+
+logger = logging.getLogger(__name__)
+
+# variables at most this big are hashed in full
+FULL_HASH_MAX_BYTES = 2**16
+# number of positions sampled along each dimension of larger variables
+SAMPLES_PER_DIM = 4
+
+
+def _sample(variable: xr.Variable) -> np.ndarray:
+    if variable.nbytes <= FULL_HASH_MAX_BYTES:
+        return variable.values
+    indexers = {
+        dim: np.unique(np.linspace(0, size - 1, SAMPLES_PER_DIM).astype(int))
+        for dim, size in variable.sizes.items()
+    }
+    return variable.isel(indexers).values
+
+
+def _values_bytes(values: np.ndarray) -> bytes:
+    if values.dtype == object:
+        # e.g. cftime datetimes
+        return repr(values.tolist()).encode()
+    return np.ascontiguousarray(values).tobytes()
+
+
+def variable_fingerprint(variable: xr.Variable) -> str:
+    """
+    Fingerprint of a variable's metadata and a sample of its values.
+    """
+    fingerprint = hashlib.sha1()
+    fingerprint.update(
+        repr(
+            (
+                variable.dims,
+                variable.shape,
+                str(variable.dtype),
+                sorted((k, str(v)) for k, v in variable.attrs.items()),
+            )
+        ).encode()
+    )
+    fingerprint.update(_values_bytes(_sample(variable)))
+    return fingerprint.hexdigest()
+
+
+def dataset_fingerprints(ds: xr.Dataset, exclude_dim: str | None = None) -> dict:
+    """
+    Fingerprints of the variables in a dataset, leaving out any that span exclude_dim.
+    """
+    return {
+        name: variable_fingerprint(variable)
+        for name, variable in ds.variables.items()
+        if exclude_dim is None or exclude_dim not in variable.dims
+    }
+
+
+def check_consistent(datasets: list[xr.Dataset], dim: str, labels=None) -> None:
+    """
+    Check that datasets about to be concatenated along dim agree on all the variables that do not span dim.
+
+    Raises a ValueError naming the first mismatched variable.
+    """
+    if labels is None:
+        labels = list(range(len(datasets)))
+    expected = dataset_fingerprints(datasets[0], exclude_dim=dim)
+    for label, ds in zip(labels[1:], datasets[1:]):
+        fingerprints = dataset_fingerprints(ds, exclude_dim=dim)
+        if fingerprints.keys() != expected.keys():
+            raise ValueError(
+                f"{label} has variables {sorted(fingerprints)} not along {dim} but {labels[0]} has {sorted(expected)}"
+            )
+        for name, fingerprint in fingerprints.items():
+            if fingerprint != expected[name]:
+                raise ValueError(f"{name} differs between {labels[0]} and {label}")
+    logger.debug(f"{len(datasets)} datasets consistent along {dim}")
+
+
+def _coordinate_values(variable: xr.Variable) -> np.ndarray:
+    values = variable.values
+    if (
+        values.dtype == object
+        and values.size > 0
+        and hasattr(values.flat[0], "calendar")
+    ):
+        # cftime datetimes are much quicker to hash as numbers
+        return cftime.date2num(
+            values, "seconds since 1970-01-01", calendar=values.flat[0].calendar
+        )
+    return values
+
+
+def coordinate_fingerprint(ds: xr.Dataset, exclude_dim: str | None = None) -> str:
+    """
+    Fingerprint of all the values and metadata of a dataset's coordinates (other than those along exclude_dim) and of its grid mappings.
+
+    Unlike the fingerprints of other variables, coordinates are hashed in full as they are small and
+    already in memory.
+    """
+    fingerprint = hashlib.sha1()
+    for name in sorted(ds.coords):
+        variable = ds.coords[name].variable
+        if exclude_dim is not None and exclude_dim in variable.dims:
+            continue
+        fingerprint.update(
+            repr(
+                (
+                    name,
+                    variable.dims,
+                    str(variable.dtype),
+                    sorted((k, str(v)) for k, v in variable.attrs.items()),
+                )
+            ).encode()
+        )
+        fingerprint.update(_values_bytes(_coordinate_values(variable)))
+    grid_mappings = {
+        variable.attrs["grid_mapping"]
+        for variable in ds.variables.values()
+        if "grid_mapping" in variable.attrs
+    }
+    for name in sorted(grid_mappings):
+        attrs = ds[name].attrs if name in ds.variables else {}
+        fingerprint.update(
+            repr((name, sorted((k, str(v)) for k, v in attrs.items()))).encode()
+        )
+    return fingerprint.hexdigest()
+
+
+def _same_coordinates(datasets: list[xr.Dataset], exclude_dim: str | None = None):
+    fingerprints = {coordinate_fingerprint(ds, exclude_dim) for ds in datasets}
+    if len(fingerprints) > 1:
+        logger.info(f"Coordinates differ, comparing {len(datasets)} datasets in full")
+    return len(fingerprints) == 1
+
+
+def concat(datasets: list[xr.Dataset], dim: str, **kwargs) -> xr.Dataset:
+    """
+    xr.concat datasets along dim, taking the variables not along dim from the first dataset when all their coordinates match.
+
+    Otherwise the datasets are concatenated with the given options (and so all their checks).
+    """
+    datasets = list(datasets)
+    if _same_coordinates(datasets, exclude_dim=dim):
+        kwargs |= dict(
+            compat="override", join="override", coords="minimal", data_vars="minimal"
+        )
+    return xr.concat(datasets, dim=dim, **kwargs)
+
+
+def combine_by_coords(datasets: list[xr.Dataset], **kwargs) -> xr.Dataset:
+    """
+    xr.combine_by_coords datasets, simply merging them (taking shared variables from the first) when all their coordinates match.
+
+    Otherwise the datasets are combined with the given options (and so all their checks).
+    """
+    datasets = list(datasets)
+    if _same_coordinates(datasets):
+        return xr.merge(
+            datasets,
+            compat="override",
+            join="override",
+            combine_attrs=kwargs.get("combine_attrs", "no_conflicts"),
+        )
+    return xr.combine_by_coords(datasets, **kwargs)
@@ -0,0 +1,309 @@
+"""
+A file-based queue of mlde-data commands for long-lived worker processes.
+
+Starting mlde-data means importing iris, cartopy, metpy, cdo etc. and loading target grids, which
+can take longer than a short job like creating a year of a daily predictor. Workers started by
+mlde-data serve pay for that once and then run the commands submitted to the queue (by
+mlde-data submit) in the same process.
+
+The queue is a directory: a job is a JSON file that moves from pending/ to running/ (the move is
+how a worker claims it) and then to done/ or failed/, and its output goes to logs/<job id>.log.
+While a job runs its worker records a heartbeat in the job file so that a job left in running/
+by a worker that died (OOM, node failure, scancel) can be found and put back in pending/.
+"""
+
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import asdict, dataclass
+import json
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+import socket
+import threading
+import time
+from typing import Callable
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# the mlde-data commands that may be submitted
+ALLOWED_COMMANDS = ["dataset", "moose", "variable"]
+
+STATES = ["pending", "running", "done", "failed"]
+
+# seconds between a worker's heartbeats while it runs a job
+HEARTBEAT_INTERVAL = 60
+# seconds without a heartbeat after which a job's worker is taken to be dead
+HEARTBEAT_TIMEOUT = 10 * 60
+
+
+@dataclass
+class Job:
+    id: str
+    command: list[str]
+    submitted: float
+    state: str = "pending"
+    worker: str = None
+    host: str = None
+    pid: int = None
+    started: float = None
+    heartbeat: float = None
+    finished: float = None
+    error: str = None
+    requeued: int = 0
+
+
+class JobQueue:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        for state in STATES + ["logs"]:
+            os.makedirs(self.path / state, exist_ok=True)
+
+    def _job_path(self, state: str, job_id: str) -> Path:
+        return self.path / state / f"{job_id}.json"
+
+    def _write(self, job: Job) -> None:
+        path = self._job_path(job.state, job.id)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(json.dumps(asdict(job)))
+        os.replace(tmp_path, path)
+
+    def log_path(self, job_id: str) -> Path:
+        return self.path / "logs" / f"{job_id}.log"
+
+    def submit(self, command: list[str]) -> Job:
+        if not command or command[0] not in ALLOWED_COMMANDS:
+            raise ValueError(
+                f"Only {', '.join(ALLOWED_COMMANDS)} commands can be queued, not {command}"
+            )
+        # ids sort in submission order so jobs are run first come, first served
+        job = Job(
+            id=f"{time.time_ns()}-{uuid.uuid4().hex[:8]}",
+            command=list(command),
+            submitted=time.time(),
+        )
+        self._write(job)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        for state in STATES:
+            try:
+                return Job(**json.loads(self._job_path(state, job_id).read_text()))
+            except FileNotFoundError:
+                continue
+        return None
+
+    def jobs(self, state: str) -> list[str]:
+        return sorted(
+            path.stem
+            for path in (self.path / state).glob("*.json")
+            if not path.name.startswith(".")
+        )
+
+    def claim(self, worker: str) -> Job | None:
+        """
+        Take the oldest pending job, if there is one, and mark it as running on worker.
+        """
+        for job_id in self.jobs("pending"):
+            running_path = self._job_path("running", job_id)
+            try:
+                # only one worker can move the file so only one gets the job
+                os.rename(self._job_path("pending", job_id), running_path)
+            except FileNotFoundError:
+                continue
+            job = Job(**json.loads(running_path.read_text()))
+            job.state = "running"
+            job.worker = worker
+            job.host = socket.gethostname()
+            job.pid = os.getpid()
+            job.started = time.time()
+            job.heartbeat = job.started
+            self._write(job)
+            return job
+        return None
+
+    def beat(self, job: Job) -> None:
+        """
+        Record that a running job's worker is still alive.
+        """
+        job.heartbeat = time.time()
+        self._write(job)
+
+    def finish(self, job: Job, error: BaseException = None) -> None:
+        running_path = self._job_path(job.state, job.id)
+        job.state = "done" if error is None else "failed"
+        job.finished = time.time()
+        if error is not None:
+            job.error = f"{type(error).__name__}: {error}"
+        self._write(job)
+        # already gone if the job was requeued because its worker seemed dead
+        running_path.unlink(missing_ok=True)
+
+    def requeue_dead(self, heartbeat_timeout: float = HEARTBEAT_TIMEOUT) -> list[Job]:
+        """
+        Put running jobs whose worker has died back in the queue. Returns the requeued jobs.
+
+        A worker is dead if its process is gone (only known for workers on this host) or it has
+        not recorded a heartbeat for heartbeat_timeout seconds.
+        """
+        requeued = []
+        for job_id in self.jobs("running"):
+            running_path = self._job_path("running", job_id)
+            try:
+                job = Job(**json.loads(running_path.read_text()))
+            except FileNotFoundError:
+                continue
+            if _worker_alive(job, heartbeat_timeout):
+                continue
+            # hidden from other workers and requeuers while it is rewritten as pending
+            requeue_path = running_path.with_name(f".{running_path.name}.requeue")
+            try:
+                os.rename(running_path, requeue_path)
+            except FileNotFoundError:
+                continue
+            logger.warning(f"Requeuing job {job.id}: worker {job.worker} is dead")
+            job = Job(
+                id=job.id,
+                command=job.command,
+                submitted=job.submitted,
+                requeued=job.requeued + 1,
+            )
+            self._write(job)
+            requeue_path.unlink()
+            requeued.append(job)
+        return requeued
+
+    def follow(
+        self,
+        job_id: str,
+        echo: Callable[[str], None],
+        poll_interval: float = 0.5,
+        timeout: float = None,
+    ) -> Job:
+        """
+        Pass the job's log to echo as it is written until the job has finished.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        position = 0
+        while True:
+            job = self.get(job_id)
+            if self.log_path(job_id).exists():
+                with open(self.log_path(job_id)) as f:
+                    f.seek(position)
+                    output = f.read()
+                    position = f.tell()
+                if output:
+                    echo(output)
+            if job is None or job.state in ["done", "failed"]:
+                return job
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"Job {job_id} has not finished after {timeout}s")
+            time.sleep(poll_interval)
+
+
+def run_job(queue: JobQueue, job: Job, run_fn: Callable[[list[str]], None]) -> None:
+    """
+    Run a job's command with run_fn, sending its logging and output to the job's log.
+    """
+    root_logger = logging.getLogger()
+    with open(queue.log_path(job.id), "a", buffering=1) as log:
+        handler = logging.StreamHandler(log)
+        handler.setFormatter(
+            logging.Formatter("%(levelname)s %(asctime)s: %(message)s")
+        )
+        root_logger.addHandler(handler)
+        stop_beating = threading.Event()
+        heart = threading.Thread(
+            target=_beat, args=(queue, job, stop_beating), daemon=True
+        )
+        heart.start()
+        try:
+            with redirect_stdout(log), redirect_stderr(log):
+                run_fn(job.command)
+        # typer and click exit with SystemExit, e.g. for bad arguments
+        except (Exception, SystemExit) as e:
+            logger.exception(f"Job {job.id} failed")
+            error = e
+        else:
+            error = None
+        finally:
+            # no heartbeat may rewrite the running job once it has finished
+            stop_beating.set()
+            heart.join()
+            root_logger.removeHandler(handler)
+        queue.finish(job, error)
+
+
+def _beat(queue: JobQueue, job: Job, stop: threading.Event) -> None:
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        queue.beat(job)
+
+
+def _worker_alive(job: Job, heartbeat_timeout: float) -> bool:
+    last_heard = job.heartbeat or job.started or job.submitted
+    if time.time() - last_heard > heartbeat_timeout:
+        return False
+    if job.host == socket.gethostname() and job.pid is not None:
+        try:
+            os.kill(job.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
+
+
+def work(
+    queue_path: Path,
+    run_fn: Callable[[list[str]], None],
+    poll_interval: float = 1.0,
+    idle_timeout: float = None,
+) -> None:
+    """
+    Keep running jobs from the queue until it has been empty for idle_timeout seconds (or forever).
+    """
+    queue = JobQueue(queue_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Worker {worker} serving {queue.path}")
+    idle_since = time.time()
+    while True:
+        queue.requeue_dead()
+        job = queue.claim(worker)
+        if job is None:
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                logger.info(f"Worker {worker} idle for {idle_timeout}s, stopping")
+                return
+            time.sleep(poll_interval)
+            continue
+        logger.info(f"Worker {worker} running job {job.id}: {' '.join(job.command)}")
+        run_job(queue, job, run_fn)
+        idle_since = time.time()
+
+
+def serve(
+    queue_path: Path,
+    run_fn: Callable[[list[str]], None],
+    workers: int = 1,
+    poll_interval: float = 1.0,
+    idle_timeout: float = None,
+) -> None:
+    """
+    Run jobs from the queue on workers processes (or in this one for a single worker).
+    """
+    if workers == 1:
+        work(queue_path, run_fn, poll_interval, idle_timeout)
+        return
+
+    # forking a process that already has threads (e.g. from dask or netCDF) can deadlock the workers
+    context = multiprocessing.get_context("forkserver")
+    processes = [
+        context.Process(
+            target=work, args=(queue_path, run_fn, poll_interval, idle_timeout)
+        )
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
@@ -0,0 +1,87 @@
+"""
+A lock between processes, possibly on different nodes, sharing a directory on NFS or a parallel
+filesystem.
+
+The lock is a directory rather than a flock since creating a directory is atomic on those
+filesystems whereas locks between nodes are not reliable there.
+"""
+
+from contextlib import contextmanager
+import logging
+import os
+from pathlib import Path
+import shutil
+import time
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+# how long a lock can be held before it is assumed its holder died
+LOCK_STALE_AFTER = 10 * 60
+
+
+@contextmanager
+def dir_lock(lock_path: Path, stale_after: float = LOCK_STALE_AFTER):
+    """
+    Hold the lock at lock_path, waiting for it if needed.
+
+    A lock that has not been refreshed for stale_after seconds is broken.
+    """
+    lock_path = Path(lock_path)
+    os.makedirs(lock_path.parent, exist_ok=True)
+    while True:
+        try:
+            os.mkdir(lock_path)
+            break
+        except FileExistsError:
+            try:
+                lock_stat = lock_path.stat()
+            except FileNotFoundError:
+                continue
+            if time.time() - lock_stat.st_mtime > stale_after:
+                _break_lock(lock_path, lock_stat)
+                continue
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        shutil.rmtree(lock_path, ignore_errors=True)
+
+
+def _break_lock(lock_path: Path, lock_stat: os.stat_result) -> None:
+    """
+    Remove the stale lock last seen with lock_stat.
+
+    The lock is first renamed to a unique name so only one of the waiters breaking it at the same
+    time can succeed. Removing it in place would let a slower waiter remove the lock a faster one
+    had just taken again.
+    """
+    broken_path = lock_path.with_name(f"{lock_path.name}.stale-{uuid4().hex}")
+    try:
+        os.rename(lock_path, broken_path)
+    except FileNotFoundError:
+        # another waiter broke it first
+        return
+    broken_stat = broken_path.stat()
+    if (broken_stat.st_ino, broken_stat.st_mtime) != (
+        lock_stat.st_ino,
+        lock_stat.st_mtime,
+    ):
+        # another waiter broke it and took the lock again before the rename so give it back
+        try:
+            os.rename(broken_path, lock_path)
+            return
+        except OSError:
+            logger.warning(
+                f"Could not give back lock {lock_path} taken while breaking it"
+            )
+    else:
+        logger.warning(f"Broke stale lock {lock_path}")
+    shutil.rmtree(broken_path, ignore_errors=True)
+
+
+def refresh_lock(lock_path: Path) -> None:
+    """
+    Show that a long-held lock is still in use.
+    """
+    os.utime(lock_path)
@@ -0,0 +1,239 @@
+"""
+Run manifests so that interrupted etl runs can be resumed.
+
+A manifest records the state of each task of a run (a stage such as extract or create for one
+variable, ensemble member and year): pending, running, done (along with the sizes and modification
+times of its outputs) or failed (with the error). Running the same command again with the same
+manifest skips the tasks that are done and whose outputs are still in place and unchanged.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import time
+from typing import Callable
+import uuid
+
+from .locking import dir_lock
+
+logger = logging.getLogger(__name__)
+
+STATES = ["pending", "running", "done", "failed"]
+
+
+@dataclass(frozen=True)
+class Task:
+    stage: str
+    variable: str
+    ensemble_member: str
+    year: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.stage}/{self.variable}/{self.ensemble_member}/{self.year}"
+
+    def __str__(self):
+        return self.key
+
+
+def output_stat(path: Path) -> dict:
+    """
+    Total size and latest modification time of a file or of all the files within a directory.
+
+    Cheap enough (no reading of the data) to record for every output, including whole pp extract
+    directories, and to check again on resuming.
+    """
+    path = Path(path)
+    if path.is_dir():
+        filepaths = [
+            Path(dirpath) / filename
+            for dirpath, _, filenames in os.walk(path)
+            for filename in filenames
+        ]
+    else:
+        filepaths = [path]
+    stats = [filepath.stat() for filepath in filepaths]
+    return {
+        "bytes": sum(stat.st_size for stat in stats),
+        "mtime_ns": max((stat.st_mtime_ns for stat in stats), default=0),
+    }
+
+
+class RunManifest:
+    """
+    The tasks of an etl run and their states, kept in a JSON file.
+
+    Updates are guarded by a lock directory (see locking) so several worker processes, possibly on
+    different nodes, can make them at once. The file is only ever replaced whole so it can be read
+    without the lock.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    @property
+    def lock_path(self) -> Path:
+        return self.path.with_name(f".{self.path.name}.lockdir")
+
+    def _read(self) -> dict:
+        if self.path.exists():
+            return json.loads(self.path.read_text())
+        return {}
+
+    @contextmanager
+    def _tasks(self):
+        """
+        The tasks to update, written back once done.
+        """
+        with dir_lock(self.lock_path):
+            tasks = self._read()
+            yield tasks
+            tmp_path = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}.tmp")
+            try:
+                tmp_path.write_text(json.dumps(tasks, indent=2))
+                os.replace(tmp_path, self.path)
+            finally:
+                if tmp_path.exists():
+                    os.remove(tmp_path)
+
+    def _update(self, task: Task, **record) -> None:
+        with self._tasks() as tasks:
+            entry = tasks.setdefault(
+                task.key,
+                dict(
+                    stage=task.stage,
+                    variable=task.variable,
+                    ensemble_member=task.ensemble_member,
+                    year=task.year,
+                ),
+            )
+            entry.update(record, updated=time.time())
+
+    def plan(self, tasks: list[Task]) -> None:
+        """
+        Add tasks that are not yet in the manifest as pending.
+        """
+        with self._tasks() as entries:
+            for task in tasks:
+                entries.setdefault(
+                    task.key,
+                    dict(
+                        stage=task.stage,
+                        variable=task.variable,
+                        ensemble_member=task.ensemble_member,
+                        year=task.year,
+                        state="pending",
+                        updated=time.time(),
+                    ),
+                )
+
+    def entry(self, task: Task) -> dict | None:
+        return self._read().get(task.key)
+
+    def entries(self) -> list[dict]:
+        return list(self._read().values())
+
+    def is_done(self, task: Task) -> bool:
+        """
+        Whether a task has completed and all of its outputs are still there, unchanged since.
+        """
+        entry = self.entry(task)
+        if entry is None or entry["state"] != "done":
+            return False
+        for output in entry["outputs"]:
+            if not os.path.exists(output):
+                return False
+            # manifests written before output stats were recorded only have the paths
+            if "output_stats" in entry and output_stat(output) != entry[
+                "output_stats"
+            ].get(output):
+                logger.info(f"{output} has changed since {task} was done")
+                return False
+        return True
+
+    def start(self, task: Task) -> None:
+        self._update(
+            task,
+            state="running",
+            host=socket.gethostname(),
+            pid=os.getpid(),
+            started=time.time(),
+            error=None,
+        )
+
+    def done(self, task: Task, outputs: list[Path] = None) -> None:
+        outputs = [str(output) for output in outputs or []]
+        self._update(
+            task,
+            state="done",
+            outputs=outputs,
+            output_stats={output: output_stat(output) for output in outputs},
+            finished=time.time(),
+        )
+
+    def failed(self, task: Task, error: Exception) -> None:
+        self._update(
+            task,
+            state="failed",
+            error=f"{type(error).__name__}: {error}",
+            finished=time.time(),
+        )
+
+    def run(self, tasks: list[Task], fn: Callable, force: bool = False, **kwargs):
+        """
+        Run fn(**kwargs), which carries out the given tasks, unless they are all done already.
+
+        fn should return the paths of its outputs: either a list shared by all the tasks or a dict of
+        lists by task variable. Returns what fn returned, or None if it was skipped.
+        """
+        if not force and all(self.is_done(task) for task in tasks):
+            logger.info(f"Skipping {', '.join(map(str, tasks))}: already done")
+            return None
+
+        for task in tasks:
+            self.start(task)
+        try:
+            outputs = fn(**kwargs)
+        except Exception as e:
+            for task in tasks:
+                self.failed(task, e)
+            raise
+
+        for task in tasks:
+            if isinstance(outputs, dict):
+                task_outputs = outputs.get(task.variable, [])
+            else:
+                task_outputs = outputs
+            self.done(task, task_outputs)
+        return outputs
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        """
+        Number of tasks in each state for each stage.
+        """
+        summary = {}
+        for entry in self.entries():
+            stage_summary = summary.setdefault(
+                entry["stage"], {state: 0 for state in STATES}
+            )
+            stage_summary[entry["state"]] += 1
+        return summary
+
+
+def run_tasks(
+    manifest: RunManifest | None,
+    tasks: list[Task],
+    fn: Callable,
+    force: bool = False,
+    **kwargs,
+):
+    """
+    Run fn through the manifest if there is one, otherwise just run it.
+    """
+    if manifest is None:
+        return fn(**kwargs)
+    return manifest.run(tasks, fn, force=force, **kwargs)
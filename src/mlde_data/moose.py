@@ -1,14 +1,19 @@
 from click import Path
+from concurrent.futures import Executor
+import functools
+import glob
 import iris
 from mlde_utils import VariableMetadata
 from ncdata.iris_xarray import cubes_to_xarray
 import numpy as np
+import operator
 import os
 import re
 import xarray as xr
 
 from . import RangeDict
 from .options import CollectionOption
+from .variable import SourceSelection
 
 
 class MoosePPVariableMetadata(VariableMetadata):
@@ -398,6 +403,13 @@ RIP_CODES = {
 }
 
 
+# number of timesteps in a (360-day) year of data
+FREQ2TIMELEN = {
+    "day": 360,
+    "1hr": 360 * 24,
+}
+
+
 def moose_path(variable, year, ensemble_member, frequency="day", collection="land-cpm"):
     if collection == "land-cpm":
         suite_id = SUITE_IDS[collection][ensemble_member][year]
@@ -412,6 +424,32 @@ def moose_path(variable, year, ensemble_member, frequency="day", collection="lan
         raise f"Unknown collection {collection}"
 
 
+def parse_query_value(value) -> set[int]:
+    """
+    Expand a value from a moo select query (e.g. 12, [1..11] or (500,850)) into the set of integers it matches.
+    """
+    value = str(value).strip()
+    range_match = re.fullmatch(r"\[(-?\d+)\.\.(-?\d+)\]", value)
+    if range_match:
+        start, end = map(int, range_match.groups())
+        return set(range(start, end + 1))
+    if value.startswith("(") and value.endswith(")"):
+        return {int(v) for v in value[1:-1].split(",") if v.strip()}
+    return {int(value)}
+
+
+def expected_field_count(variable, frequency="day"):
+    """
+    Number of pp fields a year's extract of a variable should contain.
+
+    Variables whose query does not pick out levels are assumed to be single level.
+    """
+    query_conditions = VARIABLE_CODES[variable]["query"]
+    nstash = len(parse_query_value(query_conditions["stash"]))
+    nlevels = len(parse_query_value(query_conditions.get("lblev", 0)))
+    return FREQ2TIMELEN[frequency] * nstash * nlevels
+
+
 def select_query(year, variable, frequency="day", collection="land-cpm"):
     query_conditions = VARIABLE_CODES[variable]["query"]
 
@@ -465,7 +503,7 @@ def remove_pressure(ds):
     return ds
 
 
-def load_cubes(pp_files, variable, collection, realize=False, constraints=None):
+def _variable_constraints(variable, collection, constraints=None):
     if constraints is None:
         constraints = []
 
@@ -479,7 +517,54 @@ def load_cubes(pp_files, variable, collection, realize=False, constraints=None):
 
     # seems iris.load doesn't work with empty list of constraints
     if len(constraints) == 0:
-        constraints = None
+        return None
+
+    # iris.load treats a list of constraints as alternatives but all of them should apply
+    return functools.reduce(operator.and_, constraints)
+
+
+def _coord_points_in(cube, coord_name, values):
+    # cubes without the coordinate are not affected by a selection on it
+    if not cube.coords(coord_name):
+        return True
+    return all(point in values for point in cube.coord(coord_name).points)
+
+
+def selection_constraints(selection: SourceSelection | None) -> list[iris.Constraint]:
+    """
+    Turn a selection of source fields and coordinate values into iris constraints.
+
+    Constraints are evaluated on each pp field as it is loaded so fields that are not selected are never decoded.
+    """
+    constraints = []
+    if not selection:
+        return constraints
+
+    if len(selection.drop_variables) > 0:
+        drop_variables = selection.drop_variables
+        constraints.append(
+            iris.Constraint(cube_func=lambda cube: cube.name() not in drop_variables)
+        )
+    for coord_name, values in selection.query.items():
+        constraints.append(
+            iris.Constraint(
+                cube_func=functools.partial(
+                    _coord_points_in, coord_name=coord_name, values=values
+                )
+            )
+        )
+
+    return constraints
+
+
+def load_cubes(
+    pp_files, variable, collection, realize=False, constraints=None, selection=None
+):
+    constraints = _variable_constraints(
+        variable,
+        collection,
+        (constraints or []) + selection_constraints(selection),
+    )
     cubes = iris.load(pp_files, constraints=constraints)
 
     if realize:
@@ -489,6 +574,64 @@ def load_cubes(pp_files, variable, collection, realize=False, constraints=None):
     return cubes
 
 
+def _load_raw_pp_file(pp_file, variable, collection, constraints=None):
+    """
+    Decode the individual fields of a single pp file.
+
+    Run in a worker process by load_cubes_parallel so must be importable at module level.
+    """
+    constraints = _variable_constraints(variable, collection, constraints)
+    cubes = iris.load_raw(pp_file, constraints=constraints)
+    for cube in cubes:
+        cube.data
+
+    return cubes
+
+
+def load_cubes_parallel(
+    pp_files, variable, collection, executor: Executor, constraints=None
+):
+    """
+    Like load_cubes (with realize=True) but decodes each pp file on the given executor.
+
+    Files are merged in sorted order so the result does not depend on which worker finishes first.
+    """
+    futures = [
+        executor.submit(_load_raw_pp_file, pp_file, variable, collection, constraints)
+        for pp_file in sorted(pp_files)
+    ]
+    raw_cubes = iris.cube.CubeList(
+        [cube for future in futures for cube in future.result()]
+    )
+
+    return raw_cubes.merge(unique=False)
+
+
+def _fix_cpm_grid_latitude_bounds(src_cubes, collection):
+    # bug in some data means the final grid_latitude bound is very large (1.0737418e+09)
+    for src_cube in src_cubes:
+        if (
+            collection == CollectionOption.cpm
+            and src_cube.coord("grid_latitude").has_bounds()
+        ):
+            bounds = np.copy(src_cube.coord("grid_latitude").bounds)
+            # make sure it really is much larger than expected (in case this gets fixed)
+            if bounds[-1][1] > 8.97:
+                bounds[-1][1] = 8.962849
+                src_cube.coord("grid_latitude").bounds = bounds
+
+
+def _cubes_to_dataset(src_cubes) -> xr.Dataset:
+    ds = cubes_to_xarray(src_cubes)
+    # for some reason cubes_to_xarray output is missing indexes on the coords
+    # this used to be avoided as saving cubes to netcdf and then re-opening with xarray didn't have this problem
+    # TODO: work out why much more memory is required by cubes_to_xarray compared to iris.save and xarray.open_dataset approach
+    for d in ds.dims:
+        ds[d] = ds[d].reindex()
+
+    return ds
+
+
 def open_pp_data(
     base_dir: Path,
     collection: str,
@@ -499,6 +642,7 @@ def open_pp_data(
     resolution: str,
     domain: str,
     year: int,
+    executor: Executor | None = None,
 ) -> xr.Dataset:
     input_moose_pp_varmeta = MoosePPVariableMetadata(
         base_dir=base_dir,
@@ -511,28 +655,22 @@ def open_pp_data(
         domain=domain,
     )
 
-    # realize the data (or something odd happens when saving to netcdf below)
-    src_cubes = load_cubes(
-        str(input_moose_pp_varmeta.pp_files_glob(year)),
-        variable,
-        collection,
-        realize=True,
-    )
-
-    # bug in some data means the final grid_latitude bound is very large (1.0737418e+09)
-    for src_cube in src_cubes:
-        if collection == CollectionOption.cpm:
-            bounds = np.copy(src_cube.coord("grid_latitude").bounds)
-            # make sure it really is much larger than expected (in case this gets fixed)
-            if bounds[-1][1] > 8.97:
-                bounds[-1][1] = 8.962849
-                src_cube.coord("grid_latitude").bounds = bounds
+    if executor is None:
+        # realize the data (or something odd happens when saving to netcdf below)
+        src_cubes = load_cubes(
+            str(input_moose_pp_varmeta.pp_files_glob(year)),
+            variable,
+            collection,
+            realize=True,
+        )
+    else:
+        src_cubes = load_cubes_parallel(
+            glob.glob(input_moose_pp_varmeta.pp_files_glob(year)),
+            variable,
+            collection,
+            executor,
+        )
 
-    ds = cubes_to_xarray(src_cubes)
-    # for some reason cubes_to_xarray output is missing indexes on the coords
-    # this used to be avoided as saving cubes to netcdf and then re-opening with xarray didn't have this problem
-    # TODO: work out why much more memory is required by cubes_to_xarray compared to iris.save and xarray.open_dataset approach
-    for d in ds.dims:
-        ds[d] = ds[d].reindex()
+    _fix_cpm_grid_latitude_bounds(src_cubes, collection)
 
-    return ds
+    return _cubes_to_dataset(src_cubes)
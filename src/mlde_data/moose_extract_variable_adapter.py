@@ -5,8 +5,10 @@ import numpy as np
 from pathlib import Path
 import xarray as xr
 
-from mlde_data.moose import SUITE_IDS, load_cubes
-from mlde_data.variable import SourceVariableConfig
+from mlde_data.actions.select_domain import extent_indexers
+from mlde_data.moose import SUITE_IDS, MoosePPVariableMetadata, load_cubes
+from mlde_data.staging import localize
+from mlde_data.variable import SourceSelection, SourceVariableConfig
 from mlde_data.options import CollectionOption
 
 
@@ -27,6 +29,9 @@ class MooseExtractVariableAdapter:
         scenario: str,
         year: int,
         base_dir: Path | None = None,
+        selection: SourceSelection | None = None,
+        stage_dir: Path | None = None,
+        yearly_extracts: bool = False,
     ):
         if defn.src_type != "moose":
             raise ValueError(
@@ -43,6 +48,9 @@ class MooseExtractVariableAdapter:
             scenario=scenario,
             year=year,
             base_dir=base_dir,
+            selection=selection,
+            stage_dir=stage_dir,
+            yearly_extracts=yearly_extracts,
         )
 
     def __init__(
@@ -56,6 +64,9 @@ class MooseExtractVariableAdapter:
         scenario: str,
         year: int,
         base_dir: Path | None = None,
+        selection: SourceSelection | None = None,
+        stage_dir: Path | None = None,
+        yearly_extracts: bool = False,
     ):
         self.collection = collection
         self.ensemble_member = ensemble_member
@@ -68,6 +79,13 @@ class MooseExtractVariableAdapter:
         if base_dir is None:
             base_dir = self.MASS_EXTRACTS_BASE_DIR
         self.base_dir = base_dir
+        # only load the fields and levels that will be used
+        self.selection = selection
+        # read any of the files that have been staged locally from there instead
+        self.stage_dir = stage_dir
+        # read the year's own extract made by `mlde-data moose extract --base-dir base_dir`
+        # rather than the extracts of whole suites in the MASS extracts layout
+        self.yearly_extracts = yearly_extracts
 
     def __eq__(self, other):
         if not isinstance(other, MooseExtractVariableAdapter):
@@ -86,6 +104,19 @@ class MooseExtractVariableAdapter:
 
     @property
     def _dirpath(self) -> Path:
+        if self.yearly_extracts:
+            return Path(
+                MoosePPVariableMetadata(
+                    base_dir=self.base_dir,
+                    collection=self.collection,
+                    scenario=self.scenario,
+                    ensemble_member=self.ensemble_member,
+                    variable=self.variable,
+                    frequency=self.frequency,
+                    resolution=self.resolution,
+                    domain=self.domain,
+                ).ppdata_dirpath(self.year)
+            )
         suite_id = SUITE_IDS[self.collection][self.ensemble_member][self.year]
         return self.base_dir / suite_id / self.variable / "data"
 
@@ -94,20 +125,23 @@ class MooseExtractVariableAdapter:
         return [f"*{self.year-1}12*.pp", f"*{self.year}*.pp"]
 
     @property
-    def _filepaths(self) -> list[Path]:
+    def filepaths(self) -> list[Path]:
         return [self._dirpath / fn for fn in self._filenames]
 
     def open(self) -> xr.Dataset:
         pdt1 = PartialDateTime(year=self.year - 1, month=12, day=1)
         pdt2 = PartialDateTime(year=self.year, month=12, day=1)
         year_constraint = iris.Constraint(time=lambda cell: pdt1 <= cell.point < pdt2)
+        extent = self.selection.extent if self.selection else None
         # realize the data (or something odd happens when saving to netcdf below)
+        # unless it is going to be cut down to an extent first
         src_cubes = load_cubes(
-            [str(fp) for fp in self._filepaths],
+            [str(fp) for fp in localize(self.filepaths, self.stage_dir)],
             self.variable,
             self.collection,
-            realize=True,
+            realize=extent is None,
             constraints=[year_constraint],
+            selection=self.selection,
         )
 
         # bug in some data means the final grid_latitude bound is very large (1.0737418e+09)
@@ -126,4 +160,7 @@ class MooseExtractVariableAdapter:
         for d in ds.dims:
             ds[d] = ds[d].reindex()
 
+        if extent is not None:
+            ds = ds.isel(extent_indexers(ds, extent)).load()
+
         return ds
@@ -0,0 +1,236 @@
+"""
+A local stand-in for MASS so that extraction from moose can be exercised and benchmarked offline.
+
+The simulated archive is a directory of pp files laid out like the moose URIs built by moose_path:
+crum/{suite_id}/{stream_code}.pp/ for the CPM and ens/{suite_id}/{rip_code}/{stream_code}.pp/ for the GCM.
+Requests honour the begin/end query files produced by select_query and can be slowed down with a
+fixed per-request latency (tape recall) and a bandwidth limit.
+"""
+
+import cf_units
+import iris
+from iris.coords import DimCoord
+from iris.cube import Cube
+import iris.fileformats.pp as pp
+from iris.fileformats.pp import STASH
+import logging
+import numpy as np
+import os
+from pathlib import Path
+import re
+import time
+
+from .moose import VARIABLE_CODES, moose_path, parse_query_value
+
+logger = logging.getLogger(__name__)
+
+
+def parse_query(query: str) -> list[dict[str, set[int]]]:
+    """
+    Parse a moo select query file into a list of conditions (one per begin/end block).
+    """
+    conditions = []
+    current = None
+    for line in query.splitlines():
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        if line == "begin":
+            current = {}
+        elif line == "end":
+            conditions.append(current)
+            current = None
+        else:
+            key, value = line.split("=", 1)
+            current[key.strip()] = parse_query_value(value)
+    return conditions
+
+
+def _field_value(field, key: str) -> int:
+    if key == "yr":
+        return field.lbyr
+    if key == "mon":
+        return field.lbmon
+    if key == "stash":
+        return field.stash.lbuser3()
+    return getattr(field, key)
+
+
+def field_matches(field, conditions: list[dict[str, set[int]]]) -> bool:
+    return any(
+        all(_field_value(field, key) in values for key, values in condition.items())
+        for condition in conditions
+    )
+
+
+def _query_levels(query: dict) -> list[int | None]:
+    if "lblev" not in query:
+        return [None]
+    return sorted(parse_query_value(str(query["lblev"])))
+
+
+def _query_stash_codes(query: dict) -> list[int]:
+    return sorted(parse_query_value(str(query["stash"])))
+
+
+class MooseArchiveSimulator:
+    """
+    Serves moo select requests from a local directory of pp files.
+    """
+
+    def __init__(
+        self, archive_dir: Path, latency: float = 0.0, bandwidth: float | None = None
+    ):
+        self.archive_dir = Path(archive_dir)
+        # seconds per request
+        self.latency = latency
+        # bytes per second
+        self.bandwidth = bandwidth
+
+    def stream_dirpath(self, moose_uri: str) -> Path:
+        return self.archive_dir / moose_uri.removeprefix("moose:")
+
+    def select(self, query: str, moose_uri: str, dest_dir: Path) -> list[Path]:
+        """
+        Copy the fields of a stream that match a query into dest_dir, one output file per archived file.
+        """
+        src_dirpath = self.stream_dirpath(moose_uri)
+        if not src_dirpath.is_dir():
+            raise FileNotFoundError(f"{moose_uri} does not exist in {self.archive_dir}")
+
+        conditions = parse_query(query)
+        os.makedirs(dest_dir, exist_ok=True)
+
+        # model the time taken to recall the request from tape
+        time.sleep(self.latency)
+
+        output_filepaths = []
+        for src_filepath in sorted(src_dirpath.glob("*.pp")):
+            fields = [
+                field
+                for field in pp.load(str(src_filepath), read_data=True)
+                if field_matches(field, conditions)
+            ]
+            if len(fields) == 0:
+                continue
+
+            output_filepath = Path(dest_dir) / src_filepath.name
+            if output_filepath.exists():
+                raise FileExistsError(f"{output_filepath} already exists")
+            pp.save_fields(fields, str(output_filepath))
+            if self.bandwidth:
+                time.sleep(output_filepath.stat().st_size / self.bandwidth)
+            output_filepaths.append(output_filepath)
+
+        logger.info(f"Selected {len(output_filepaths)} files from {moose_uri}")
+        return output_filepaths
+
+    def populate(
+        self,
+        variable: str,
+        year: int,
+        ensemble_member: str,
+        frequency: str = "day",
+        collection: str = "land-cpm",
+        grid_size: int = 8,
+    ) -> Path:
+        """
+        Write a project year (Dec to Nov) of synthetic fields for a variable into the archive.
+
+        One file per month, named like the archived streams (e.g. bb171a.pa19811201.pp),
+        with a field for each day, stash code and level in the variable's query.
+        """
+        moose_uri = moose_path(
+            variable,
+            year,
+            ensemble_member=ensemble_member,
+            frequency=frequency,
+            collection=collection,
+        )
+        stream_dirpath = self.stream_dirpath(moose_uri)
+        os.makedirs(stream_dirpath, exist_ok=True)
+
+        query = VARIABLE_CODES[variable]["query"]
+        suite_id, stream_code = re.search(
+            r"/([^/]+?)/(?:[^/]+/)?(\w+)\.pp$", moose_uri
+        ).groups()
+        file_prefix = f"{suite_id.split('-')[-1]}a.p{stream_code[-1]}"
+
+        for file_year, month in [(year - 1, 12)] + [(year, m) for m in range(1, 12)]:
+            filepath = stream_dirpath / f"{file_prefix}{file_year}{month:02d}01.pp"
+            fields = [
+                field
+                for stash_code in _query_stash_codes(query)
+                for level in _query_levels(query)
+                for field in self._synthetic_fields(
+                    file_year, month, stash_code, level, query, collection, grid_size
+                )
+            ]
+            if filepath.exists():
+                fields = list(pp.load(str(filepath), read_data=True)) + fields
+            pp.save_fields(fields, str(filepath))
+
+        return stream_dirpath
+
+    @staticmethod
+    def _synthetic_fields(year, month, stash_code, level, query, collection, grid_size):
+        time_unit = cf_units.Unit("hours since 1970-01-01 00:00:00", calendar="360_day")
+        first_hour = time_unit.date2num(
+            cf_units.cftime.Datetime360Day(year, month, 1, 12, 0, 0, 0)
+        )
+        time_coord = DimCoord(
+            first_hour + np.arange(30) * 24.0, standard_name="time", units=time_unit
+        )
+        if collection == "land-cpm":
+            coord_system = iris.coord_systems.RotatedGeogCS(
+                37.5, 177.5, ellipsoid=iris.coord_systems.GeogCS(6371229.0)
+            )
+            y_name, x_name = "grid_latitude", "grid_longitude"
+            y_points = np.linspace(-1, 1, grid_size)
+            x_points = np.linspace(359, 361, grid_size)
+        else:
+            coord_system = iris.coord_systems.GeogCS(6371229.0)
+            y_name, x_name = "latitude", "longitude"
+            y_points = np.linspace(45, 60, grid_size)
+            x_points = np.linspace(0, 20, grid_size)
+
+        cube = Cube(
+            np.random.rand(30, grid_size, grid_size).astype("float32"),
+            long_name=f"stash_{stash_code}",
+            units="1",
+            dim_coords_and_dims=[
+                (time_coord, 0),
+                (
+                    DimCoord(
+                        y_points,
+                        standard_name=y_name,
+                        units="degrees",
+                        coord_system=coord_system,
+                    ),
+                    1,
+                ),
+                (
+                    DimCoord(
+                        x_points,
+                        standard_name=x_name,
+                        units="degrees",
+                        coord_system=coord_system,
+                    ),
+                    2,
+                ),
+            ],
+            attributes={
+                "STASH": STASH(1, stash_code // 1000, stash_code % 1000),
+            },
+        )
+
+        fields = list(pp.as_fields(cube))
+        for field in fields:
+            if "lbproc" in query:
+                field.lbproc = int(query["lbproc"])
+            if level is not None:
+                # pressure level fields are queried by their level in hPa
+                field.lbvc = 8
+                field.lblev = level
+                field.blev = float(level)
+        return fields
@@ -0,0 +1,50 @@
+"""
+Helpers for describing and bounding the resources used by worker processes.
+"""
+
+import logging
+import resource
+
+logger = logging.getLogger(__name__)
+
+# Slurm-style memory suffixes (as used in the queue-lotus scripts, e.g. 4G)
+MEMORY_UNITS = {
+    "K": 1024,
+    "M": 1024**2,
+    "G": 1024**3,
+    "T": 1024**4,
+}
+
+
+def parse_memory(memory: str | int | None) -> int | None:
+    """
+    Convert a memory size like "512M" or "4G" (or a plain number of bytes) into bytes.
+    """
+    if memory is None:
+        return None
+    if isinstance(memory, int):
+        return memory
+
+    memory = memory.strip().upper().removesuffix("B")
+    if memory[-1] in MEMORY_UNITS:
+        return int(float(memory[:-1]) * MEMORY_UNITS[memory[-1]])
+    return int(memory)
+
+
+def limit_memory(max_bytes: int | None) -> None:
+    """
+    Cap the data (heap and other private writable memory) of the current process.
+
+    Intended as an initializer for pool worker processes so that a runaway job fails
+    with a MemoryError in that worker rather than taking the whole node down. The address space
+    (RLIMIT_AS) is not capped since it includes memory that is reserved but never used (shared
+    libraries, malloc arenas etc.) so a cap near the memory actually needed makes importing iris or
+    starting threads fail.
+    """
+    if max_bytes is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+    if hard != resource.RLIM_INFINITY:
+        max_bytes = min(max_bytes, hard)
+    logger.debug(f"Limiting worker data memory to {max_bytes} bytes")
+    resource.setrlimit(resource.RLIMIT_DATA, (max_bytes, hard))
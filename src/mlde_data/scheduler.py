@@ -0,0 +1,135 @@
+"""
+Pipelined scheduling of per-year work.
+
+Each year passes through the same sequence of stages (e.g. extract -> create -> clean). A year
+starts a stage as soon as it has finished the previous one and the stage has a free slot, so
+while one year is being created the next can be extracted and the one before cleaned up, and
+several years can be created at once when there is the memory for it.
+"""
+
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+import logging
+import multiprocessing
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    name: str
+    # called with year as a keyword argument
+    fn: Callable
+    # how many years may be in this stage at once
+    slots: int = 1
+    # run in worker processes rather than threads, for CPU or memory heavy stages (and ones that
+    # load data with libraries like iris and netCDF4 that are not thread-safe)
+    in_process: bool = False
+
+
+def memory_slots(
+    workers: int, max_memory: int | None = None, job_memory: int | None = None
+) -> int:
+    """
+    How many jobs of job_memory bytes to run at once with at most workers of them and max_memory bytes in total.
+    """
+    if max_memory is None or job_memory is None:
+        return workers
+    slots = max_memory // job_memory
+    if slots < 1:
+        logger.warning(
+            f"Estimated job memory {job_memory} bytes exceeds {max_memory} bytes, running one at a time"
+        )
+        return 1
+    return min(workers, slots)
+
+
+class YearScheduler:
+    """
+    Runs years through a sequence of stages, overlapping different years' stages.
+
+    At most max_in_flight years are started but not yet finished (by default enough to keep
+    every stage busy), which bounds e.g. the scratch space taken by extracts waiting to be used.
+    """
+
+    def __init__(self, stages: list[Stage], max_in_flight: int | None = None):
+        self.stages = stages
+        if max_in_flight is None:
+            max_in_flight = sum(stage.slots for stage in stages)
+        self.max_in_flight = max_in_flight
+
+    def run(self, years: list[int]) -> None:
+        """
+        Run all the years through the stages. A year that fails a stage goes no further but the others
+        carry on; a RuntimeError naming the failed years is raised at the end.
+        """
+        thread_executor = ThreadPoolExecutor(
+            max_workers=sum(stage.slots for stage in self.stages)
+        )
+        process_slots = sum(stage.slots for stage in self.stages if stage.in_process)
+        process_executor = None
+        if process_slots > 0:
+            # forking a process that already has threads (e.g. from dask or netCDF) can deadlock the workers
+            process_executor = ProcessPoolExecutor(
+                max_workers=process_slots,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+
+        to_start = deque(years)
+        waiting = [deque() for _ in self.stages]
+        active = [0 for _ in self.stages]
+        running = {}
+        in_flight = 0
+        failures = {}
+        try:
+            while True:
+                while to_start and in_flight < self.max_in_flight:
+                    waiting[0].append(to_start.popleft())
+                    in_flight += 1
+
+                # later stages first so years already under way finish (and free up resources) sooner
+                for i in reversed(range(len(self.stages))):
+                    stage = self.stages[i]
+                    while waiting[i] and active[i] < stage.slots:
+                        year = waiting[i].popleft()
+                        if stage.in_process:
+                            executor = process_executor
+                        else:
+                            executor = thread_executor
+                        logger.info(f"Starting {stage.name} for {year}")
+                        running[executor.submit(stage.fn, year=year)] = (year, i)
+                        active[i] += 1
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    year, i = running.pop(future)
+                    active[i] -= 1
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.exception(f"{self.stages[i].name} failed for {year}")
+                        failures[year] = f"{self.stages[i].name}: {e}"
+                        in_flight -= 1
+                        continue
+                    if i + 1 < len(self.stages):
+                        waiting[i + 1].append(year)
+                    else:
+                        logger.info(f"Finished {year}")
+                        in_flight -= 1
+        finally:
+            thread_executor.shutdown(wait=True)
+            if process_executor is not None:
+                process_executor.shutdown(wait=True)
+
+        if failures:
+            raise RuntimeError(f"Failed years: {failures}")
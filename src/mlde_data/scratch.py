@@ -0,0 +1,269 @@
+"""
+Managed scratch space for moose extracts and other intermediate files.
+
+Entries (pp extract directories, converted raw netCDF files, ...) are recorded in an index
+alongside the data so that usage can be reported across jobs and, when a byte budget is set,
+the least recently used entries that no pending job needs can be evicted rather than every
+extract being removed as soon as it has been used.
+
+Each job that reserves entries is recorded with its host, pid and when it was last heard from so
+the reservations of a job that died without releasing them (crashed, preempted, OOM-killed) are
+treated as released once it is found to be gone or has not been heard from for too long.
+"""
+
+from contextlib import contextmanager
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import socket
+import time
+
+from .locking import dir_lock, refresh_lock
+
+logger = logging.getLogger(__name__)
+
+# how long a job's reservations last without it being heard from
+DEFAULT_RESERVATION_TTL = 24 * 60 * 60
+
+
+def path_size(path: Path) -> int:
+    """
+    Total size in bytes of a file or of all the files within a directory.
+    """
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(
+        (Path(dirpath) / filename).stat().st_size
+        for dirpath, _, filenames in os.walk(path)
+        for filename in filenames
+    )
+
+
+class ScratchSpace:
+    """
+    A scratch area with an optional byte budget.
+
+    The index is shared between processes, possibly on different nodes, so several jobs can use
+    the same scratch area at once. It is guarded by a lock directory (see locking) rather than a
+    flock.
+    """
+
+    INDEX_FILENAME = ".scratch-index.json"
+    LOCK_DIRNAME = ".scratch-index.lockdir"
+
+    def __init__(
+        self,
+        base_dir: Path,
+        budget: int | None = None,
+        reservation_ttl: float = DEFAULT_RESERVATION_TTL,
+    ):
+        self.base_dir = Path(base_dir)
+        self.budget = budget
+        self.reservation_ttl = reservation_ttl
+
+    @property
+    def index_path(self) -> Path:
+        return self.base_dir / self.INDEX_FILENAME
+
+    @property
+    def lock_path(self) -> Path:
+        return self.base_dir / self.LOCK_DIRNAME
+
+    def _lock(self):
+        return dir_lock(self.lock_path)
+
+    def _refresh_lock(self) -> None:
+        # show that a long-held lock (e.g. while evicting) is still in use
+        refresh_lock(self.lock_path)
+
+    @contextmanager
+    def _index(self):
+        with self._lock():
+            if self.index_path.exists():
+                index = json.loads(self.index_path.read_text())
+            else:
+                index = {"entries": {}, "jobs": {}}
+            if "entries" not in index:
+                # entries only, from before jobs were recorded
+                index = {"entries": index, "jobs": {}}
+            yield index
+            tmp_index_path = self.index_path.with_suffix(".tmp")
+            tmp_index_path.write_text(json.dumps(index, indent=2))
+            os.replace(tmp_index_path, self.index_path)
+
+    def _heard_from(self, index: dict, jobs: list[str]) -> None:
+        """
+        Record that jobs (run by this process) are still alive.
+        """
+        for job in jobs:
+            job_info = index["jobs"].setdefault(
+                job,
+                {
+                    "host": socket.gethostname(),
+                    "pid": os.getpid(),
+                    "ttl": self.reservation_ttl,
+                },
+            )
+            job_info["heartbeat"] = time.time()
+
+    def register(self, path: Path, kind: str, needed_by: list[str] = None) -> int:
+        """
+        Start tracking a file or directory in the scratch area. Returns its size in bytes.
+        """
+        size = path_size(path)
+        with self._index() as index:
+            entries = index["entries"]
+            entry = entries.get(str(path), {"needed_by": []})
+            entry.update(kind=kind, bytes=size, last_used=time.time())
+            entry["needed_by"] = sorted(set(entry["needed_by"]) | set(needed_by or []))
+            entries[str(path)] = entry
+            self._heard_from(index, needed_by or [])
+        logger.debug(f"Registered {kind} {path} ({size} bytes)")
+        return size
+
+    def contains(self, path: Path) -> bool:
+        with self._index() as index:
+            return str(path) in index["entries"] and os.path.exists(path)
+
+    def touch(self, path: Path) -> None:
+        """
+        Record that an entry has just been used.
+        """
+        with self._index() as index:
+            if str(path) in index["entries"]:
+                index["entries"][str(path)]["last_used"] = time.time()
+
+    def reserve(self, paths: list[Path], job: str) -> None:
+        """
+        Mark entries as needed by a pending job (run by this process) so they will not be evicted.
+        """
+        with self._index() as index:
+            for path in paths:
+                entry = index["entries"].setdefault(
+                    str(path),
+                    {"kind": "pending", "bytes": 0, "last_used": time.time()},
+                )
+                entry["needed_by"] = sorted(set(entry.get("needed_by", [])) | {job})
+            self._heard_from(index, [job])
+
+    def release(self, job: str, paths: list[Path] = None) -> None:
+        """
+        Remove a job's claim on some (or all) entries.
+        """
+        with self._index() as index:
+            self._release(index, job, paths)
+
+    def release_stale(self) -> list[str]:
+        """
+        Release the reservations of jobs that have died or not been heard from within their TTL.
+        Returns the released jobs.
+        """
+        with self._index() as index:
+            return self._release_stale(index)
+
+    @staticmethod
+    def _release(index: dict, job: str, paths: list[Path] = None) -> None:
+        for path, entry in index["entries"].items():
+            if paths is None or path in {str(p) for p in paths}:
+                entry["needed_by"] = [j for j in entry["needed_by"] if j != job]
+        if paths is None:
+            index["jobs"].pop(job, None)
+
+    def _release_stale(self, index: dict) -> list[str]:
+        stale = [job for job, job_info in index["jobs"].items() if not _alive(job_info)]
+        for job in stale:
+            logger.warning(f"Releasing scratch reservations of dead job {job}")
+            self._release(index, job)
+        return stale
+
+    def usage(self) -> dict:
+        """
+        Summarise the scratch area: bytes and entries per kind, total bytes and the budget.
+        """
+        with self._index() as index:
+            self._release_stale(index)
+            entries = index["entries"]
+            self._forget_missing(entries)
+            by_kind = {}
+            for entry in entries.values():
+                kind_usage = by_kind.setdefault(
+                    entry["kind"], {"bytes": 0, "entries": 0}
+                )
+                kind_usage["bytes"] += entry["bytes"]
+                kind_usage["entries"] += 1
+            return {
+                "budget": self.budget,
+                "bytes": sum(entry["bytes"] for entry in entries.values()),
+                "pinned_bytes": sum(
+                    entry["bytes"] for entry in entries.values() if entry["needed_by"]
+                ),
+                "kinds": by_kind,
+            }
+
+    def evict(self, required_bytes: int = 0) -> list[str]:
+        """
+        Remove least recently used entries that no pending job needs until the scratch area
+        (plus required_bytes of new data) fits within the budget. Returns the removed paths.
+        """
+        if self.budget is None:
+            return []
+
+        evicted = []
+        with self._index() as index:
+            self._release_stale(index)
+            entries = index["entries"]
+            self._forget_missing(entries)
+            used = sum(entry["bytes"] for entry in entries.values())
+            candidates = sorted(
+                (
+                    (entry["last_used"], path)
+                    for path, entry in entries.items()
+                    if not entry["needed_by"]
+                ),
+            )
+            for _, path in candidates:
+                if used + required_bytes <= self.budget:
+                    break
+                logger.info(f"Evicting {path} from scratch")
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                elif os.path.exists(path):
+                    os.remove(path)
+                self._refresh_lock()
+                used -= entries.pop(path)["bytes"]
+                evicted.append(path)
+
+            if used + required_bytes > self.budget:
+                logger.warning(
+                    f"Scratch usage {used} bytes (+{required_bytes} required) exceeds budget {self.budget} bytes but remaining entries are needed"
+                )
+
+        return evicted
+
+    @staticmethod
+    def _forget_missing(entries: dict) -> None:
+        # entries removed outside of the scratch manager (e.g. by moose clean) no longer count,
+        # unless a job has reserved them ahead of creating them
+        for path in list(entries.keys()):
+            if not os.path.exists(path) and not entries[path]["needed_by"]:
+                del entries[path]
+
+
+def _alive(job_info: dict) -> bool:
+    """
+    Whether a job that reserved scratch entries may still be running.
+    """
+    if time.time() - job_info["heartbeat"] > job_info["ttl"]:
+        return False
+    if job_info["host"] == socket.gethostname():
+        # the pid of a job on another node cannot be checked so only its TTL applies
+        try:
+            os.kill(job_info["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
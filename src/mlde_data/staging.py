@@ -0,0 +1,332 @@
+"""
+Staging of files between slow shared storage and fast local disk.
+
+Source files are copied on a background thread so the files for the next year can be fetched while
+the current one is being processed. Staged copies sit under the staging directory at the same path
+as the original (e.g. /badc/ukcp18/data/... -> $TMPDIR/.../badc/ukcp18/data/...) and only
+appear once complete, so adapters given the staging directory can use a staged copy when there
+is one and otherwise fall back to the original.
+
+Outputs go the other way: they are written locally and then moved into place, optionally in the
+background while the next output is computed.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import errno
+import glob
+import logging
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def staged_path(path: Path | str, stage_dir: Path) -> Path:
+    """
+    Where a file (or glob pattern) is put when staged in stage_dir.
+    """
+    path = Path(os.path.abspath(path))
+    return Path(stage_dir) / path.relative_to(path.anchor)
+
+
+def localize(paths: list, stage_dir: Path | None = None) -> list:
+    """
+    Swap any paths (or glob patterns) that have been staged in stage_dir for their staged copies.
+    """
+    if stage_dir is None:
+        return paths
+
+    localized = []
+    for path in paths:
+        local_path = staged_path(path, stage_dir)
+        if glob.has_magic(str(path)):
+            staged = len(glob.glob(str(local_path))) > 0
+        else:
+            staged = local_path.exists()
+        localized.append(type(path)(local_path) if staged else path)
+    return localized
+
+
+class SourceStager:
+    """
+    Copies groups of source files (e.g. all those needed for a year) into a local staging directory
+    in the background.
+
+    A group is staged entirely or not at all. When a budget (in bytes) is set, the least recently
+    staged groups that have been released are removed to make space and a group that still does not
+    fit is left to be read from its original location.
+    """
+
+    def __init__(self, stage_dir: Path | None = None, budget: int | None = None):
+        self._own_stage_dir = stage_dir is None
+        if stage_dir is None:
+            stage_dir = tempfile.mkdtemp(prefix="mlde-stage-", dir=os.getenv("TMPDIR"))
+        self.stage_dir = Path(stage_dir)
+        self.budget = budget
+        # single thread so staging one group does not compete with the next for bandwidth
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        # key: (staged paths, bytes, released), oldest first
+        self._groups = OrderedDict()
+        self._futures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def used(self) -> int:
+        with self._lock:
+            return sum(nbytes for _, nbytes, _ in self._groups.values())
+
+    def prefetch(self, key: str, paths: list) -> Future:
+        """
+        Start staging a group of files (glob patterns are expanded) in the background.
+        """
+        if key not in self._futures:
+            self._futures[key] = self._executor.submit(self._stage, key, paths)
+        return self._futures[key]
+
+    def wait(self, key: str) -> bool:
+        """
+        Wait for a group to finish staging. Returns whether it was staged.
+        """
+        if key not in self._futures:
+            return False
+        try:
+            return self._futures[key].result()
+        except OSError as e:
+            # the originals are still there to fall back on
+            logger.warning(f"Failed to stage {key}: {e}")
+            return False
+
+    def release(self, key: str) -> None:
+        """
+        Mark a group as no longer needed so it may be removed to make space for others.
+        """
+        with self._lock:
+            if key in self._groups:
+                staged, nbytes, _ = self._groups[key]
+                self._groups[key] = (staged, nbytes, True)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        if self._own_stage_dir:
+            shutil.rmtree(self.stage_dir, ignore_errors=True)
+
+    def _stage(self, key: str, paths: list) -> bool:
+        src_paths = sorted(
+            {
+                Path(match)
+                for path in paths
+                for match in (
+                    glob.glob(str(path)) if glob.has_magic(str(path)) else [path]
+                )
+            }
+        )
+        nbytes = sum(os.path.getsize(src_path) for src_path in src_paths)
+        if not self._make_space(nbytes):
+            logger.info(
+                f"Not staging {key} ({nbytes} bytes) as it does not fit within {self.budget} bytes"
+            )
+            return False
+
+        staged = []
+        try:
+            for src_path in src_paths:
+                dest_path = staged_path(src_path, self.stage_dir)
+                os.makedirs(dest_path.parent, exist_ok=True)
+                tmp_path = dest_path.with_name(f".{dest_path.name}.tmp")
+                shutil.copyfile(src_path, tmp_path)
+                # only appears under its real name once the copy is complete
+                os.replace(tmp_path, dest_path)
+                staged.append(dest_path)
+        except BaseException:
+            self._remove(staged)
+            raise
+
+        with self._lock:
+            self._groups[key] = (staged, nbytes, False)
+        logger.info(f"Staged {key}: {len(staged)} files, {nbytes} bytes")
+        return True
+
+    def _make_space(self, nbytes: int) -> bool:
+        if self.budget is None:
+            return True
+        with self._lock:
+            used = sum(group_bytes for _, group_bytes, _ in self._groups.values())
+            for key, (staged, group_bytes, released) in list(self._groups.items()):
+                if used + nbytes <= self.budget:
+                    break
+                if released:
+                    logger.info(f"Removing staged {key}")
+                    self._remove(staged)
+                    del self._groups[key]
+                    self._futures.pop(key, None)
+                    used -= group_bytes
+            return used + nbytes <= self.budget
+
+    @staticmethod
+    def _remove(staged: list[Path]) -> None:
+        for path in staged:
+            if path.exists():
+                os.remove(path)
+
+
+def _remove_path(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        os.remove(path)
+
+
+def _rename_new(src: Path, dst: Path) -> None:
+    """
+    Rename src to dst, raising FileExistsError if something is already at dst (including if it
+    appeared after checking).
+    """
+    if dst.exists():
+        raise FileExistsError(f"{dst} already exists")
+    if src.is_dir():
+        try:
+            # a directory cannot be renamed over a non-empty one (like a zarr store)
+            os.rename(src, dst)
+        except OSError as e:
+            if e.errno in (errno.EEXIST, errno.ENOTEMPTY):
+                raise FileExistsError(f"{dst} already exists") from e
+            raise
+    else:
+        # unlike a rename, linking fails if the destination exists
+        os.link(src, dst)
+        os.remove(src)
+
+
+def publish(local_path: Path, path: Path, if_exists: str = "fail") -> None:
+    """
+    Move a file or directory (e.g. a zarr store) into place.
+
+    if_exists says what to do if something is already at path (or appears there meanwhile):
+    "fail" raises FileExistsError, "replace" replaces it and "skip" keeps it and discards the
+    local copy.
+
+    It is moved alongside its destination under a temporary name (unique to this move so others
+    publishing the same path cannot remove it) first so the final step is a rename on the
+    destination filesystem and readers never see a partial output.
+    """
+    if if_exists not in ["fail", "replace", "skip"]:
+        raise ValueError(f"Unknown if_exists {if_exists}")
+    local_path, path = Path(local_path), Path(path)
+    if if_exists == "skip" and path.exists():
+        logger.info(f"{path} already exists, keeping it")
+        _remove_path(local_path)
+        return
+    if if_exists == "fail" and path.exists():
+        raise FileExistsError(f"{path} already exists")
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        # shutil.move copies if the destination is on another filesystem (e.g. local scratch -> NFS)
+        shutil.move(local_path, tmp_path)
+        if if_exists != "replace":
+            try:
+                _rename_new(tmp_path, path)
+            except FileExistsError:
+                if if_exists == "fail":
+                    raise
+                # published by someone else in the meantime
+                logger.info(f"{path} already exists, keeping it")
+                return
+        elif path.is_dir():
+            # directories cannot be renamed over a non-empty one
+            old_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.old")
+            os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path)
+        else:
+            os.replace(tmp_path, path)
+    finally:
+        _remove_path(tmp_path)
+    logger.debug(f"Published {path}")
+
+
+class OutputStager:
+    """
+    Writes outputs to local scratch and then publishes them to their final location.
+
+    With background=True publishing happens on a background thread while the caller moves on to
+    its next output and flush must be called to wait for everything written so far to be in place.
+    """
+
+    def __init__(self, stage_dir: Path | None = None, background: bool = False):
+        self._own_stage_dir = stage_dir is None
+        if stage_dir is None:
+            stage_dir = tempfile.mkdtemp(prefix="mlde-output-", dir=os.getenv("TMPDIR"))
+        self.stage_dir = Path(stage_dir)
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.flush()
+        self.close()
+
+    def write(self, write_fn, path: Path | str, if_exists: str = "fail") -> None:
+        """
+        Call write_fn with a local path to write the output for path to and then publish it
+        (doing as if_exists says, see publish, if there is already something at path).
+        """
+        self.write_many(
+            lambda local_paths: write_fn(local_paths[0]), [path], if_exists=if_exists
+        )
+
+    def write_many(self, write_fn, paths: list, if_exists: str = "fail") -> None:
+        """
+        Call write_fn with a list of local paths to write the outputs for paths to (e.g. all in one dask
+        compute) and then publish them.
+        """
+        paths = [Path(path) for path in paths]
+        local_paths = [staged_path(path, self.stage_dir) for path in paths]
+        for local_path in local_paths:
+            os.makedirs(local_path.parent, exist_ok=True)
+            _remove_path(local_path)
+        try:
+            write_fn(local_paths)
+        except BaseException:
+            for local_path in local_paths:
+                _remove_path(local_path)
+            raise
+
+        for local_path, path in zip(local_paths, paths):
+            if self._executor is None:
+                publish(local_path, path, if_exists=if_exists)
+            else:
+                self._pending.append(
+                    self._executor.submit(
+                        publish, local_path, path, if_exists=if_exists
+                    )
+                )
+
+    def flush(self) -> None:
+        """
+        Wait for all the outputs written so far to be published, raising the first failure.
+        """
+        pending, self._pending = self._pending, []
+        wait(pending)
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._own_stage_dir:
+            shutil.rmtree(self.stage_dir, ignore_errors=True)
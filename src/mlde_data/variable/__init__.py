@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from string import Template
 import yaml
@@ -78,3 +78,132 @@ def load_config(
     }
 
     return config
+
+
+@dataclass(frozen=True)
+class SpatialExtent:
+    """
+    The subdomain a variable config ends up selecting and the resolution it is selected at.
+
+    align is the number of source grid cells combined along each axis by any coarsening
+    beforehand: the source should only be cut at multiples of it so coarsening gives the same cells.
+    """
+
+    domain: str
+    resolution: str
+    align: int = 1
+
+
+@dataclass(frozen=True)
+class SourceSelection:
+    """
+    Fields and coordinate values of the source data that are needed by a set of variable configs.
+
+    Derived from the selection actions (drop-variables and query) at the start of each config's spec
+    so that source adapters can avoid reading data that would immediately be thrown away.
+    """
+
+    drop_variables: frozenset[str] = frozenset()
+    query: dict = field(default_factory=dict)
+    extent: SpatialExtent | None = None
+
+    def __bool__(self):
+        return (
+            len(self.drop_variables) > 0
+            or len(self.query) > 0
+            or self.extent is not None
+        )
+
+
+def _leading_selection(config: dict) -> tuple[set[str], dict[str, set]]:
+    drop_variables = set()
+    query = {}
+    for job_spec in config["spec"]:
+        if job_spec["action"] == "drop-variables":
+            drop_variables.update(job_spec["parameters"]["variables"])
+        elif job_spec["action"] == "query":
+            # the query action selects with its query parameter (some configs don't give one
+            # and so cannot be pushed down)
+            if not isinstance(job_spec.get("parameters", {}).get("query"), dict):
+                break
+            for coord, value in job_spec["parameters"]["query"].items():
+                values = value if isinstance(value, list) else [value]
+                if not all(isinstance(v, (int, float, str)) for v in values):
+                    # only simple point selections can be pushed down
+                    continue
+                # successive queries on the same coordinate can only narrow the selection
+                query[coord] = query.get(coord, set(values)) & set(values)
+        else:
+            break
+    return drop_variables, query
+
+
+# actions that keep the horizontal grid as it is
+GRID_PRESERVING_ACTIONS = {
+    "drop-variables",
+    "query",
+    "sum",
+    "diff",
+    "rename",
+    "resample",
+    "vorticity",
+}
+
+
+def _spatial_extent(config: dict) -> SpatialExtent | None:
+    resolutions = {src_config.resolution for src_config in config.get("sources", [])}
+    if len(resolutions) != 1:
+        return None
+    resolution = resolutions.pop()
+
+    align = 1
+    for job_spec in config["spec"]:
+        parameters = job_spec.get("parameters", {})
+        if job_spec["action"] == "coarsen":
+            if str(parameters["scale_factor"]) == "gcm":
+                resolution = f"{resolution}-coarsened-gcm"
+            elif int(parameters["scale_factor"]) != 1:
+                resolution = (
+                    f"{resolution}-coarsened-{int(parameters['scale_factor'])}x"
+                )
+                align *= int(parameters["scale_factor"])
+        elif job_spec["action"] == "regrid_to_target":
+            # the subdomain would be selected from the target grid rather than the source grid
+            if parameters.get("target_grid_resolution") != resolution:
+                return None
+        elif job_spec["action"] == "select-subdomain":
+            return SpatialExtent(
+                domain=parameters["domain"], resolution=resolution, align=align
+            )
+        elif job_spec["action"] not in GRID_PRESERVING_ACTIONS:
+            return None
+    return None
+
+
+def source_selection(configs: list[dict]) -> SourceSelection:
+    """
+    Combine the leading selection actions of several variable configs that share source data.
+
+    A field is only dropped if every config drops it and a coordinate is only restricted if every
+    config queries it (in which case the union of the queried values is kept). The source is only
+    cut down to a subdomain if every config selects the same subdomain at the same resolution.
+    """
+    if len(configs) == 0:
+        return SourceSelection()
+
+    selections = [_leading_selection(config) for config in configs]
+
+    drop_variables = set.intersection(*[drop for drop, _ in selections])
+
+    common_coords = set.intersection(*[set(query.keys()) for _, query in selections])
+    query = {
+        coord: sorted(set.union(*[query[coord] for _, query in selections]))
+        for coord in common_coords
+    }
+
+    extents = {_spatial_extent(config) for config in configs}
+    extent = extents.pop() if len(extents) == 1 else None
+
+    return SourceSelection(
+        drop_variables=frozenset(drop_variables), query=query, extent=extent
+    )
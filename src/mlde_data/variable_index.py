@@ -0,0 +1,384 @@
+"""
+Indexes of the yearly files of a derived variable so it can be opened without reading every file.
+
+Opening a variable with open_mfdataset opens, decodes and compares the metadata of each of its
+yearly files every time. An index records, once, everything needed to assemble the same lazy
+dataset: the metadata of each variable, the values of the small ones (the times of each file and
+anything that does not vary with time) and a reference to each file for the others, which are only
+read when their data is computed.
+
+There is one index per ensemble member of a variable (alongside its files) and refreshing it only
+reads files that are new or have changed since it was last written.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import cftime
+import dask
+import dask.array
+import json
+import logging
+from mlde_utils import VariableMetadata
+import multiprocessing
+import numpy as np
+import os
+from pathlib import Path
+import xarray as xr
+from xarray.coding.times import decode_cf_datetime, encode_cf_datetime
+
+from .fingerprint import variable_fingerprint
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.json"
+VERSION = 1
+# encodings that only describe the file a variable was first read from
+FILE_ENCODINGS = ["source", "original_shape", "preferred_chunks"]
+
+
+def index_path(dsmeta: VariableMetadata) -> Path:
+    return Path(dsmeta.dirpath()) / INDEX_FILENAME
+
+
+def _is_datetime(values: np.ndarray) -> bool:
+    return values.dtype.kind == "M" or (
+        values.dtype.kind == "O"
+        and values.size > 0
+        and isinstance(values.flat[0], cftime.datetime)
+    )
+
+
+def _to_json(value, units: str = None, calendar: str = None):
+    """
+    A JSON-able version of an attribute or array that keeps its numpy dtype (datetimes are encoded as numbers).
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        value = np.asarray(value)
+        if _is_datetime(value):
+            value, units, calendar = encode_cf_datetime(value, units, calendar)
+            return {
+                "dtype": value.dtype.str,
+                "data": value.tolist(),
+                "units": units,
+                "calendar": calendar,
+            }
+        return {"dtype": value.dtype.str, "data": value.tolist()}
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, dict) and {"dtype", "data"} <= set(value.keys()):
+        data = np.asarray(value["data"], dtype=value["dtype"])
+        if "units" in value:
+            data = decode_cf_datetime(data, value["units"], value["calendar"])
+        return data[()]
+    return value
+
+
+def _encoding_to_json(encoding: dict) -> dict:
+    return {
+        k: str(np.dtype(v)) if k == "dtype" else _to_json(v)
+        for k, v in encoding.items()
+        if k not in FILE_ENCODINGS
+    }
+
+
+def _encoding_from_json(encoding: dict) -> dict:
+    return {
+        k: (
+            np.dtype(v)
+            if k == "dtype"
+            else tuple(v) if isinstance(v, list) else _from_json(v)
+        )
+        for k, v in encoding.items()
+    }
+
+
+def _same(a, b) -> bool:
+    # compare as JSON so that NaN attributes (e.g. _FillValue) are equal
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+def _scan_file(filepath: Path, time_encoding: dict = None) -> tuple[dict, dict, dict]:
+    """
+    The index entry of a file along with the metadata of its variables and its dimensions (other than time).
+
+    The file's times are encoded with time_encoding (or its own time encoding if not given).
+    """
+    stat = os.stat(filepath)
+    with xr.open_dataset(filepath) as ds:
+        if time_encoding is None:
+            time_encoding = {k: ds["time"].encoding[k] for k in ["units", "calendar"]}
+        variables = {}
+        for name, variable in ds.variables.items():
+            meta = {
+                "dims": list(variable.dims),
+                "dtype": variable.dtype.str,
+                "attrs": {k: _to_json(v) for k, v in variable.attrs.items()},
+                "encoding": _encoding_to_json(variable.encoding),
+                "coord": name in ds.coords,
+            }
+            if "time" not in variable.dims:
+                meta["data"] = _to_json(variable.values)
+                meta["fingerprint"] = variable_fingerprint(variable)
+            variables[name] = meta
+        entry = {
+            "name": os.path.basename(filepath),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "attrs": {k: _to_json(v) for k, v in ds.attrs.items()},
+            "time": _to_json(ds["time"].values, **time_encoding),
+        }
+        dims = {dim: size for dim, size in ds.sizes.items() if dim != "time"}
+    return entry, variables, dims
+
+
+def _check_consistent(index: dict, name: str, variables: dict, dims: dict) -> None:
+    if not _same(dims, index["dims"]):
+        raise ValueError(f"{name} has dimensions {dims} not {index['dims']}")
+    if set(variables) != set(index["variables"]):
+        raise ValueError(
+            f"{name} has variables {sorted(variables)} not {sorted(index['variables'])}"
+        )
+    for var_name, meta in variables.items():
+        expected = index["variables"][var_name]
+        keys = ["dims", "dtype", "attrs", "coord", "fingerprint"]
+        if not _same(
+            {k: meta.get(k) for k in keys}, {k: expected.get(k) for k in keys}
+        ):
+            raise ValueError(f"{var_name} in {name} does not match the other files")
+
+
+def load_index(dsmeta: VariableMetadata) -> dict | None:
+    path = index_path(dsmeta)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def _unchanged(entry: dict, filepath: Path) -> bool:
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return False
+    return entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+
+
+def _first_time(entry: dict):
+    return entry["time"]["data"][0]
+
+
+def update_index(dsmeta: VariableMetadata) -> dict:
+    """
+    Bring the index of a variable's files up to date, only reading the files that are new or have changed.
+    """
+    dirpath = Path(dsmeta.dirpath())
+    filepaths = sorted(dsmeta.existing_filepaths())
+    if len(filepaths) == 0:
+        raise FileNotFoundError(f"No files in {dirpath}")
+
+    previous = load_index(dsmeta)
+    index = previous
+    if index is not None and index.get("version") != VERSION:
+        index = None
+    entries = {}
+    if index is not None:
+        entries = {
+            entry["name"]: entry
+            for entry in index["files"]
+            if _unchanged(entry, dirpath / entry["name"])
+        }
+    if len(entries) == 0:
+        index = None
+
+    scanned = 0
+    for filepath in filepaths:
+        name = os.path.basename(filepath)
+        if name in entries:
+            continue
+        if index is None:
+            entry, variables, dims = _scan_file(filepath)
+            time = entry["time"]
+            index = {
+                "version": VERSION,
+                "dims": dims,
+                "time_encoding": {k: time[k] for k in ["units", "calendar"]},
+                "variables": variables,
+            }
+        else:
+            entry, variables, dims = _scan_file(filepath, index["time_encoding"])
+            _check_consistent(index, name, variables, dims)
+        entries[name] = entry
+        scanned += 1
+
+    index["files"] = sorted(
+        (entries[os.path.basename(filepath)] for filepath in filepaths),
+        key=_first_time,
+    )
+    for previous_entry, entry in zip(index["files"], index["files"][1:]):
+        if _first_time(entry) <= previous_entry["time"]["data"][-1]:
+            raise ValueError(
+                f"Times of {entry['name']} overlap {previous_entry['name']}"
+            )
+
+    if previous is None or scanned > 0 or len(previous["files"]) != len(filepaths):
+        path = index_path(dsmeta)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(index))
+        os.replace(tmp_path, path)
+    logger.info(
+        f"Indexed {dirpath}: {scanned} of {len(filepaths)} files read, {len(filepaths) - scanned} unchanged"
+    )
+    return index
+
+
+def stale_files(dsmeta: VariableMetadata, index: dict, years=None) -> list[str]:
+    """
+    Names of files needed (for the given years, or all of them) that are missing from or have changed since the index.
+    """
+    dirpath = Path(dsmeta.dirpath())
+    indexed = {entry["name"]: entry for entry in index["files"]}
+    if years is None:
+        names = set(map(os.path.basename, dsmeta.existing_filepaths()))
+        names |= set(indexed)
+    else:
+        names = {dsmeta.filename(year) for year in years}
+        names = {
+            name for name in names if name in indexed or os.path.exists(dirpath / name)
+        }
+    return sorted(
+        name
+        for name in names
+        if name not in indexed or not _unchanged(indexed[name], dirpath / name)
+    )
+
+
+def _read(filepath: str, var_name: str, mtime_ns: int) -> np.ndarray:
+    # mtime_ns is only here so that a changed file gets a different dask key
+    with xr.open_dataset(filepath) as ds:
+        return ds[var_name].values
+
+
+def _drop_conflicts(attrs: list[dict]) -> dict:
+    combined = {}
+    conflicts = set()
+    for file_attrs in attrs:
+        for k, v in file_attrs.items():
+            if k in combined and not _same(combined[k], v):
+                conflicts.add(k)
+            combined.setdefault(k, v)
+    return {k: _from_json(v) for k, v in combined.items() if k not in conflicts}
+
+
+def open_indexed(
+    dsmeta: VariableMetadata, years=None, index: dict = None
+) -> xr.Dataset:
+    """
+    Open a variable's files (for the given years, or all of them) as a single lazy dataset using its index.
+
+    Equivalent to open_mfdataset of the files but only the index is read until the data is needed.
+    """
+    if index is None:
+        index = load_index(dsmeta)
+    if index is None:
+        raise FileNotFoundError(f"No index in {dsmeta.dirpath()}")
+    stale = stale_files(dsmeta, index, years)
+    if len(stale) > 0:
+        raise ValueError(
+            f"Index of {dsmeta.dirpath()} is out of date for {', '.join(stale)}"
+        )
+
+    files = index["files"]
+    if years is not None:
+        names = {dsmeta.filename(year) for year in years}
+        files = [entry for entry in files if entry["name"] in names]
+        if len(files) == 0:
+            raise FileNotFoundError(f"No files for years {years} in {dsmeta.dirpath()}")
+
+    dirpath = Path(dsmeta.dirpath())
+    data_vars = {}
+    coords = {}
+    for name, meta in index["variables"].items():
+        if "time" not in meta["dims"]:
+            data = _from_json(meta["data"])
+        elif name == "time":
+            data = _from_json(
+                {
+                    "dtype": files[0]["time"]["dtype"],
+                    "data": sum((entry["time"]["data"] for entry in files), []),
+                    **index["time_encoding"],
+                }
+            )
+        else:
+            blocks = []
+            for entry in files:
+                shape = tuple(
+                    len(entry["time"]["data"]) if dim == "time" else index["dims"][dim]
+                    for dim in meta["dims"]
+                )
+                blocks.append(
+                    dask.array.from_delayed(
+                        dask.delayed(_read, pure=True)(
+                            str(dirpath / entry["name"]), name, entry["mtime_ns"]
+                        ),
+                        shape=shape,
+                        dtype=meta["dtype"],
+                    )
+                )
+            data = dask.array.concatenate(blocks, axis=meta["dims"].index("time"))
+        variable = xr.Variable(
+            meta["dims"],
+            data,
+            {k: _from_json(v) for k, v in meta["attrs"].items()},
+            encoding=_encoding_from_json(meta["encoding"]),
+        )
+        (coords if meta["coord"] else data_vars)[name] = variable
+
+    return xr.Dataset(
+        data_vars,
+        coords=coords,
+        attrs=_drop_conflicts([entry["attrs"] for entry in files]),
+    )
+
+
+def variable_dirs(base_dir: Path) -> list[VariableMetadata]:
+    """
+    The ensemble members of each variable with files in a derived variables tree.
+    """
+    dsmetas = []
+    for dirpath in sorted(Path(base_dir).glob("*/*/*/*/*/*/*")):
+        if not dirpath.is_dir():
+            continue
+        collection, domain, resolution, scenario, em, variable, frequency = (
+            dirpath.relative_to(base_dir).parts
+        )
+        dsmeta = VariableMetadata(
+            base_dir,
+            variable=variable,
+            frequency=frequency,
+            domain=domain,
+            resolution=resolution,
+            ensemble_member=em,
+            scenario=scenario,
+            collection=collection,
+        )
+        if len(dsmeta.existing_filepaths()) > 0:
+            dsmetas.append(dsmeta)
+    return dsmetas
+
+
+def update_indexes(base_dir: Path, workers: int = 1) -> list[VariableMetadata]:
+    """
+    Bring the indexes of all the variables in a derived variables tree up to date.
+    """
+    dsmetas = variable_dirs(base_dir)
+    if workers == 1:
+        for dsmeta in dsmetas:
+            update_index(dsmeta)
+    else:
+        # forking a process that already has threads (e.g. from dask or netCDF) can deadlock the workers
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+        ) as executor:
+            for future in [executor.submit(update_index, dsmeta) for dsmeta in dsmetas]:
+                future.result()
+    return dsmetas
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from mlde_data.actions import get_action
+
+
+@pytest.fixture
+def ds():
+    return xr.Dataset(
+        data_vars={"x_wind": (["pressure", "time"], np.random.randn(3, 5))},
+        coords={"pressure": [250, 500, 850], "time": np.arange(5)},
+    )
+
+
+def test_query(ds):
+    result = get_action("query")(query={"pressure": 850})(ds)
+
+    assert result["pressure"].item() == 850
+    assert result["x_wind"].dims == ("time",)
+
+
+def test_query_already_selected(ds):
+    ds = ds.sel(pressure=850)
+
+    result = get_action("query")(query={"pressure": 850})(ds)
+
+    assert result["pressure"].item() == 850
+
+
+def test_query_already_selected_mismatch(ds):
+    ds = ds.sel(pressure=500)
+
+    with pytest.raises(KeyError):
+        get_action("query")(query={"pressure": 850})(ds)
@@ -0,0 +1,20 @@
+import pytest
+import xarray as xr
+
+from mlde_data.actions import get_action
+
+
+def test_drop_vars():
+    ds = xr.Dataset({"foo": ("x", [1, 2]), "bar": ("x", [3, 4])})
+
+    dropped = get_action("drop-variables")(["bar", "baz"], already_dropped=["baz"])(ds)
+
+    assert list(dropped.data_vars) == ["foo"]
+
+
+def test_drop_vars_missing():
+    ds = xr.Dataset({"foo": ("x", [1, 2]), "bar": ("x", [3, 4])})
+
+    # a variable that was not left out when loading the source data must be there to drop
+    with pytest.raises(ValueError):
+        get_action("drop-variables")(["bar", "baz"], already_dropped=["bar"])(ds)
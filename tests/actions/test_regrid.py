@@ -0,0 +1,57 @@
+from importlib.resources import files
+import numpy as np
+import xarray as xr
+
+from mlde_data.actions import get_action
+
+
+def _global_ensemble_dataset():
+    grid_ds = xr.open_dataset(
+        files("mlde_data.actions").joinpath("target_grids/60km/global/pr/moose_grid.nc")
+    )
+    time = xr.date_range(
+        "1980-12-01T12:00", periods=2, freq="D", calendar="360_day", use_cftime=True
+    )
+    rng = np.random.default_rng(42)
+    return xr.Dataset(
+        {
+            "pr": (
+                ["ensemble_member", "time", "latitude", "longitude"],
+                rng.random(
+                    (3, 2, grid_ds.sizes["latitude"], grid_ds.sizes["longitude"])
+                ),
+                {"grid_mapping": "latitude_longitude"},
+            ),
+            "time_bnds": (["time", "bnds"], np.stack([time, time], axis=1)),
+            "latitude_longitude": grid_ds["latitude_longitude"],
+        },
+        coords=dict(
+            ensemble_member=["1", "2", "3"],
+            time=time,
+            latitude=grid_ds["latitude"],
+            longitude=grid_ds["longitude"],
+        ),
+        attrs={"resolution": "60km", "domain": "global", "frequency": "day"},
+    )
+
+
+def test_regrid_ensemble():
+    ds = _global_ensemble_dataset()
+    regrid = get_action("regrid_to_target")(
+        target_grid_resolution="2.2km-coarsened-27x", variables=["pr"]
+    )
+
+    regridded_ds = regrid(ds)
+
+    assert regridded_ds["pr"].dims == (
+        "ensemble_member",
+        "time",
+        "grid_latitude",
+        "grid_longitude",
+    )
+    # the same as regridding each member on its own
+    for ensemble_member in ["1", "3"]:
+        np.testing.assert_array_equal(
+            regridded_ds["pr"].sel(ensemble_member=ensemble_member).values,
+            regrid(ds.sel(ensemble_member=ensemble_member, drop=True))["pr"].values,
+        )
@@ -1,12 +1,15 @@
 from importlib.resources import files
+import numpy as np
 import os
 from pathlib import Path
 import pytest
 import xarray as xr
 
 from mlde_data.actions import get_action
+from mlde_data.actions.select_domain import extent_indexers, resolution_km
 from mlde_data.moose import open_pp_data
 from mlde_data.options import CollectionOption
+from mlde_data.variable import SpatialExtent
 
 
 def test_select_bham64_domain(global_dataset):
@@ -25,6 +28,67 @@ def test_select_engwales_domain(moose_cpm_dataset):
     assert engwales_ds.cf["Y"].size == 256
 
 
+def test_resolution_km():
+    assert resolution_km("2.2km") == 2.2
+    assert resolution_km("2.2km-coarsened-4x") == pytest.approx(8.8)
+    assert resolution_km("2.2km-coarsened-gcm") == 60
+    assert resolution_km("60km") == 60
+
+
+@pytest.mark.parametrize("scale_factor", [1, 4])
+def test_extent_subset_matches_full_domain(cpm_grid_dataset, scale_factor):
+    extent = SpatialExtent(
+        domain="engwales",
+        resolution=(
+            "2.2km" if scale_factor == 1 else f"2.2km-coarsened-{scale_factor}x"
+        ),
+        align=scale_factor,
+    )
+
+    def process(ds):
+        ds = get_action("coarsen")(scale_factor=scale_factor)(ds)
+        return get_action("select-subdomain")(domain="engwales")(ds)
+
+    indexers = extent_indexers(cpm_grid_dataset, extent)
+    subset_ds = cpm_grid_dataset.isel(indexers)
+
+    assert set(indexers.keys()) == {"grid_latitude", "grid_longitude"}
+    assert subset_ds["pr"].size < cpm_grid_dataset["pr"].size
+    xr.testing.assert_identical(process(subset_ds), process(cpm_grid_dataset))
+
+
+def test_extent_across_longitude_break():
+    filepath = files("mlde_data.actions").joinpath(
+        f"target_grids/60km/global/pr/moose_grid.nc"
+    )
+    ds = xr.open_dataset(filepath)
+
+    indexers = extent_indexers(ds, SpatialExtent(domain="engwales", resolution="60km"))
+
+    # longitudes run from 0 to 360 so England and Wales straddles the break
+    assert "longitude" not in indexers
+    latitudes = ds.isel(indexers)["latitude"]
+    assert latitudes.min() < 52.49 - 6.5 * 60 / 111.2
+    assert latitudes.max() > 52.49 + 6.5 * 60 / 111.2
+    assert latitudes.size < ds["latitude"].size / 5
+
+
+@pytest.fixture
+def cpm_grid_dataset():
+    filepath = files("mlde_data.actions").joinpath(
+        "target_grids/2.2km/uk/moose_grid.nc"
+    )
+    ds = xr.open_dataset(filepath).assign_attrs(
+        {
+            "domain": "uk",
+            "resolution": "2.2km",
+            "frequency": "day",
+        }
+    )
+    rng = np.random.default_rng(42)
+    return ds.assign(pr=ds["pr"].copy(data=rng.random(ds["pr"].shape)))
+
+
 @pytest.fixture
 def global_dataset():
     filepath = files("mlde_data.actions").joinpath(
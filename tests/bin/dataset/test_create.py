@@ -6,7 +6,9 @@ from typer.testing import CliRunner
 import xarray as xr
 
 from mlde_data.bin import app
+from mlde_data.bin import dataset as dataset_cli
 from mlde_data.bin.dataset import create
+from mlde_data.dataset.variable_store import open_split
 
 runner = CliRunner()
 
@@ -59,6 +61,9 @@ def test_create(tmp_path, config_filepath, input_base_dir):
         config_filepath,
         input_base_dir=input_base_dir,
         output_base_dir=tmp_path,
+        stream=False,
+        workers=1,
+        variable_store=None,
     )
     assert_file(ds_config_filepath)
 
@@ -89,12 +94,30 @@ def test_create_runner(tmp_path, config_filepath, input_base_dir):
     assert result.exit_code == 0
 
 
+def test_create_runner_stream(tmp_path, config_filepath, input_base_dir):
+    result = runner.invoke(
+        app,
+        [
+            "dataset",
+            "create",
+            str(config_filepath),
+            str(input_base_dir),
+            str(tmp_path),
+            "--stream",
+        ],
+    )
+    assert result.exit_code == 0
+
+
 def test_patch_stats(tmp_path, config_filepath, input_base_dir):
     # ensure there's a dataset already created
     create(
         config_filepath,
         input_base_dir=input_base_dir,
         output_base_dir=tmp_path,
+        stream=False,
+        workers=1,
+        variable_store=None,
     )
 
     result = runner.invoke(
@@ -107,3 +130,142 @@ def test_patch_stats(tmp_path, config_filepath, input_base_dir):
         ],
     )
     assert result.exit_code == 0
+
+
+def test_create_many_runner(tmp_path, config_filepath, input_base_dir):
+    config_filepaths = []
+    for name in ["first", "second"]:
+        config_filepaths.append(tmp_path / f"{name}.yml")
+        config_filepaths[-1].write_text(config_filepath.read_text())
+
+    result = runner.invoke(
+        app,
+        [
+            "dataset",
+            "create-many",
+            *map(str, config_filepaths),
+            "--input-base-dir",
+            str(input_base_dir),
+            "--output-base-dir",
+            str(tmp_path),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    for name in ["first", "second"]:
+        dsmeta = DatasetMetadata(name, base_dir=tmp_path)
+        for var_type in ["predictors", "predictands"]:
+            for split in ["train", "val"]:
+                assert_file(dsmeta.path() / split / f"{var_type}.zarr")
+                assert_file(dsmeta.path() / split / f"{var_type}_stats.zarr")
+
+
+def test_create_variable_store(tmp_path, config_filepath, input_base_dir):
+    variable_store_dir = tmp_path / "variables"
+    subset_config_filepath = tmp_path / "subset.yml"
+    subset_config_filepath.write_text(config_filepath.read_text())
+    for filepath in [config_filepath, subset_config_filepath]:
+        result = runner.invoke(
+            app,
+            [
+                "dataset",
+                "create",
+                str(filepath),
+                str(input_base_dir),
+                str(tmp_path),
+                "--variable-store",
+                str(variable_store_dir),
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+    for name in [config_filepath.stem, "subset"]:
+        dsmeta = DatasetMetadata(name, base_dir=tmp_path)
+        for var_type in ["predictors", "predictands"]:
+            for split in ["train", "val"]:
+                assert_file(dsmeta.path() / split / f"{var_type}.zarr", exists=False)
+                ds = open_split(dsmeta.path() / split, var_type)
+                assert ds.sizes["ensemble_member"] == 1
+    # the second dataset's variables are the first's
+    assert len(list(variable_store_dir.glob("*/*_stats_*.zarr"))) == 2 * 2
+
+
+def test_create_variable_store_race(
+    tmp_path, config_filepath, input_base_dir, monkeypatch
+):
+    variable_store_dir = tmp_path / "variables"
+    create(
+        config_filepath,
+        input_base_dir=input_base_dir,
+        output_base_dir=tmp_path,
+        stream=False,
+        workers=1,
+        variable_store=variable_store_dir,
+    )
+    split_stores = dataset_cli._split_stores
+
+    def racing_split_stores(config, var_type, split_name, split_ds, *args):
+        stores, variable_paths = split_stores(
+            config, var_type, split_name, split_ds, *args
+        )
+        # as if the other run published the variables after they were looked for
+        for var_name, path in variable_paths.items():
+            stores.setdefault(path, split_ds[[var_name]])
+        return stores, variable_paths
+
+    monkeypatch.setattr(dataset_cli, "_split_stores", racing_split_stores)
+    subset_config_filepath = tmp_path / "subset.yml"
+    subset_config_filepath.write_text(config_filepath.read_text())
+    create(
+        subset_config_filepath,
+        input_base_dir=input_base_dir,
+        output_base_dir=tmp_path,
+        stream=False,
+        workers=1,
+        variable_store=variable_store_dir,
+    )
+
+    dsmeta = DatasetMetadata("subset", base_dir=tmp_path)
+    for split in ["train", "val"]:
+        assert (
+            open_split(dsmeta.path() / split, "predictors").sizes["ensemble_member"]
+            == 1
+        )
+
+
+def test_extend_runner(tmp_path, config_filepath, input_base_dir):
+    predictands_config_filepath = tmp_path / "predictands-only.yml"
+    predictands_config_filepath.write_text(
+        config_filepath.read_text().replace("    - temp850\n", "    []\n")
+    )
+    create(
+        predictands_config_filepath,
+        input_base_dir=input_base_dir,
+        output_base_dir=tmp_path,
+        stream=False,
+        workers=1,
+        variable_store=None,
+    )
+
+    result = runner.invoke(
+        app,
+        [
+            "dataset",
+            "extend",
+            predictands_config_filepath.stem,
+            "--predictor",
+            "temp850",
+            "--input-base-dir",
+            str(input_base_dir),
+            "--base-dir",
+            str(tmp_path),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    dsmeta = DatasetMetadata(predictands_config_filepath.stem, base_dir=tmp_path)
+    assert dsmeta.config()["predictors"]["variables"] == ["temp850"]
+    for split in ["train", "val"]:
+        ds = xr.open_zarr(dsmeta.path() / split / "predictors.zarr")
+        assert list(ds.data_vars) == ["temp850"]
+        assert_file(dsmeta.path() / split / "predictors_stats.zarr")
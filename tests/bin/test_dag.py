@@ -0,0 +1,162 @@
+from glob import glob
+from importlib.resources import files
+from pathlib import Path
+import sys
+from typer.testing import CliRunner
+
+from mlde_data.bin import app
+from mlde_data.bin.variable import source_filepaths
+from mlde_data.dag import Dag, DagTask, build_etl_dag
+from mlde_data.variable import load_config
+
+runner = CliRunner()
+
+
+def test_plan_and_slurm(tmp_path):
+    config_path = files("mlde_data").joinpath(
+        "../../config/variables/day/land-cpm/targets/pr.yml"
+    )
+
+    result = runner.invoke(
+        app,
+        [
+            "dag",
+            "plan",
+            "1981",
+            "1982",
+            "--variable-configs",
+            str(config_path),
+            "--ensemble-members",
+            "01",
+            "--scale-factor",
+            "1",
+            "--domain",
+            "uk",
+            "--output",
+            str(tmp_path / "dag.json"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "10 tasks in 3 levels" in result.output
+
+    result = runner.invoke(
+        app,
+        [
+            "dag",
+            "slurm",
+            str(tmp_path / "dag.json"),
+            "--output",
+            str(tmp_path / "submit.sh"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "submit.sh").read_text().count("sbatch ") == 3
+
+
+def test_run_batch(tmp_path):
+    Dag(
+        [
+            DagTask(
+                f"evict/{i}",
+                [
+                    "scratch",
+                    "evict",
+                    "--budget",
+                    "1G",
+                    "--base-dir",
+                    str(tmp_path / str(i)),
+                ],
+            )
+            for i in range(3)
+        ]
+    ).save(tmp_path / "dag.json")
+
+    result = runner.invoke(
+        app,
+        [
+            "dag",
+            "run-batch",
+            str(tmp_path / "dag.json"),
+            "--level",
+            "0",
+            "--batch",
+            "1",
+            "--batches",
+            "2",
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "1").exists()
+    assert not (tmp_path / "0").exists()
+
+
+def test_run_failing_command(tmp_path):
+    Dag(
+        [
+            DagTask("status", ["etl", "status", str(tmp_path / "missing.json")]),
+            DagTask(
+                "evict",
+                ["scratch", "evict", "--base-dir", str(tmp_path / "scratch")],
+                depends_on=["status"],
+            ),
+        ]
+    ).save(tmp_path / "dag.json")
+
+    result = runner.invoke(app, ["dag", "run", str(tmp_path / "dag.json")])
+
+    # the task exits with code 1 rather than raising so its dependents must not run
+    assert result.exit_code != 0
+    assert "exited with code 1" in str(result.exception)
+    assert not (tmp_path / "scratch").exists()
+
+
+def test_etl_dag_creates_from_extracts(tmp_path, monkeypatch):
+    from mlde_data.moose_simulator import MooseArchiveSimulator
+
+    archive_dir = tmp_path / "archive"
+    MooseArchiveSimulator(archive_dir).populate("psl", 1981, "r001i1p00000")
+    monkeypatch.setenv(
+        "MOO_COMMAND", f"{sys.executable} -m mlde_data.bin.moose_simulator"
+    )
+    monkeypatch.setenv("MOO_SIMULATOR_ARCHIVE", str(archive_dir))
+    config_path = files("mlde_data").joinpath(
+        "../../config/variables/day/land-cpm/predictors/psl.yml"
+    )
+    dag = build_etl_dag(
+        [1981],
+        [config_path],
+        ["r001i1p00000"],
+        scale_factor="1",
+        domain="uk",
+        extracts_base_dir=tmp_path / "pp",
+    )
+    assert list(dag.tasks) == [
+        "extract/psl/r001i1p00000/1981",
+        "create/psl/r001i1p00000/1981",
+        "clean/psl/r001i1p00000/1981",
+    ]
+
+    result = runner.invoke(app, dag.tasks["extract/psl/r001i1p00000/1981"].command)
+    assert result.exit_code == 0, result.output
+
+    # the files create opens are the ones extract wrote
+    create_command = dag.tasks["create/psl/r001i1p00000/1981"].command
+    assert "--yearly-extracts" in create_command
+    input_base_dir = Path(create_command[create_command.index("--input-base-dir") + 1])
+    create_inputs = source_filepaths(
+        load_config(config_path, scale_factor="1", domain="uk")["sources"],
+        1981,
+        "r001i1p00000",
+        base_dir=input_base_dir,
+        yearly_extracts=True,
+    )
+    extracted = set(glob(str(tmp_path / "pp" / "**" / "*.pp"), recursive=True))
+    assert len(extracted) > 0
+    assert {
+        filepath for pattern in create_inputs for filepath in glob(str(pattern))
+    } == extracted
+
+    result = runner.invoke(app, dag.tasks["clean/psl/r001i1p00000/1981"].command)
+    assert result.exit_code == 0, result.output
+    assert glob(str(tmp_path / "pp" / "**" / "*.pp"), recursive=True) == []
@@ -0,0 +1,81 @@
+from functools import partial
+from importlib.resources import files
+from typer.testing import CliRunner
+
+from mlde_data.bin import app, etl
+from mlde_data.manifest import RunManifest, Task
+
+runner = CliRunner()
+
+
+def test_status(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    manifest.plan([Task("create", "pr", "01", year) for year in [1981, 1982, 1983]])
+    manifest.run([Task("create", "pr", "01", 1981)], lambda: [])
+    manifest.failed(Task("create", "pr", "01", 1982), MemoryError("out of memory"))
+
+    result = runner.invoke(app, ["etl", "status", str(tmp_path / "manifest.json")])
+
+    assert result.exit_code == 0, result.output
+    assert "create: 1 pending, 0 running, 1 done, 1 failed" in result.output
+    assert "failed: create pr 01 1982: MemoryError: out of memory" in result.output
+
+
+def test_status_missing_manifest(tmp_path):
+    result = runner.invoke(app, ["etl", "status", str(tmp_path / "manifest.json")])
+
+    assert result.exit_code == 1
+
+
+_create_year = etl._create_year
+
+
+def _fake_create_variable(output_dir, year, **kwargs):
+    # the create stage runs in a worker process so record each attempt in a file
+    attempts = len(list(output_dir.glob(f"created-{year}-*")))
+    (output_dir / f"created-{year}-{attempts}").touch()
+    if year == 1982 and attempts == 0:
+        raise MemoryError("out of memory")
+    output_filepath = output_dir / f"pr-{year}.nc"
+    output_filepath.write_bytes(b"data")
+    return {"pr": [output_filepath]}
+
+
+def _create_year_with_fake(manifest_path, *args, **kwargs):
+    etl.create_variable = partial(_fake_create_variable, manifest_path.parent)
+    return _create_year(manifest_path, *args, **kwargs)
+
+
+def _created(tmp_path):
+    return sorted(int(path.name.split("-")[1]) for path in tmp_path.glob("created-*"))
+
+
+def test_ceda_resumes_from_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(etl, "_create_year", _create_year_with_fake)
+    config_path = files("mlde_data").joinpath(
+        "../../config/variables/1hr/land-cpm/targets/pr.yml"
+    )
+    args = ["etl", "ceda", "1981", "1982", "1983"] + [
+        "--variable-configs",
+        str(config_path),
+        "--ensemble-member",
+        "r001i1p00000",
+        "--scale-factor",
+        "1",
+        "--domain",
+        "engwales",
+        "--manifest",
+        str(tmp_path / "manifest.json"),
+    ]
+
+    result = runner.invoke(app, args)
+    assert result.exit_code != 0
+    assert _created(tmp_path) == [1981, 1982, 1983]
+
+    result = runner.invoke(app, args)
+    assert result.exit_code == 0, result.output
+    # only the failed year is run again
+    assert _created(tmp_path) == [1981, 1982, 1982, 1983]
+    assert RunManifest(tmp_path / "manifest.json").summary() == {
+        "create": {"pending": 0, "running": 0, "done": 3, "failed": 0}
+    }
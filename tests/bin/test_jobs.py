@@ -0,0 +1,67 @@
+from typer.testing import CliRunner
+
+from mlde_data.bin import app
+from mlde_data.jobqueue import JobQueue
+
+runner = CliRunner()
+
+
+def test_submit_and_serve(tmp_path):
+    result = runner.invoke(
+        app, ["submit", "--no-wait", str(tmp_path), "dataset", "--help"]
+    )
+    assert result.exit_code == 0, result.output
+    job_id = result.stdout.strip().splitlines()[-1]
+    assert JobQueue(tmp_path).get(job_id).command == ["dataset", "--help"]
+
+    result = runner.invoke(
+        app,
+        ["serve", str(tmp_path), "--poll-interval", "0.01", "--idle-timeout", "0.1"],
+    )
+    assert result.exit_code == 0, result.output
+
+    queue = JobQueue(tmp_path)
+    assert queue.get(job_id).state == "done"
+    assert "Usage:" in queue.log_path(job_id).read_text()
+
+
+def test_submit_not_allowed(tmp_path):
+    result = runner.invoke(app, ["submit", str(tmp_path), "scratch", "evict"])
+
+    assert result.exit_code != 0
+    assert JobQueue(tmp_path).jobs("pending") == []
+
+
+def test_requeue(tmp_path):
+    queue = JobQueue(tmp_path)
+    job = queue.submit(["dataset", "--help"])
+    queue.claim("worker-1")
+
+    result = runner.invoke(app, ["requeue", str(tmp_path), "--heartbeat-timeout", "0"])
+
+    assert result.exit_code == 0, result.output
+    assert f"Requeued job {job.id}" in result.output
+    assert queue.jobs("pending") == [job.id]
+
+
+def test_serve_failing_command(tmp_path):
+    queue = JobQueue(tmp_path / "queue")
+    # missing its required options
+    job = queue.submit(["variable", "create"])
+
+    result = runner.invoke(
+        app,
+        [
+            "serve",
+            str(tmp_path / "queue"),
+            "--poll-interval",
+            "0.01",
+            "--idle-timeout",
+            "0.1",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    # the command exits with code 2 rather than raising
+    assert queue.get(job.id).state == "failed"
+    assert "exited with code 2" in queue.get(job.id).error
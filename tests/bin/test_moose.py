@@ -1,10 +1,13 @@
+import json
 import iris
 import numpy as np
 import os
+import sys
 from pathlib import Path
 from typer.testing import CliRunner
 
 from mlde_data.bin import app
+from mlde_data.bin import moose as moose_cli
 from mlde_data.bin.moose import MoosePPVariableMetadata
 from mlde_utils import VariableMetadata
 
@@ -74,3 +77,164 @@ def test_convert(tmp_path):
 
     for c1, c2 in zip(iris.load(str(output_filepath)), iris.load(input_glob)):
         assert np.all(c1.data == c2.data)
+
+
+def test_convert_many(tmp_path, pp_base_dir):
+    output_base_dir = tmp_path / "nc"
+    years = [1981, 1982]
+
+    result = runner.invoke(
+        app,
+        [
+            "moose",
+            "convert-many",
+            "--collection",
+            "land-cpm",
+            "--ensemble-member",
+            "r001i1p00000",
+            "--years",
+            str(years[0]),
+            "--years",
+            str(years[1]),
+            "--variables",
+            "psl",
+            "--input-base-dir",
+            str(pp_base_dir),
+            "--output-base-dir",
+            str(output_base_dir),
+            "--workers",
+            "2",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    for year in years:
+        input_glob = MoosePPVariableMetadata(
+            base_dir=pp_base_dir,
+            collection="land-cpm",
+            scenario="rcp85",
+            ensemble_member="r001i1p00000",
+            variable="psl",
+            frequency="day",
+            resolution="2.2km",
+            domain="uk",
+        ).pp_files_glob(year)
+
+        output_filepath = VariableMetadata(
+            base_dir=output_base_dir,
+            collection="land-cpm",
+            scenario="rcp85",
+            ensemble_member="r001i1p00000",
+            variable="psl",
+            frequency="day",
+            resolution="2.2km",
+            domain="uk",
+        ).filepath(year)
+
+        (expected,) = iris.load(input_glob)
+        (actual,) = iris.load(str(output_filepath))
+        assert np.all(actual.data == expected.data)
+
+
+def test_convert_many_waits_for_saves(tmp_path, pp_base_dir, monkeypatch):
+    output_base_dir = tmp_path / "nc"
+    decoded_with_saved = []
+    open_pp_data = moose_cli.open_pp_data
+
+    def recording_open_pp_data(*args, **kwargs):
+        decoded_with_saved.append(len(list(output_base_dir.glob("**/*.nc"))))
+        return open_pp_data(*args, **kwargs)
+
+    monkeypatch.setattr(moose_cli, "open_pp_data", recording_open_pp_data)
+
+    result = runner.invoke(
+        app,
+        [
+            "moose",
+            "convert-many",
+            "--collection",
+            "land-cpm",
+            "--ensemble-member",
+            "r001i1p00000",
+            "--years",
+            "1981",
+            "--years",
+            "1982",
+            "--variables",
+            "psl",
+            "--input-base-dir",
+            str(pp_base_dir),
+            "--output-base-dir",
+            str(output_base_dir),
+            "--workers",
+            "1",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    # with one worker a year is only decoded once the previous one has been saved
+    assert decoded_with_saved == [0, 1]
+
+
+def test_extract_metrics(tmp_path, monkeypatch):
+    from mlde_data.moose_simulator import MooseArchiveSimulator
+
+    archive_dir = tmp_path / "archive"
+    MooseArchiveSimulator(archive_dir).populate("psl", 1981, "r001i1p00000")
+    monkeypatch.setenv(
+        "MOO_COMMAND", f"{sys.executable} -m mlde_data.bin.moose_simulator"
+    )
+    monkeypatch.setenv("MOO_SIMULATOR_ARCHIVE", str(archive_dir))
+
+    def extract(year):
+        return runner.invoke(
+            app,
+            [
+                "moose",
+                "extract",
+                "--collection",
+                "land-cpm",
+                "--ensemble-member",
+                "r001i1p00000",
+                "--year",
+                str(year),
+                "--variable",
+                "psl",
+                "--base-dir",
+                str(tmp_path / "pp"),
+                "--retries",
+                "1",
+                "--progress-interval",
+                "0.1",
+            ],
+        )
+
+    def metrics(year):
+        metrics_filepath = Path(
+            MoosePPVariableMetadata(
+                base_dir=tmp_path / "pp",
+                collection="land-cpm",
+                scenario="rcp85",
+                ensemble_member="r001i1p00000",
+                variable="psl",
+                frequency="day",
+                resolution="2.2km",
+                domain="uk",
+            ).moose_extract_dirpath(year),
+            "metrics.json",
+        )
+        return json.loads(metrics_filepath.read_text())
+
+    result = extract(1981)
+    assert result.exit_code == 0, result.output
+    assert metrics(1981)["fields"] == 360
+    assert metrics(1981)["expected_fields"] == 360
+    assert metrics(1981)["bytes"] > 0
+    assert metrics(1981)["retries"] == 0
+
+    # an empty archive so both attempts fail
+    monkeypatch.setenv("MOO_SIMULATOR_ARCHIVE", str(tmp_path / "empty-archive"))
+    result = extract(1982)
+    assert result.exit_code != 0
+    assert metrics(1982)["retries"] == 1
+    assert not metrics(1982)["succeeded"]
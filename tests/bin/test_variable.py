@@ -5,7 +5,10 @@ from typer.testing import CliRunner
 import xarray as xr
 
 from mlde_utils import VariableMetadata
-from mlde_data.bin import app
+from mlde_data.bin import app, variable
+from mlde_data.bin.variable import source_dropped_variables, source_filepaths
+from mlde_data.staging import SourceStager
+from mlde_data.variable import SourceVariableConfig, load_config
 
 runner = CliRunner()
 
@@ -221,3 +224,227 @@ def test_create_4x_engwales_target(tmp_path):
     ).filepath(year)
 
     xr.open_dataset(output_filepath)  # will raise error if file is invalid
+
+
+CANARI_PSL_CONFIG = """
+variable: psl
+attrs:
+  units: Pa
+  standard_name: air_pressure_at_sea_level
+sources:
+  type: canari-le-sprint
+  collection: canari-le-sprint
+  frequency: day
+  variables:
+    - name: psl
+spec:
+  - action: shift_lon_break
+  - action: select-subdomain
+    parameters:
+      domain: $domain
+"""
+
+
+def test_create_ensemble(tmp_path, canari_base_path):
+    config_path = tmp_path / "psl.yml"
+    config_path.write_text(CANARI_PSL_CONFIG)
+    output_base_dir = tmp_path / "output"
+
+    common_args = [
+        "--config-paths",
+        str(config_path),
+        "--year",
+        "1981",
+        "--domain",
+        "engwales",
+        "--scale-factor",
+        "1",
+    ]
+    result = runner.invoke(
+        app,
+        ["variable", "create-ensemble", "--ensemble-members", "2"]
+        + ["--ensemble-members", "5"]
+        + common_args
+        + ["--output-base-dir", str(output_base_dir / "ensemble")],
+    )
+    assert result.exit_code == 0, result.output
+
+    result = runner.invoke(
+        app,
+        ["variable", "create", "--ensemble-member", "5"]
+        + common_args
+        + ["--output-base-dir", str(output_base_dir / "single")],
+    )
+    assert result.exit_code == 0, result.output
+
+    def output(base_dir, ensemble_member):
+        return xr.open_dataset(
+            VariableMetadata(
+                base_dir=base_dir,
+                collection="canari-le-sprint",
+                scenario="rcp85",
+                ensemble_member=ensemble_member,
+                variable="psl",
+                frequency="day",
+                resolution="60km",
+                domain="engwales",
+            ).filepath(1981)
+        )
+
+    ensemble_ds = output(output_base_dir / "ensemble", "5")
+    assert ensemble_ds["psl"].shape == (360, 13, 13)
+    assert "ensemble_member" not in ensemble_ds.dims
+    xr.testing.assert_identical(ensemble_ds, output(output_base_dir / "single", "5"))
+    assert output(output_base_dir / "ensemble", "2")["psl"].shape == (360, 13, 13)
+
+
+def test_create_computes_once(tmp_path, canari_base_path, monkeypatch):
+    config_path = tmp_path / "psl.yml"
+    config_path.write_text(CANARI_PSL_CONFIG)
+    validated = []
+    monkeypatch.setattr(
+        variable, "_validate", lambda ds, config: validated.append(ds.chunks)
+    )
+
+    result = runner.invoke(
+        app,
+        [
+            "variable",
+            "create",
+            "--config-paths",
+            str(config_path),
+            "--year",
+            "1981",
+            "--ensemble-member",
+            "5",
+            "--domain",
+            "engwales",
+            "--scale-factor",
+            "1",
+            "--output-base-dir",
+            str(tmp_path / "output"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    # the data validated (and then saved) is already computed rather than lazy
+    assert validated == [{}]
+
+    result = runner.invoke(
+        app,
+        [
+            "variable",
+            "create-ensemble",
+            "--ensemble-members",
+            "2",
+            "--ensemble-members",
+            "5",
+            "--config-paths",
+            str(config_path),
+            "--year",
+            "1981",
+            "--domain",
+            "engwales",
+            "--scale-factor",
+            "1",
+            "--output-base-dir",
+            str(tmp_path / "ensemble"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    assert validated == [{}, {}, {}]
+
+
+def test_create_staged(tmp_path, canari_base_path):
+    config_path = tmp_path / "psl.yml"
+    config_path.write_text(CANARI_PSL_CONFIG)
+    src_configs = load_config(config_path, scale_factor="1", domain="engwales")[
+        "sources"
+    ]
+    filepaths = source_filepaths(src_configs, 1981, "5")
+    assert len(filepaths) == 2
+
+    with SourceStager(tmp_path / "stage") as stager:
+        stager.prefetch("1981", filepaths)
+        assert stager.wait("1981")
+        # only the staged copies are left to read from
+        for filepath in filepaths:
+            os.remove(filepath)
+
+        result = runner.invoke(
+            app,
+            [
+                "variable",
+                "create",
+                "--config-paths",
+                str(config_path),
+                "--year",
+                "1981",
+                "--ensemble-member",
+                "5",
+                "--domain",
+                "engwales",
+                "--scale-factor",
+                "1",
+                "--output-base-dir",
+                str(tmp_path / "output"),
+                "--stage-dir",
+                str(stager.stage_dir),
+            ],
+        )
+    assert result.exit_code == 0, result.output
+
+
+def test_index(tmp_path):
+    meta = VariableMetadata(
+        tmp_path,
+        variable="tas",
+        frequency="day",
+        domain="test",
+        resolution="60km",
+        ensemble_member="01",
+        scenario="rcp85",
+        collection="land-gcm",
+    )
+    os.makedirs(meta.dirpath())
+    xr.Dataset(
+        {"tas": (["time"], [1.0, 2.0])},
+        coords={"time": xr.date_range("1980-12-01", periods=2, use_cftime=True)},
+    ).to_netcdf(meta.filepath(1981))
+
+    result = runner.invoke(app, ["variable", "index", str(tmp_path)])
+
+    assert result.exit_code == 0, result.output
+    assert os.path.exists(os.path.join(meta.dirpath(), "index.json"))
+
+
+def test_source_dropped_variables():
+    configs = [
+        {
+            "variable": "test",
+            "spec": [
+                {"action": "drop-variables", "parameters": {"variables": ["foo"]}}
+            ],
+        }
+    ]
+
+    moose_sources = {
+        SourceVariableConfig(
+            src_type="moose", collection="land-cpm", frequency="day", variable="mlqtw"
+        )
+    }
+    assert source_dropped_variables(moose_sources, configs) == {"foo"}
+
+    # only moose extracts are opened without the dropped variables
+    local_sources = {
+        SourceVariableConfig(
+            src_type="local",
+            collection="land-cpm",
+            frequency="day",
+            variable="pr",
+            resolution="2.2km-coarsened-4x",
+            domain="uk",
+        )
+    }
+    assert source_dropped_variables(local_sources, configs) == frozenset()
@@ -0,0 +1,163 @@
+import cf_units
+import iris
+from iris.coords import AuxCoord, DimCoord
+from iris.cube import Cube
+from iris.fileformats.pp import STASH
+import numpy as np
+import os
+import pytest
+import xarray as xr
+
+from mlde_data.canari_le_sprint_variable_adapter import CanariLESprintVariableAdapter
+from mlde_data.moose import MoosePPVariableMetadata
+
+CPM_COORD_SYSTEM = iris.coord_systems.RotatedGeogCS(
+    37.5, 177.5, ellipsoid=iris.coord_systems.GeogCS(6371229.0)
+)
+
+
+def pp_month_cube(
+    year,
+    month,
+    stash=(1, 16, 222),
+    name="air_pressure_at_sea_level",
+    units="Pa",
+    pressure=None,
+):
+    """
+    A small month of daily CPM-like data that can be saved as a pp file
+    """
+    time_unit = cf_units.Unit("hours since 1970-01-01 00:00:00", calendar="360_day")
+    first_hour = time_unit.date2num(
+        cf_units.cftime.Datetime360Day(year, month, 1, 12, 0, 0, 0)
+    )
+    time = DimCoord(
+        first_hour + np.arange(30) * 24.0,
+        standard_name="time",
+        units=time_unit,
+    )
+    grid_latitude = DimCoord(
+        np.linspace(-1, 1, 4),
+        standard_name="grid_latitude",
+        units="degrees",
+        coord_system=CPM_COORD_SYSTEM,
+    )
+    grid_longitude = DimCoord(
+        np.linspace(359, 361, 5),
+        standard_name="grid_longitude",
+        units="degrees",
+        coord_system=CPM_COORD_SYSTEM,
+    )
+    cube = Cube(
+        np.random.rand(30, 4, 5).astype("float32"),
+        standard_name=name,
+        units=units,
+        dim_coords_and_dims=[(time, 0), (grid_latitude, 1), (grid_longitude, 2)],
+        attributes={"STASH": STASH(*stash)},
+    )
+    if pressure is not None:
+        cube.add_aux_coord(AuxCoord(pressure, long_name="pressure", units="hPa"))
+    return cube
+
+
+def save_pp_year(dirpath, year, prefix="abcdea.pa"):
+    """
+    Save a project year (Dec to Nov) of synthetic daily data as monthly pp files
+    """
+    os.makedirs(dirpath, exist_ok=True)
+    filepaths = []
+    for pp_year, month in [(year - 1, 12)] + [(year, m) for m in range(1, 12)]:
+        filepath = os.path.join(dirpath, f"{prefix}{pp_year}{month:02d}.pp")
+        iris.save(pp_month_cube(pp_year, month), filepath)
+        filepaths.append(filepath)
+    return filepaths
+
+
+@pytest.fixture
+def pp_base_dir(tmp_path):
+    """
+    A moose pp extract tree with psl for two years of a single CPM ensemble member
+    """
+    base_dir = tmp_path / "pp"
+    varmeta = MoosePPVariableMetadata(
+        base_dir=base_dir,
+        collection="land-cpm",
+        scenario="rcp85",
+        ensemble_member="r001i1p00000",
+        variable="psl",
+        frequency="day",
+        resolution="2.2km",
+        domain="uk",
+    )
+    for year in [1981, 1982]:
+        save_pp_year(varmeta.ppdata_dirpath(year), year)
+    return base_dir
+
+
+CANARI_NLAT = 144
+CANARI_NLON = 192
+
+
+def _canari_year_dataset(canari_year):
+    time = xr.date_range(
+        f"{canari_year}-01-01T12:00",
+        periods=360,
+        freq="D",
+        calendar="360_day",
+        use_cftime=True,
+    )
+    lat = np.linspace(-89.375, 89.375, CANARI_NLAT)
+    lon = np.linspace(0, 360, CANARI_NLON, endpoint=False)
+    return xr.Dataset(
+        {
+            "m01s16i222_4": (
+                ["time_counter", "lat", "lon"],
+                np.random.rand(360, CANARI_NLAT, CANARI_NLON).astype("float32"),
+            ),
+            "time_counter_bounds": (
+                ["time_counter", "axis_nbounds"],
+                np.stack([time, time], axis=1),
+            ),
+            "bounds_lat": (["lat", "axis_nbounds"], np.stack([lat, lat], axis=1)),
+            "bounds_lon": (["lon", "axis_nbounds"], np.stack([lon, lon], axis=1)),
+        },
+        coords=dict(
+            time_counter=time,
+            lat=(
+                ["lat"],
+                lat,
+                {"standard_name": "latitude", "units": "degrees_north", "axis": "Y"},
+            ),
+            lon=(
+                ["lon"],
+                lon,
+                {"standard_name": "longitude", "units": "degrees_east", "axis": "X"},
+            ),
+        ),
+    )
+
+
+@pytest.fixture
+def canari_base_path(tmp_path, monkeypatch):
+    """
+    A synthetic large ensemble of global daily psl for 1981.
+
+    Every member links to the same pair of yearly files to keep the fixture small on disk.
+    """
+    shared_filepaths = {}
+    for canari_year in [1980, 1981]:
+        shared_filepaths[canari_year] = tmp_path / f"psl_{canari_year}.nc"
+        _canari_year_dataset(canari_year).to_netcdf(shared_filepaths[canari_year])
+
+    monkeypatch.setattr(
+        CanariLESprintVariableAdapter, "CANARI_LE_BASE_PATH", str(tmp_path / "le")
+    )
+    for member in range(1, 41):
+        adapter = CanariLESprintVariableAdapter(
+            variable="psl", ensemble_member=str(member), frequency="day", year=1981
+        )
+        for canari_year, filepath in zip([1980, 1981], adapter.filepaths):
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            os.symlink(shared_filepaths[canari_year], filepath)
+
+    return tmp_path / "le"
@@ -0,0 +1,23 @@
+import pytest
+
+from mlde_data.dataset.base_split import period_years, project_year
+
+
+@pytest.mark.parametrize(
+    "date,end,expected",
+    [
+        ("1980-12-01", False, 1981),
+        ("1981-11-30", True, 1981),
+        ("1981-06", False, 1981),
+        ("1981", False, 1981),
+        ("1981", True, 1982),
+    ],
+)
+def test_project_year(date, end, expected):
+    assert project_year(date, end=end) == expected
+
+
+def test_period_years():
+    assert period_years(
+        [["1980-12-01", "1982-11-30"], ["2000-12-01", "2001-11-30"]]
+    ) == [1981, 1982, 2001]
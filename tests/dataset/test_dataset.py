@@ -1,18 +1,26 @@
+import copy
 import cftime
-from mlde_utils import VariableMetadata
+from mlde_utils import DatasetMetadata, VariableMetadata
 import numpy as np
 import numpy.testing as npt
 import os
 import pytest
 import xarray as xr
+import yaml
 
-from mlde_data import dataset
+from mlde_data import dataset, variable_index
+from mlde_data.dataset import extend, streaming
 
 
 @pytest.fixture
-def config():
+def ensemble_members():
+    return ["r001i1p00000"]
+
+
+@pytest.fixture
+def config(ensemble_members):
     return {
-        "ensemble_members": ["r001i1p00000"],
+        "ensemble_members": ensemble_members,
         "scenario": "rcp85",
         "predictands": {
             "collection": "land-cpm",
@@ -276,4 +284,316 @@ def test_create_time_aggregated_statistics(hourly_predictands_variable_files, co
                         ]
                         .values
                     )
-                    npt.assert_equal(actual, expected)
+                    if time_factor == 1:
+                        npt.assert_equal(actual, expected)
+                    else:
+                        # coarser sums are built up from finer ones so may differ by rounding
+                        npt.assert_allclose(actual, expected)
+
+
+@pytest.mark.parametrize("ensemble_members", [["r001i1p00000", "r002i1p00000"]])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_write_split_streaming(tmp_path, variable_files, config, workers):
+    input_base_dir = variable_files
+    expected_splits, expected_stats = dataset.create(config, input_base_dir)
+
+    split_sets = streaming.plan_splits(config, input_base_dir)
+
+    assert set(split_sets.keys()) == {"train", "val", "test"}
+    for var_type in ["predictors", "predictands"]:
+        path = tmp_path / f"{var_type}.zarr"
+        stats = streaming.write_split(
+            config,
+            var_type,
+            split_sets["train"],
+            input_base_dir,
+            path,
+            workers=workers,
+        )
+
+        ds = xr.open_zarr(path)
+        expected = expected_splits[var_type]["train"]
+        assert ds.sizes == expected.sizes
+        assert list(ds["ensemble_member"].values) == config["ensemble_members"]
+        for var_name in config[var_type]["variables"]:
+            assert ds[var_name].dims == expected[var_name].dims
+            assert ds[var_name].chunks[0] == (1, 1)
+            npt.assert_array_equal(ds[var_name].values, expected[var_name].values)
+        for stat in ["count", "mean", "std", "max", "min"]:
+            npt.assert_allclose(
+                stats[stat].values, expected_stats[var_type]["train"][stat].values
+            )
+
+
+def test_calculate_statistics_merges_chunks():
+    values = np.random.randn(2, 48, 3, 3)
+    values[0, 5, 1, 1] = np.nan
+    ds = xr.Dataset(
+        {"pr": (["ensemble_member", "time", "grid_latitude", "grid_longitude"], values)}
+    ).chunk({"ensemble_member": 1, "time": 12})
+
+    stats = dataset._calculate_statistics(ds, ["pr"], [1, 6])
+
+    for time_factor in [1, 6]:
+        if time_factor == 1:
+            expected = values
+        else:
+            expected = ds["pr"].coarsen(time=time_factor).sum().values
+        actual = stats.sel(variable="pr", time_aggregation_factor=time_factor)
+        assert actual["count"].values == np.count_nonzero(~np.isnan(expected))
+        npt.assert_allclose(actual["mean"].values, np.nanmean(expected))
+        npt.assert_allclose(actual["std"].values, np.nanstd(expected))
+        npt.assert_equal(actual["max"].values, np.nanmax(expected))
+        npt.assert_equal(actual["min"].values, np.nanmin(expected))
+
+
+def test_aggregation_pyramid():
+    da = xr.DataArray(np.random.randn(2, 72), dims=["ensemble_member", "time"]).chunk(
+        {"time": 24}
+    )
+
+    pyramid = dataset.aggregation_pyramid(da, [24, 1, 3, 4, 6])
+
+    assert list(pyramid.keys()) == [24, 1, 3, 4, 6]
+    assert pyramid[1] is da
+    for factor in [3, 4, 6, 24]:
+        npt.assert_allclose(
+            pyramid[factor].values, da.coarsen(time=factor).sum().values
+        )
+    # 6 hourly sums are built from 3 hourly ones and daily from 6 hourly, 4 is not nested so comes from the data
+    assert pyramid[3].data.name in pyramid[6].data.dask.layers
+    assert pyramid[6].data.name in pyramid[24].data.dask.layers
+    assert pyramid[3].data.name not in pyramid[4].data.dask.layers
+
+
+def test_create_opens_only_split_years(variable_files, config):
+    input_base_dir = variable_files
+    # files for a year outside the split's time period that cannot be opened
+    for var_type in ["predictors", "predictands"]:
+        for var_name in config[var_type]["variables"]:
+            meta = VariableMetadata(
+                input_base_dir,
+                ensemble_member="r001i1p00000",
+                variable=var_name,
+                scenario=config["scenario"],
+                **{
+                    k: config[var_type][k]
+                    for k in ["collection", "domain", "frequency", "resolution"]
+                },
+            )
+            with open(meta.filepath(1982), "w") as f:
+                f.write("not a netCDF file")
+
+    result, _ = dataset.create(config, input_base_dir)
+
+    assert result["predictors"]["train"].sizes["time"] == 216
+
+
+def test_single_variable_indexed(variable_files, config, monkeypatch):
+    input_base_dir = variable_files
+    var_config = {k: config[k] for k in ["scenario"]} | {
+        k: config["predictors"][k]
+        for k in ["resolution", "collection", "frequency", "domain"]
+    }
+    expected = dataset._single_variable(
+        "r001i1p00000", "input1", input_base_dir, **var_config
+    )
+    variable_index.update_indexes(input_base_dir)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("files opened rather than indexed")
+
+    monkeypatch.setattr(xr, "open_mfdataset", fail)
+    result = dataset._single_variable(
+        "r001i1p00000", "input1", input_base_dir, years=[1981], **var_config
+    )
+
+    xr.testing.assert_identical(result.load(), expected.load())
+
+
+def test_create_many(variable_files, config, monkeypatch):
+    input_base_dir = variable_files
+    other_config = config | {
+        "predictors": config["predictors"] | {"variables": ["input2"]}
+    }
+    expected = {
+        "all": dataset.create(config, input_base_dir),
+        "input2": dataset.create(other_config, input_base_dir),
+    }
+    opened = []
+    single_variable = dataset._single_variable
+    monkeypatch.setattr(
+        dataset,
+        "_single_variable",
+        lambda em, var_name, *args, **kwargs: opened.append((em, var_name))
+        or single_variable(em, var_name, *args, **kwargs),
+    )
+
+    result = dataset.create_many(
+        {"all": config, "input2": other_config}, input_base_dir
+    )
+
+    # each variable of each ensemble member is only opened once
+    assert sorted(opened) == sorted(
+        ("r001i1p00000", var) for var in ["output1", "output2", "input1", "input2"]
+    )
+    for name in ["all", "input2"]:
+        split_sets, split_stats = result[name]
+        expected_sets, expected_stats = expected[name]
+        for var_type in ["predictands", "predictors"]:
+            for split in ["train", "val", "test"]:
+                xr.testing.assert_identical(
+                    split_sets[var_type][split], expected_sets[var_type][split]
+                )
+                xr.testing.assert_identical(
+                    split_stats[var_type][split], expected_stats[var_type][split]
+                )
+
+
+def save_dataset(config, input_base_dir, dsmeta):
+    split_sets, split_stats = dataset.create(config, input_base_dir)
+    os.makedirs(dsmeta.path())
+    with open(dsmeta.config_path(), "w") as f:
+        yaml.dump(config, f)
+    for var_type, var_type_splits in split_sets.items():
+        for split, split_ds in var_type_splits.items():
+            dataset.rechunk(split_ds, var_type).to_zarr(
+                dsmeta.path() / split / f"{var_type}.zarr"
+            )
+            split_stats[var_type][split].to_zarr(
+                dsmeta.path() / split / f"{var_type}_stats.zarr"
+            )
+
+
+@pytest.mark.parametrize("ensemble_members", [["r001i1p00000", "r002i1p00000"]])
+def test_extend(tmp_path, variable_files, config, monkeypatch):
+    input_base_dir = variable_files
+    dsmeta = DatasetMetadata("test-dataset", base_dir=tmp_path / "datasets")
+    initial_config = copy.deepcopy(config)
+    initial_config["ensemble_members"] = ["r001i1p00000"]
+    initial_config["predictors"]["variables"] = ["input1"]
+    save_dataset(initial_config, input_base_dir, dsmeta)
+    expected_sets, expected_stats = dataset.create(config, input_base_dir)
+    opened = []
+    single_variable = dataset._single_variable
+    monkeypatch.setattr(
+        dataset,
+        "_single_variable",
+        lambda em, var_name, *args, **kwargs: opened.append((em, var_name))
+        or single_variable(em, var_name, *args, **kwargs),
+    )
+
+    result = extend.extend(
+        dsmeta.name,
+        input_base_dir,
+        dsmeta.base_dir,
+        ensemble_members=["r002i1p00000"],
+        variables={"predictors": ["input2"]},
+    )
+
+    assert result == config
+    assert dsmeta.config() == config
+    # only the new data is read
+    assert sorted(opened) == sorted(
+        [("r002i1p00000", var) for var in ["output1", "output2", "input1"]]
+        + [(em, "input2") for em in config["ensemble_members"]]
+    )
+    for var_type in ["predictands", "predictors"]:
+        for split in ["train", "val", "test"]:
+            split_ds = xr.open_zarr(dsmeta.path() / split / f"{var_type}.zarr")
+            xr.testing.assert_identical(
+                split_ds.load(), expected_sets[var_type][split].load()
+            )
+            stats = xr.open_zarr(dsmeta.path() / split / f"{var_type}_stats.zarr")
+            xr.testing.assert_allclose(stats.load(), expected_stats[var_type][split])
+
+
+@pytest.mark.parametrize("ensemble_members", [["r001i1p00000", "r002i1p00000"]])
+@pytest.mark.parametrize("fail_in", ["_write_split", "_replace"])
+def test_extend_partly_extended(tmp_path, variable_files, config, monkeypatch, fail_in):
+    input_base_dir = variable_files
+    dsmeta = DatasetMetadata("test-dataset", base_dir=tmp_path / "datasets")
+    initial_config = copy.deepcopy(config)
+    initial_config["ensemble_members"] = ["r001i1p00000"]
+    initial_config["predictors"]["variables"] = ["input1"]
+    save_dataset(initial_config, input_base_dir, dsmeta)
+    expected_sets, expected_stats = dataset.create(config, input_base_dir)
+
+    # fail part-way through adding the staged data: before a later split is extended or after
+    # appending to a split but before its statistics are updated
+    calls = []
+    original = getattr(extend, fail_in)
+
+    def fail_second_call(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise OSError("Interrupted")
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(extend, fail_in, fail_second_call)
+    with pytest.raises(OSError, match="Interrupted"):
+        extend.extend(
+            dsmeta.name,
+            input_base_dir,
+            dsmeta.base_dir,
+            ensemble_members=["r002i1p00000"],
+            variables={"predictors": ["input2"]},
+        )
+    assert dsmeta.config() == initial_config
+    monkeypatch.setattr(extend, fail_in, original)
+
+    result = extend.extend(
+        dsmeta.name,
+        input_base_dir,
+        dsmeta.base_dir,
+        ensemble_members=["r002i1p00000"],
+        variables={"predictors": ["input2"]},
+    )
+
+    assert result == config
+    for var_type in ["predictands", "predictors"]:
+        for split in ["train", "val", "test"]:
+            split_ds = xr.open_zarr(dsmeta.path() / split / f"{var_type}.zarr")
+            xr.testing.assert_identical(
+                split_ds.load(), expected_sets[var_type][split].load()
+            )
+            stats = xr.open_zarr(dsmeta.path() / split / f"{var_type}_stats.zarr")
+            xr.testing.assert_allclose(stats.load(), expected_stats[var_type][split])
+    assert not any(dsmeta.path().glob("*/.*"))
+
+
+@pytest.mark.parametrize("ensemble_members", [["r001i1p00000", "r002i1p00000"]])
+def test_extend_different_data(tmp_path, variable_files, config):
+    input_base_dir = variable_files
+    dsmeta = DatasetMetadata("test-dataset", base_dir=tmp_path / "datasets")
+    initial_config = copy.deepcopy(config)
+    initial_config["ensemble_members"] = ["r001i1p00000"]
+    save_dataset(initial_config, input_base_dir, dsmeta)
+    # as if an earlier run had added different data for the member before failing
+    for split in ["train", "val", "test"]:
+        path = dsmeta.path() / split / "predictors.zarr"
+        stored_ds = xr.open_zarr(path).load()
+        stored_ds.assign_coords(ensemble_member=["r002i1p00000"]).to_zarr(
+            path, append_dim="ensemble_member"
+        )
+
+    with pytest.raises(ValueError, match="different"):
+        extend.extend(
+            dsmeta.name,
+            input_base_dir,
+            dsmeta.base_dir,
+            ensemble_members=["r002i1p00000"],
+        )
+    assert dsmeta.config() == initial_config
+
+
+def test_merge_statistics():
+    values = np.random.randn(2, 48, 3)
+    ds = xr.Dataset({"pr": (["ensemble_member", "time", "x"], values)})
+
+    result = dataset.merge_statistics(
+        dataset._calculate_statistics(ds.isel(ensemble_member=[0]), ["pr"], [1]),
+        dataset._calculate_statistics(ds.isel(ensemble_member=[1]), ["pr"], [1]),
+    )
+
+    xr.testing.assert_allclose(result, dataset._calculate_statistics(ds, ["pr"], [1]))
@@ -0,0 +1,54 @@
+import cftime
+import numpy as np
+import xarray as xr
+
+from mlde_data.dataset.day_index import (
+    day_index,
+    day_times,
+    period_slice,
+    split_indices,
+)
+
+
+def hourly_time_da(start, periods):
+    time_range = xr.date_range(start, periods=periods, freq="h", use_cftime=True)
+    return xr.DataArray(dims=["time"], data=time_range, coords={"time": time_range})
+
+
+def test_day_index():
+    time_da = hourly_time_da(
+        cftime.Datetime360Day(1980, 12, 30, 0, 0, 0, 0, has_year_zero=True), 72
+    )
+
+    days = day_index(time_da.values)
+
+    assert days.dtype == np.int64
+    assert list(np.unique(days)) == [3959, 3960, 3961]
+    assert np.all(np.bincount(days - 3959) == 24)
+    assert list(day_times([3960])) == [
+        cftime.Datetime360Day(1981, 1, 1, 0, 0, 0, 0, has_year_zero=True)
+    ]
+
+
+def test_day_index_datetime64():
+    times = np.array(["1970-01-02T13:00", "1970-01-03T00:00"], dtype="datetime64[m]")
+
+    assert list(day_index(times)) == [1, 2]
+
+
+def test_period_slice():
+    time_da = hourly_time_da(
+        cftime.Datetime360Day(1980, 12, 1, 0, 0, 0, 0, has_year_zero=True), 24 * 5
+    )
+
+    positions = period_slice(time_da, ["1980-12-02", "1980-12-03"])
+
+    assert positions.start == 24
+    assert positions.stop == 72
+
+
+def test_split_indices():
+    days = np.array([5, 5, 6, 7, 7, 9, 10])
+
+    assert list(split_indices(days, np.array([5, 7, 8, 10]))) == [0, 1, 3, 4, 6]
+    assert list(split_indices(days, np.array([], dtype=np.int64))) == []
@@ -2,6 +2,7 @@ import cftime
 import numpy as np
 import xarray as xr
 
+from mlde_data.dataset.day_index import day_index
 from mlde_data.dataset.preset_split import PresetSplit
 
 
@@ -40,9 +41,9 @@ def test_split():
     assert len(splits["val"]) == 360 * 1
     assert len(splits["train"]) == 360 * 3
 
-    assert np.all(np.equal(splits["test"]["time"].values, exp_times["test"].values))
-    assert np.all(np.equal(splits["val"]["time"].values, exp_times["val"].values))
-    assert np.all(np.equal(splits["train"]["time"].values, exp_times["train"].values))
+    assert np.all(np.equal(splits["test"], day_index(exp_times["test"].values)))
+    assert np.all(np.equal(splits["val"], day_index(exp_times["val"].values)))
+    assert np.all(np.equal(splits["train"], day_index(exp_times["train"].values)))
 
     # check time is sorted
     for split_times in splits.values():
@@ -86,9 +87,9 @@ def test_split_hours():
     assert len(splits["val"]) == 360 * 1
     assert len(splits["train"]) == 360 * 3
 
-    assert np.all(np.equal(splits["test"]["time"].values, exp_times["test"].values))
-    assert np.all(np.equal(splits["val"]["time"].values, exp_times["val"].values))
-    assert np.all(np.equal(splits["train"]["time"].values, exp_times["train"].values))
+    assert np.all(np.equal(splits["test"], day_index(exp_times["test"].values)))
+    assert np.all(np.equal(splits["val"], day_index(exp_times["val"].values)))
+    assert np.all(np.equal(splits["train"], day_index(exp_times["train"].values)))
 
     # check time is sorted
     for split_times in splits.values():
@@ -3,6 +3,7 @@ import xarray as xr
 
 import cftime
 
+from mlde_data.dataset.day_index import day_times
 from mlde_data.dataset.random_season_split import RandomSeasonSplit
 
 
@@ -36,24 +37,24 @@ def test_split():
     # Each split should have a certain number of years for each month
     test_year_seasons = np.unique(
         np.char.add(
-            np.vectorize(lambda x: x.year)(splits["test"]).astype("str"),
-            np.vectorize(lambda x: x.month)(splits["test"]).astype("str"),
+            np.vectorize(lambda x: x.year)(day_times(splits["test"])).astype("str"),
+            np.vectorize(lambda x: x.month)(day_times(splits["test"])).astype("str"),
         )
     )
     assert len(test_year_seasons) == 2 * 12
 
     val_year_seasons = np.unique(
         np.char.add(
-            np.vectorize(lambda x: x.year)(splits["val"]).astype("str"),
-            np.vectorize(lambda x: x.month)(splits["val"]).astype("str"),
+            np.vectorize(lambda x: x.year)(day_times(splits["val"])).astype("str"),
+            np.vectorize(lambda x: x.month)(day_times(splits["val"])).astype("str"),
         )
     )
     assert len(val_year_seasons) == 4 * 12
 
     train_year_seasons = np.unique(
         np.char.add(
-            np.vectorize(lambda x: x.year)(splits["train"]).astype("str"),
-            np.vectorize(lambda x: x.month)(splits["train"]).astype("str"),
+            np.vectorize(lambda x: x.year)(day_times(splits["train"])).astype("str"),
+            np.vectorize(lambda x: x.month)(day_times(splits["train"])).astype("str"),
         )
     )
     assert len(train_year_seasons) == 14 * 12
@@ -89,24 +90,24 @@ def test_split_hours():
     # Each split should have a certain number of years for each month
     test_year_seasons = np.unique(
         np.char.add(
-            np.vectorize(lambda x: x.year)(splits["test"]).astype("str"),
-            np.vectorize(lambda x: x.month)(splits["test"]).astype("str"),
+            np.vectorize(lambda x: x.year)(day_times(splits["test"])).astype("str"),
+            np.vectorize(lambda x: x.month)(day_times(splits["test"])).astype("str"),
         )
     )
     assert len(test_year_seasons) == 1 * 12
 
     val_year_seasons = np.unique(
         np.char.add(
-            np.vectorize(lambda x: x.year)(splits["val"]).astype("str"),
-            np.vectorize(lambda x: x.month)(splits["val"]).astype("str"),
+            np.vectorize(lambda x: x.year)(day_times(splits["val"])).astype("str"),
+            np.vectorize(lambda x: x.month)(day_times(splits["val"])).astype("str"),
         )
     )
     assert len(val_year_seasons) == 1 * 12
 
     train_year_seasons = np.unique(
         np.char.add(
-            np.vectorize(lambda x: x.year)(splits["train"]).astype("str"),
-            np.vectorize(lambda x: x.month)(splits["train"]).astype("str"),
+            np.vectorize(lambda x: x.year)(day_times(splits["train"])).astype("str"),
+            np.vectorize(lambda x: x.month)(day_times(splits["train"])).astype("str"),
         )
     )
     assert len(train_year_seasons) == 2 * 12
@@ -61,3 +61,13 @@ def test_split_hours():
     assert not any(np.isin(splits["train"], splits["val"]))
     assert not any(np.isin(splits["train"], splits["test"]))
     assert not any(np.isin(splits["val"], splits["test"]))
+
+
+def test_years():
+    splitter = RandomSplit(
+        props={"val": 0.2, "test": 0.1},
+        time_periods=[["1980-12-01", "1982-11-30"], ["2020-12-01", "2021-11-30"]],
+    )
+
+    # only the first time period is split
+    assert splitter.years() == [1981, 1982]
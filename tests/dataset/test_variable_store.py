@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from mlde_data.dataset import variable_store
+
+
+@pytest.fixture
+def config():
+    return {
+        "ensemble_members": ["01", "02"],
+        "scenario": "rcp85",
+        "predictors": {
+            "collection": "land-gcm",
+            "domain": "test-10",
+            "resolution": "60km",
+            "frequency": "day",
+            "variables": ["input1", "input2"],
+        },
+        "split": {"scheme": "random", "props": {"test": 0.2}, "seed": 42},
+    }
+
+
+@pytest.fixture
+def split_ds():
+    return xr.Dataset(
+        {
+            "input1": (["ensemble_member", "time", "x"], np.random.rand(2, 3, 4)),
+            "input2": (["ensemble_member", "time", "x"], np.random.rand(2, 3, 4)),
+            "time_bnds": (["time", "bnds"], np.zeros((3, 2))),
+        },
+        coords={"ensemble_member": ["01", "02"], "time": [0, 1, 2], "x": range(4)},
+        attrs={"domain": "test-10"},
+    )
+
+
+def test_variable_path(tmp_path, config):
+    path = variable_store.variable_path(
+        tmp_path, config, "predictors", "input1", "train"
+    )
+
+    assert path.parent == tmp_path / "input1"
+    # the same variable of another dataset with different predictors
+    other_predictors = config | {
+        "predictors": config["predictors"] | {"variables": ["input1"]}
+    }
+    assert path == variable_store.variable_path(
+        tmp_path, other_predictors, "predictors", "input1", "train"
+    )
+    for other in [
+        config | {"ensemble_members": ["01"]},
+        config | {"split": config["split"] | {"seed": 1}},
+    ]:
+        assert path != variable_store.variable_path(
+            tmp_path, other, "predictors", "input1", "train"
+        )
+    assert path != variable_store.variable_path(
+        tmp_path, config, "predictors", "input1", "val"
+    )
+
+
+def test_split_variables(split_ds):
+    variables = variable_store.split_variables(split_ds, ["input1", "input2"])
+
+    assert set(variables["input1"].data_vars) == {"input1", "time_bnds"}
+    assert set(variables["input2"].data_vars) == {"input2", "time_bnds"}
+
+
+def test_open_split_view(tmp_path, config, split_ds):
+    store_dir = tmp_path / "store"
+    split_dir = tmp_path / "dataset" / "train"
+    split_dir.mkdir(parents=True)
+    variable_paths = {}
+    for var_name, var_ds in variable_store.split_variables(
+        split_ds, config["predictors"]["variables"]
+    ).items():
+        variable_paths[var_name] = variable_store.variable_path(
+            store_dir, config, "predictors", var_name, "train"
+        )
+        var_ds.to_zarr(variable_paths[var_name])
+    variable_store.write_view(
+        variable_store.view_path(split_dir, "predictors"), variable_paths
+    )
+
+    result = variable_store.open_split(split_dir, "predictors")
+
+    xr.testing.assert_identical(result.load(), split_ds)
+    # a split saved as a whole store opens the same way
+    split_ds.to_zarr(split_dir / "predictands.zarr")
+    xr.testing.assert_identical(
+        variable_store.open_split(split_dir, "predictands").load(), split_ds
+    )
+
+
+def test_stats_loader(tmp_path, config):
+    load_stats = variable_store.stats_loader(tmp_path, config)
+    assert load_stats("predictors", "train", "input1") is None
+
+    stats = xr.Dataset({"mean": (["variable"], [1.0])}, coords={"variable": ["input1"]})
+    stats.to_zarr(
+        variable_store.stats_path(tmp_path, config, "predictors", "input1", "train")
+    )
+
+    xr.testing.assert_identical(load_stats("predictors", "train", "input1"), stats)
@@ -0,0 +1,77 @@
+import tracemalloc
+import xarray as xr
+
+from mlde_data.actions.select_domain import extent_indexers
+from mlde_data.bin.variable import open_canari_le_sprint_source_variable
+from mlde_data.canari_le_sprint_variable_adapter import CanariLESprintVariableAdapter
+from mlde_data.variable import SpatialExtent
+
+from .conftest import CANARI_NLAT, CANARI_NLON
+
+
+def test_open_is_lazy(canari_base_path):
+    ds = CanariLESprintVariableAdapter(
+        variable="psl", ensemble_member="1", frequency="day", year=1981
+    ).open()
+
+    assert ds["psl"].chunks is not None
+    assert ds.sizes["time"] == 360
+    assert ds["time"].min().dt.strftime("%Y-%m-%d").item() == "1980-12-01"
+    assert ds["time"].max().dt.strftime("%Y-%m-%d").item() == "1981-11-30"
+
+
+def test_peak_memory_proportional_to_output(canari_base_path):
+    extent = SpatialExtent(domain="engwales", resolution="60km")
+    full_bytes = 360 * CANARI_NLAT * CANARI_NLON * 4
+
+    peaks = []
+    for member in range(1, 41):
+        tracemalloc.start()
+        ds = open_canari_le_sprint_source_variable(
+            "psl",
+            1981,
+            "day",
+            "rcp85",
+            "60km",
+            str(member),
+            "global",
+            "canari-le-sprint",
+            None,
+        )
+        # later actions cut the data down before it is needed in memory
+        output = ds["psl"].isel(extent_indexers(ds, extent)).load()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+
+        assert output.nbytes < full_bytes / 4
+        assert peak < 3 * output.nbytes + 2 * 1024**2
+
+    # memory does not build up over the ensemble
+    assert max(peaks[20:]) < 1.5 * max(peaks[:20])
+
+
+def test_open_ensemble(canari_base_path):
+    ds = CanariLESprintVariableAdapter.open_ensemble(
+        variable="psl", frequency="day", year=1981
+    )
+
+    assert ds["psl"].dims[0] == "ensemble_member"
+    assert ds.sizes["ensemble_member"] == 40
+    assert ds["psl"].chunks is not None
+    assert "ensemble_member" not in ds["time_bnds"].dims
+
+    member_ds = CanariLESprintVariableAdapter(
+        variable="psl", ensemble_member="7", frequency="day", year=1981
+    ).open()
+    xr.testing.assert_equal(
+        ds["psl"].sel(ensemble_member="7", drop=True), member_ds["psl"]
+    )
+
+
+def test_open_ensemble_subset(canari_base_path):
+    ds = CanariLESprintVariableAdapter.open_ensemble(
+        variable="psl", frequency="day", year=1981, ensemble_members=["2", "5"]
+    )
+
+    assert ds["ensemble_member"].values.tolist() == ["2", "5"]
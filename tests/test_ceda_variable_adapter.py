@@ -1,10 +1,13 @@
 import cftime
+import numpy as np
 import os
 from pathlib import Path
 import pytest
+import xarray as xr
 
 from mlde_data.ceda_variable_adapter import CedaVariableAdapter
-from mlde_data.variable import SourceVariableConfig
+from mlde_data.staging import SourceStager
+from mlde_data.variable import SourceVariableConfig, SpatialExtent
 
 
 def test_from_variable_defn(hourly_defn):
@@ -124,3 +127,127 @@ def hourly_defn():
         frequency="1hr",
         variable="pr",
     )
+
+
+def _write_hourly_files(adapter, ny=3, nx=4):
+    os.makedirs(adapter.filepaths[0].parent, exist_ok=True)
+    grid_latitude = xr.Variable(
+        ["grid_latitude"],
+        np.linspace(-4, 4, ny),
+        {"standard_name": "grid_latitude", "units": "degrees", "axis": "Y"},
+    )
+    grid_longitude = xr.Variable(
+        ["grid_longitude"],
+        np.linspace(355, 363, nx),
+        {"standard_name": "grid_longitude", "units": "degrees", "axis": "X"},
+    )
+    for i, filepath in enumerate(adapter.filepaths):
+        time = xr.date_range(
+            f"{adapter.year - 1 if i == 0 else adapter.year}-{12 if i == 0 else i:02d}-01T00:30",
+            periods=720,
+            freq="h",
+            calendar="360_day",
+            use_cftime=True,
+        )
+        xr.Dataset(
+            {
+                "pr": (
+                    ["ensemble_member", "time", "grid_latitude", "grid_longitude"],
+                    np.random.rand(1, 720, ny, nx).astype("float32"),
+                    {"grid_mapping": "rotated_latitude_longitude"},
+                ),
+                "latitude": (
+                    ["grid_latitude", "grid_longitude"],
+                    np.add.outer(grid_latitude.values, np.zeros(nx)),
+                ),
+                "rotated_latitude_longitude": (
+                    [],
+                    0,
+                    {
+                        "grid_mapping_name": "rotated_latitude_longitude",
+                        "grid_north_pole_latitude": 37.5,
+                        "grid_north_pole_longitude": 177.5,
+                    },
+                ),
+            },
+            coords=dict(
+                ensemble_member=[1],
+                time=time,
+                grid_latitude=grid_latitude,
+                grid_longitude=grid_longitude,
+            ),
+        ).to_netcdf(filepath)
+
+
+@pytest.fixture
+def synthetic_hourly_adapter(tmp_path):
+    return CedaVariableAdapter(
+        collection="land-cpm",
+        ensemble_member="r001i1p00000",
+        variable="pr",
+        frequency="1hr",
+        resolution="2.2km",
+        domain="uk",
+        scenario="rcp85",
+        year=1981,
+        base_dir=tmp_path,
+    )
+
+
+def test_open_lazy(synthetic_hourly_adapter):
+    _write_hourly_files(synthetic_hourly_adapter)
+
+    ds = synthetic_hourly_adapter.open()
+
+    assert ds["pr"].chunks is not None
+    assert ds.sizes["time"] == 360 * 24
+    assert "ensemble_member" not in ds.dims
+    assert ds["time"].min().item() == cftime.Datetime360Day(
+        1980, 12, 1, 0, 30, 0, 0, has_year_zero=True
+    )
+
+
+def test_open_inconsistent_files(synthetic_hourly_adapter):
+    _write_hourly_files(synthetic_hourly_adapter)
+    # one month on a different grid
+    xr.open_dataset(synthetic_hourly_adapter.filepaths[5]).load().assign(
+        latitude=lambda ds: ds["latitude"] + 1
+    ).to_netcdf(synthetic_hourly_adapter.filepaths[5])
+
+    with pytest.raises(ValueError, match="latitude differs"):
+        synthetic_hourly_adapter.open()
+
+    # trusted archives are not checked
+    synthetic_hourly_adapter.trusted = True
+    ds = synthetic_hourly_adapter.open()
+    assert ds.sizes["time"] == 360 * 24
+
+
+def test_open_extent(synthetic_hourly_adapter):
+    _write_hourly_files(synthetic_hourly_adapter, ny=81, nx=81)
+    synthetic_hourly_adapter.extent = SpatialExtent(
+        domain="engwales", resolution="2.2km-coarsened-4x", align=4
+    )
+
+    ds = synthetic_hourly_adapter.open()
+
+    # only the part of the 0.1 degree grid within about 2.9 degrees of the domain centre
+    assert ds.sizes["grid_latitude"] < 81
+    assert ds.sizes["grid_longitude"] < 81
+    assert ds.sizes["grid_latitude"] % 4 == 0
+    assert ds["pr"].chunks is not None
+
+
+def test_open_staged(synthetic_hourly_adapter, tmp_path):
+    _write_hourly_files(synthetic_hourly_adapter)
+    expected = synthetic_hourly_adapter.open().load()
+
+    with SourceStager(tmp_path / "stage") as stager:
+        stager.prefetch("1981", synthetic_hourly_adapter.filepaths)
+        assert stager.wait("1981")
+        # the staged copies are read even once the originals have gone
+        for filepath in synthetic_hourly_adapter.filepaths:
+            os.rename(filepath, f"{filepath}.moved")
+        synthetic_hourly_adapter.stage_dir = stager.stage_dir
+
+        xr.testing.assert_identical(synthetic_hourly_adapter.open().load(), expected)
@@ -0,0 +1,180 @@
+from functools import partial
+from importlib.resources import files
+import os
+import pytest
+import time
+
+from mlde_data.dag import (
+    Dag,
+    DagTask,
+    batch_tasks,
+    build_etl_dag,
+    run_local,
+    slurm_script,
+)
+
+
+def _record(log_dir, command):
+    [name] = command
+    start = time.time()
+    if name == "fail":
+        raise ValueError("bad task")
+    time.sleep(0.2)
+    (log_dir / name).write_text(f"{start} {time.time()} {os.getpid()}")
+
+
+def _times(log_dir, name):
+    start, end, _ = (log_dir / name).read_text().split()
+    return float(start), float(end)
+
+
+def diamond():
+    return Dag(
+        [
+            DagTask("a", ["a"]),
+            DagTask("b", ["b"], depends_on=["a"]),
+            DagTask("c", ["c"], depends_on=["a"]),
+            DagTask("d", ["d"], depends_on=["b", "c"]),
+        ]
+    )
+
+
+def test_levels():
+    assert [[task.name for task in level] for level in diamond().levels()] == [
+        ["a"],
+        ["b", "c"],
+        ["d"],
+    ]
+
+
+def test_unknown_dependency():
+    with pytest.raises(ValueError, match="unknown task a"):
+        Dag([DagTask("b", ["b"], depends_on=["a"])])
+
+
+def test_save_and_load(tmp_path):
+    dag = diamond()
+    dag.save(tmp_path / "dag.json")
+
+    assert Dag.load(tmp_path / "dag.json").tasks == dag.tasks
+
+
+def test_batch_tasks():
+    dag = Dag([DagTask(str(i), [str(i)]) for i in range(5)])
+
+    batches = [[task.name for task in batch_tasks(dag, 0, i, 2)] for i in range(2)]
+
+    assert batches == [["0", "2", "4"], ["1", "3"]]
+
+
+def test_run_local(tmp_path):
+    run_local(diamond(), partial(_record, tmp_path), workers=2)
+
+    assert _times(tmp_path, "a")[1] <= min(
+        _times(tmp_path, "b")[0], _times(tmp_path, "c")[0]
+    )
+    assert max(_times(tmp_path, "b")[1], _times(tmp_path, "c")[1]) <= (
+        _times(tmp_path, "d")[0]
+    )
+
+
+def _rendezvous(log_dir, command):
+    [name] = command
+    (log_dir / name).touch()
+    # only finishes if the other task is started alongside this one
+    deadline = time.time() + 10
+    while len(os.listdir(log_dir)) < 2:
+        if time.time() > deadline:
+            raise TimeoutError(f"{name} ran alone")
+        time.sleep(0.01)
+
+
+def test_run_local_in_parallel(tmp_path):
+    dag = Dag([DagTask("b", ["b"]), DagTask("c", ["c"])])
+
+    run_local(dag, partial(_rendezvous, tmp_path), workers=2)
+
+
+def test_run_local_memory(tmp_path):
+    dag = Dag([DagTask(name, [name], memory=3) for name in ["a", "b", "c"]])
+
+    run_local(dag, partial(_record, tmp_path), workers=3, max_memory=4)
+
+    intervals = sorted(_times(tmp_path, name) for name in ["a", "b", "c"])
+    # only room for one at a time
+    for (_, end), (next_start, _) in zip(intervals, intervals[1:]):
+        assert end <= next_start
+
+
+def test_run_local_failure(tmp_path):
+    dag = Dag(
+        [
+            DagTask("fail", ["fail"]),
+            DagTask("after", ["after"], depends_on=["fail"]),
+            DagTask("other", ["other"]),
+        ]
+    )
+
+    with pytest.raises(RuntimeError, match="fail.*bad task"):
+        run_local(dag, partial(_record, tmp_path), workers=2)
+
+    assert (tmp_path / "other").exists()
+    assert not (tmp_path / "after").exists()
+
+
+def test_slurm_script():
+    dag = Dag(
+        [DagTask(f"a{i}", ["a"], memory=2 * 1024**3) for i in range(5)]
+        + [DagTask("b", ["b"], memory=1024**2, depends_on=["a0", "a4"])]
+    )
+
+    script = slurm_script(dag, "dag.json", max_array_size=2)
+
+    assert script.count("sbatch ") == 2
+    assert "--array=0-1 --mem=2048M" in script
+    assert "--array=0-0 --mem=1M" in script
+    assert "run-batch dag.json --level 1 --batches 1" in script
+    assert "--dependency=afterok:${job_id}" in script
+
+
+def config_path(path):
+    return files("mlde_data").joinpath(f"../../config/variables/{path}")
+
+
+def test_build_etl_dag():
+    dag = build_etl_dag(
+        [1981, 1982],
+        [config_path("day/land-cpm/targets/pr.yml")],
+        ["01"],
+        scale_factor="1",
+        domain="birmingham-64",
+    )
+
+    # extract and clean for each of lsrain and lssnow plus create, for each year
+    assert len(dag) == 10
+    assert dag.tasks["create/pr/01/1981"].depends_on == [
+        "extract/lsrain/01/1981",
+        "extract/lssnow/01/1981",
+    ]
+    assert dag.tasks["clean/lssnow/01/1981"].depends_on == ["create/pr/01/1981"]
+    assert dag.tasks["create/pr/01/1982"].command[:2] == ["variable", "create"]
+    assert dag.tasks["extract/lssnow/01/1982"].command[-8:-2] == [
+        "--year",
+        "1982",
+        "--variable",
+        "lssnow",
+        "--frequency",
+        "day",
+    ]
+
+
+def test_build_etl_dag_ceda():
+    dag = build_etl_dag(
+        [1981],
+        [config_path("1hr/land-cpm/targets/pr.yml")],
+        ["01"],
+        scale_factor="1",
+        domain="birmingham-64",
+    )
+
+    assert list(dag.tasks) == ["create/pr/01/1981"]
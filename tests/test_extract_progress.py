@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+
+from mlde_data.extract_progress import (
+    ExtractProgress,
+    count_pp_fields,
+    run_monitored,
+    write_metrics,
+)
+from mlde_data.moose import expected_field_count
+from mlde_data.moose_simulator import MooseArchiveSimulator
+
+
+def _populated_stream(tmp_path):
+    simulator = MooseArchiveSimulator(tmp_path / "archive")
+    return simulator.populate("psl", 1981, "r001i1p00000", grid_size=4)
+
+
+def test_expected_field_count():
+    assert expected_field_count("psl") == 360
+    assert expected_field_count("x_wind") == 720
+    assert expected_field_count("mlqtw") == 360 * 4 * 4
+
+
+def test_count_pp_fields(tmp_path):
+    pp_filepath = sorted(_populated_stream(tmp_path).glob("*.pp"))[0]
+    size = os.path.getsize(pp_filepath)
+
+    nfields, offset = count_pp_fields(pp_filepath)
+    assert nfields == 30
+    assert offset == size
+
+    # a field that has only partly arrived is not counted
+    partial_filepath = tmp_path / "partial.pp"
+    partial_filepath.write_bytes(pp_filepath.read_bytes()[: size - 10])
+    assert count_pp_fields(partial_filepath) == (29, size // 30 * 29)
+
+
+def test_extract_progress(tmp_path):
+    stream_dirpath = _populated_stream(tmp_path)
+    pp_dirpath = tmp_path / "extract"
+    pp_dirpath.mkdir()
+    progress = ExtractProgress(pp_dirpath, expected_fields=360)
+
+    assert progress.poll().fields == 0
+
+    src_filepaths = sorted(stream_dirpath.glob("*.pp"))
+    for src_filepath in src_filepaths[:3]:
+        (pp_dirpath / src_filepath.name).write_bytes(src_filepath.read_bytes())
+    snapshot = progress.poll()
+    assert snapshot.fields == 90
+    assert snapshot.bytes == sum(fp.stat().st_size for fp in src_filepaths[:3])
+    assert snapshot.eta is not None
+    assert "90/360 fields" in str(snapshot)
+
+
+def test_run_monitored(tmp_path):
+    pp_dirpath = tmp_path / "extract"
+    pp_dirpath.mkdir()
+    attempt = run_monitored(
+        [sys.executable, "-c", "import time; time.sleep(0.5)"],
+        pp_dirpath,
+        interval=0.1,
+        recall_timeout=0.2,
+    )
+    assert attempt.stalled
+    assert attempt.returncode != 0
+
+    metrics = write_metrics(tmp_path / "metrics.json", [attempt, attempt], year=1981)
+    assert metrics["retries"] == 1
+    assert not metrics["succeeded"]
+    assert json.loads((tmp_path / "metrics.json").read_text()) == metrics
+
+
+def test_run_monitored_waits_for_recall(tmp_path):
+    pp_dirpath = tmp_path / "extract"
+    pp_dirpath.mkdir()
+    # no data for longer than the stall timeout while "recalling from tape", then some arrives
+    attempt = run_monitored(
+        [
+            sys.executable,
+            "-c",
+            f"import time; time.sleep(0.5); open({str(pp_dirpath / 'a.pp')!r}, 'wb').write(b'x')",
+        ],
+        pp_dirpath,
+        interval=0.1,
+        stall_timeout=0.2,
+    )
+    assert not attempt.stalled
+    assert attempt.returncode == 0
+    assert attempt.bytes == 1
+
+
+def test_run_monitored_stalls_after_first_data(tmp_path):
+    pp_dirpath = tmp_path / "extract"
+    pp_dirpath.mkdir()
+    attempt = run_monitored(
+        [
+            sys.executable,
+            "-c",
+            f"import time; open({str(pp_dirpath / 'a.pp')!r}, 'wb').write(b'x'); time.sleep(5)",
+        ],
+        pp_dirpath,
+        interval=0.1,
+        stall_timeout=0.3,
+    )
+    assert attempt.stalled
+    assert attempt.duration < 5
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from mlde_data import fingerprint
+from mlde_data.fingerprint import (
+    check_consistent,
+    coordinate_fingerprint,
+    dataset_fingerprints,
+    variable_fingerprint,
+)
+
+
+def _dataset(offset=0.0, size=200):
+    return xr.Dataset(
+        {
+            "pr": (["time", "x"], np.random.rand(2, size)),
+            "grid": (["x"], np.arange(size) + offset, {"units": "m"}),
+        },
+    )
+
+
+def test_variable_fingerprint():
+    ds = _dataset(size=20000)
+
+    assert variable_fingerprint(ds["grid"].variable) == variable_fingerprint(
+        ds["grid"].copy(deep=True).variable
+    )
+    assert variable_fingerprint(ds["grid"].variable) != variable_fingerprint(
+        ds["grid"].assign_attrs(units="km").variable
+    )
+    assert variable_fingerprint(ds["grid"].variable) != variable_fingerprint(
+        (ds["grid"] + 1).assign_attrs(units="m").variable
+    )
+
+
+def test_dataset_fingerprints():
+    assert set(dataset_fingerprints(_dataset(), exclude_dim="time")) == {"grid"}
+    assert set(dataset_fingerprints(_dataset())) == {"pr", "grid"}
+
+
+def test_check_consistent():
+    check_consistent([_dataset(), _dataset()], dim="time")
+
+    with pytest.raises(ValueError, match="grid differs between a and b"):
+        check_consistent([_dataset(), _dataset(offset=1)], dim="time", labels="ab")
+
+    with pytest.raises(ValueError, match="has variables"):
+        check_consistent(
+            [_dataset(), _dataset().drop_vars("grid")], dim="time", labels="ab"
+        )
+
+
+def _gridded(var, offset=0.0, bounds_offset=0.0):
+    time = xr.date_range("2000-12-01", periods=3, use_cftime=True, calendar="360_day")
+    return xr.Dataset(
+        {
+            var: (
+                ["time", "x"],
+                np.random.rand(3, 4),
+                {"grid_mapping": "crs"},
+            ),
+            "x_bnds": (["x", "bnds"], np.zeros((4, 2)) + bounds_offset),
+            "crs": ((), 0, {"grid_mapping_name": "latitude_longitude"}),
+        },
+        coords={"time": time, "x": np.arange(4) + offset},
+    )
+
+
+def test_coordinate_fingerprint():
+    ds = _gridded("pr")
+
+    assert coordinate_fingerprint(ds) == coordinate_fingerprint(_gridded("tas"))
+    assert coordinate_fingerprint(ds) != coordinate_fingerprint(_gridded("pr", 1))
+    assert coordinate_fingerprint(ds) != coordinate_fingerprint(
+        ds.isel(time=slice(1, None))
+    )
+    assert coordinate_fingerprint(ds, exclude_dim="time") == coordinate_fingerprint(
+        ds.isel(time=slice(1, None)), exclude_dim="time"
+    )
+    other_crs = ds.copy()
+    other_crs["crs"] = other_crs["crs"].assign_attrs(
+        grid_mapping_name="rotated_latitude_longitude"
+    )
+    assert coordinate_fingerprint(ds) != coordinate_fingerprint(other_crs)
+
+
+def _member(em, **kwargs):
+    ds = _gridded("pr", **kwargs)
+    ds["pr"] = ds["pr"].expand_dims(ensemble_member=[em])
+    return ds
+
+
+def test_concat_matching_coordinates():
+    datasets = [_member(str(i), bounds_offset=i) for i in range(2)]
+
+    result = fingerprint.concat(
+        datasets, dim="ensemble_member", compat="no_conflicts", join="exact"
+    )
+
+    # the variables not along ensemble_member are not compared but taken from the first dataset
+    assert result.sizes["ensemble_member"] == 2
+    xr.testing.assert_equal(result["x_bnds"].variable, datasets[0]["x_bnds"].variable)
+
+
+def test_concat_different_coordinates():
+    datasets = [
+        _gridded("pr", offset=i).expand_dims(ensemble_member=[str(i)]) for i in range(2)
+    ]
+
+    with pytest.raises(ValueError):
+        fingerprint.concat(
+            datasets, dim="ensemble_member", compat="no_conflicts", join="exact"
+        )
+
+
+def test_combine_by_coords():
+    pr, tas = _gridded("pr"), _gridded("tas", bounds_offset=1)
+
+    result = fingerprint.combine_by_coords(
+        [pr, tas], compat="no_conflicts", join="exact"
+    )
+
+    assert set(result.data_vars) == {"pr", "tas", "x_bnds", "crs"}
+    xr.testing.assert_equal(result["x_bnds"].variable, pr["x_bnds"].variable)
+
+    # otherwise the datasets are compared in full
+    with pytest.raises(ValueError):
+        fingerprint.combine_by_coords(
+            [pr, tas.isel(time=slice(1, None))], compat="no_conflicts", join="exact"
+        )
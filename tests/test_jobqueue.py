@@ -0,0 +1,111 @@
+import logging
+import pytest
+
+from mlde_data.jobqueue import JobQueue, run_job, serve, work
+
+
+def _run(command):
+    logging.getLogger("test").warning(f"running {' '.join(command)}")
+    print("some output")
+    if command[-1] == "fail":
+        raise ValueError("bad job")
+
+
+def test_submit_and_claim(tmp_path):
+    queue = JobQueue(tmp_path)
+    first = queue.submit(["variable", "create", "1"])
+    second = queue.submit(["variable", "create", "2"])
+
+    job = queue.claim("worker-1")
+
+    assert job.id == first.id
+    assert job.state == "running"
+    assert queue.jobs("pending") == [second.id]
+    assert queue.get(first.id).worker == "worker-1"
+
+    queue.finish(job)
+
+    assert queue.get(first.id).state == "done"
+    assert queue.jobs("running") == []
+
+
+def test_submit_not_allowed(tmp_path):
+    with pytest.raises(ValueError, match="Only dataset, moose, variable commands"):
+        JobQueue(tmp_path).submit(["scratch", "evict"])
+
+
+@pytest.mark.parametrize("last_arg,state", [("ok", "done"), ("fail", "failed")])
+def test_run_job(tmp_path, last_arg, state):
+    queue = JobQueue(tmp_path)
+    queue.submit(["moose", "convert", last_arg])
+    job = queue.claim("worker-1")
+
+    run_job(queue, job, _run)
+
+    job = queue.get(job.id)
+    assert job.state == state
+    log = queue.log_path(job.id).read_text()
+    assert f"running moose convert {last_arg}" in log
+    assert "some output" in log
+    if state == "failed":
+        assert job.error == "ValueError: bad job"
+
+
+def test_work_until_idle(tmp_path):
+    queue = JobQueue(tmp_path)
+    jobs = [queue.submit(["variable", "create", str(i)]) for i in range(3)]
+
+    work(tmp_path, _run, poll_interval=0.01, idle_timeout=0.1)
+
+    assert [queue.get(job.id).state for job in jobs] == ["done"] * 3
+
+
+def test_serve_workers(tmp_path):
+    queue = JobQueue(tmp_path)
+    jobs = [queue.submit(["variable", "create", str(i)]) for i in range(4)]
+
+    serve(tmp_path, _run, workers=2, poll_interval=0.01, idle_timeout=1)
+
+    finished = [queue.get(job.id) for job in jobs]
+    assert [job.state for job in finished] == ["done"] * 4
+
+
+def test_follow(tmp_path):
+    queue = JobQueue(tmp_path)
+    job = queue.submit(["dataset", "create"])
+    run_job(queue, queue.claim("worker-1"), _run)
+    output = []
+
+    job = queue.follow(job.id, output.append, poll_interval=0.01, timeout=1)
+
+    assert job.state == "done"
+    assert "some output" in "".join(output)
+
+
+def test_requeue_dead(tmp_path):
+    queue = JobQueue(tmp_path)
+    dead = queue.submit(["variable", "create", "1"])
+    alive = queue.submit(["variable", "create", "2"])
+    for _ in range(2):
+        queue.claim("worker-1")
+    # as if the first job's worker had been killed
+    job = queue.get(dead.id)
+    job.pid = 2**22 + 1
+    queue.beat(job)
+
+    requeued = queue.requeue_dead()
+
+    assert [job.id for job in requeued] == [dead.id]
+    assert queue.jobs("pending") == [dead.id]
+    assert queue.jobs("running") == [alive.id]
+    assert queue.get(dead.id).requeued == 1
+    assert queue.get(dead.id).worker is None
+
+
+def test_requeue_silent_workers(tmp_path):
+    queue = JobQueue(tmp_path)
+    job = queue.submit(["variable", "create", "1"])
+    queue.claim("worker-1")
+
+    assert queue.requeue_dead(heartbeat_timeout=60) == []
+    assert [job.id for job in queue.requeue_dead(heartbeat_timeout=0)] == [job.id]
@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+
+from mlde_data.locking import _break_lock, dir_lock
+
+
+def make_stale(lock_path):
+    os.mkdir(lock_path)
+    os.utime(lock_path, (time.time() - 120, time.time() - 120))
+
+
+def test_breaks_stale_lock(tmp_path):
+    lock_path = tmp_path / ".lock"
+    make_stale(lock_path)
+
+    with dir_lock(lock_path, stale_after=60):
+        assert lock_path.is_dir()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_breaking_leaves_lock_taken_again(tmp_path):
+    lock_path = tmp_path / ".lock"
+    make_stale(lock_path)
+    stale_stat = lock_path.stat()
+
+    # one waiter breaks the stale lock and takes it again before a slower one tries to break it
+    _break_lock(lock_path, stale_stat)
+    os.mkdir(lock_path)
+    _break_lock(lock_path, stale_stat)
+
+    assert [path.name for path in tmp_path.iterdir()] == [".lock"]
+
+
+def test_one_holder_after_breaking(tmp_path):
+    lock_path = tmp_path / ".lock"
+    make_stale(lock_path)
+    holders = []
+    overlapped = []
+
+    def hold():
+        with dir_lock(lock_path, stale_after=60):
+            holders.append(threading.get_ident())
+            if len(holders) > 1:
+                overlapped.append(True)
+            time.sleep(0.01)
+            holders.remove(threading.get_ident())
+
+    threads = [threading.Thread(target=hold) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlapped == []
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+import os
+
+from mlde_data.manifest import RunManifest, Task, output_stat
+
+
+def make_output(path, content=b"data"):
+    path.write_bytes(content)
+    return [path]
+
+
+def test_run_records_done(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    task = Task("create", "pr", "01", 1981)
+
+    outputs = manifest.run([task], make_output, path=tmp_path / "pr.nc")
+
+    entry = manifest.entry(task)
+    assert entry["state"] == "done"
+    assert entry["outputs"] == [str(tmp_path / "pr.nc")]
+    assert entry["output_stats"][str(tmp_path / "pr.nc")] == output_stat(outputs[0])
+    assert manifest.is_done(task)
+
+
+def test_run_skips_done_tasks(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    task = Task("create", "pr", "01", 1981)
+    manifest.run([task], make_output, path=tmp_path / "pr.nc")
+
+    calls = []
+    assert manifest.run([task], lambda: calls.append(1)) is None
+    assert calls == []
+
+    manifest.run([task], lambda: calls.append(1) or [], force=True)
+    assert calls == [1]
+
+
+def test_run_reruns_when_outputs_missing(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    task = Task("extract", "tmean", "01", 1981)
+    manifest.run([task], make_output, path=tmp_path / "tmean.pp")
+
+    (tmp_path / "tmean.pp").unlink()
+
+    assert not manifest.is_done(task)
+    manifest.run([task], make_output, path=tmp_path / "tmean.pp")
+    assert manifest.is_done(task)
+
+
+def test_run_records_failure(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    tasks = [
+        Task("create", "temp250", "01", 1981),
+        Task("create", "temp850", "01", 1981),
+    ]
+
+    def fail():
+        raise MemoryError("out of memory")
+
+    with pytest.raises(MemoryError):
+        manifest.run(tasks, fail)
+
+    for task in tasks:
+        entry = manifest.entry(task)
+        assert entry["state"] == "failed"
+        assert entry["error"] == "MemoryError: out of memory"
+    assert manifest.summary() == {
+        "create": {"pending": 0, "running": 0, "done": 0, "failed": 2}
+    }
+
+
+def test_run_outputs_by_variable(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    tasks = [
+        Task("create", "temp250", "01", 1981),
+        Task("create", "temp850", "01", 1981),
+    ]
+
+    manifest.run(
+        tasks,
+        lambda: {
+            variable: make_output(tmp_path / f"{variable}.nc")
+            for variable in ["temp250", "temp850"]
+        },
+    )
+
+    assert manifest.entry(tasks[1])["outputs"] == [str(tmp_path / "temp850.nc")]
+
+
+def test_plan_keeps_existing_state(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    done = Task("create", "pr", "01", 1981)
+    manifest.run([done], make_output, path=tmp_path / "pr.nc")
+
+    manifest.plan([done, Task("create", "pr", "01", 1982)])
+
+    assert manifest.summary() == {
+        "create": {"pending": 1, "running": 0, "done": 1, "failed": 0}
+    }
+
+
+def test_run_reruns_when_outputs_changed(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    task = Task("extract", "tmean", "01", 1981)
+    manifest.run([task], make_output, path=tmp_path / "tmean.pp")
+
+    # e.g. truncated by a later, interrupted run
+    (tmp_path / "tmean.pp").write_bytes(b"da")
+
+    assert not manifest.is_done(task)
+
+
+def test_output_stat_directory(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "1.pp").write_bytes(b"one")
+    os.utime(tmp_path / "a" / "1.pp", ns=(0, 10))
+    (tmp_path / "a" / "2.pp").write_bytes(b"two!")
+    os.utime(tmp_path / "a" / "2.pp", ns=(0, 20))
+
+    assert output_stat(tmp_path / "a") == {"bytes": 7, "mtime_ns": 20}
+
+
+def test_reading_leaves_manifest_alone(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    task = Task("create", "pr", "01", 1981)
+    manifest.run([task], make_output, path=tmp_path / "pr.nc")
+    mtime_ns = manifest.path.stat().st_mtime_ns
+
+    # reading does not need the lock (e.g. while another process holds it)
+    os.mkdir(manifest.lock_path)
+    assert manifest.is_done(task)
+    assert manifest.summary() == {
+        "create": {"pending": 0, "running": 0, "done": 1, "failed": 0}
+    }
+
+    assert manifest.path.stat().st_mtime_ns == mtime_ns
+
+
+def test_concurrent_updates(tmp_path):
+    manifest = RunManifest(tmp_path / "manifest.json")
+    tasks = [Task("create", "pr", "01", year) for year in range(1981, 1991)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda task: RunManifest(manifest.path).done(task), tasks))
+
+    assert all(manifest.entry(task)["state"] == "done" for task in tasks)
+    assert sorted(os.listdir(tmp_path)) == ["manifest.json"]
@@ -1,4 +1,9 @@
-from mlde_data.moose import moose_path, select_query
+import iris
+
+from mlde_data.moose import load_cubes, moose_path, select_query
+from mlde_data.variable import SourceSelection
+
+from .conftest import pp_month_cube
 
 
 def test_moose_path():
@@ -29,3 +34,33 @@ end
 """.lstrip()
 
     assert select_query(year, variable) == expected
+
+
+def test_load_cubes_with_selection(tmp_path):
+    pp_filepath = str(tmp_path / "mlqtw.pp")
+    iris.save(
+        [
+            pp_month_cube(
+                1981, 1, stash=stash, name=name, units=units, pressure=pressure
+            )
+            for stash, name, units in [
+                ((1, 30, 201), "x_wind", "m s-1"),
+                ((1, 30, 204), "air_temperature", "K"),
+            ]
+            for pressure in [250, 500, 850]
+        ],
+        pp_filepath,
+    )
+
+    cubes = load_cubes(
+        pp_filepath,
+        "mlqtw",
+        "land-cpm",
+        selection=SourceSelection(
+            drop_variables=frozenset({"air_temperature"}),
+            query={"pressure": [250, 850]},
+        ),
+    )
+
+    assert [cube.name() for cube in cubes] == ["x_wind"]
+    assert list(cubes[0].coord("pressure").points) == [250, 850]
@@ -0,0 +1,103 @@
+import iris
+import iris.fileformats.pp as pp
+import os
+import sys
+from typer.testing import CliRunner
+
+from mlde_data.bin import app
+from mlde_data.moose import MoosePPVariableMetadata, moose_path, select_query
+from mlde_data.moose_simulator import MooseArchiveSimulator, parse_query
+
+runner = CliRunner()
+
+
+def test_parse_query():
+    conditions = parse_query(select_query(1981, "mlqtw"))
+
+    assert conditions == [
+        {
+            "yr": {1980},
+            "mon": {12},
+            "stash": {30201, 30202, 30204, 30205},
+            "lblev": {250, 500, 700, 850},
+        },
+        {
+            "yr": {1981},
+            "mon": set(range(1, 12)),
+            "stash": {30201, 30202, 30204, 30205},
+            "lblev": {250, 500, 700, 850},
+        },
+    ]
+
+
+def test_select(tmp_path):
+    simulator = MooseArchiveSimulator(tmp_path / "archive")
+    for year in [1981, 1982]:
+        simulator.populate("psl", year, "r001i1p00000", grid_size=4)
+
+    moose_uri = moose_path("psl", 1981, ensemble_member="r001i1p00000")
+    output_filepaths = simulator.select(
+        select_query(1981, "psl"), moose_uri, tmp_path / "extract"
+    )
+
+    assert len(output_filepaths) == 12
+    fields = [field for fp in output_filepaths for field in pp.load(str(fp))]
+    assert len(fields) == 360
+    assert {(field.lbyr, field.lbmon) for field in fields} == {(1980, 12)} | {
+        (1981, month) for month in range(1, 12)
+    }
+
+
+def test_select_levels(tmp_path):
+    simulator = MooseArchiveSimulator(tmp_path / "archive")
+    simulator.populate("x_wind", 1981, "r001i1p00000", collection="land-gcm")
+
+    moose_uri = moose_path(
+        "x_wind", 1981, ensemble_member="r001i1p00000", collection="land-gcm"
+    )
+    query = select_query(1981, "x_wind").replace("lblev=(500,850)", "lblev=850")
+    output_filepaths = simulator.select(query, moose_uri, tmp_path / "extract")
+
+    cubes = iris.load([str(fp) for fp in output_filepaths])
+    assert len(cubes) == 1
+    assert cubes[0].coord("pressure").points.tolist() == [850]
+
+
+def test_extract(tmp_path, monkeypatch):
+    archive_dir = tmp_path / "archive"
+    MooseArchiveSimulator(archive_dir).populate("psl", 1981, "r001i1p00000")
+    monkeypatch.setenv(
+        "MOO_COMMAND", f"{sys.executable} -m mlde_data.bin.moose_simulator"
+    )
+    monkeypatch.setenv("MOO_SIMULATOR_ARCHIVE", str(archive_dir))
+
+    result = runner.invoke(
+        app,
+        [
+            "moose",
+            "extract",
+            "--collection",
+            "land-cpm",
+            "--ensemble-member",
+            "r001i1p00000",
+            "--year",
+            "1981",
+            "--variable",
+            "psl",
+            "--base-dir",
+            str(tmp_path / "pp"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    pp_dirpath = MoosePPVariableMetadata(
+        base_dir=tmp_path / "pp",
+        collection="land-cpm",
+        scenario="rcp85",
+        ensemble_member="r001i1p00000",
+        variable="psl",
+        frequency="day",
+        resolution="2.2km",
+        domain="uk",
+    ).ppdata_dirpath(1981)
+    assert len(os.listdir(pp_dirpath)) == 12
@@ -0,0 +1,49 @@
+import pytest
+import subprocess
+import sys
+
+from mlde_data.resources import parse_memory
+
+
+@pytest.mark.parametrize(
+    "memory,expected",
+    [
+        (None, None),
+        (1024, 1024),
+        ("2048", 2048),
+        ("512M", 512 * 1024**2),
+        ("4G", 4 * 1024**3),
+        ("1.5g", int(1.5 * 1024**3)),
+        ("8GB", 8 * 1024**3),
+    ],
+)
+def test_parse_memory(memory, expected):
+    assert parse_memory(memory) == expected
+
+
+def test_limit_memory():
+    # in another process so the tests are not limited
+    script = """
+import resource, threading
+from mlde_data.resources import limit_memory
+
+as_limit = resource.getrlimit(resource.RLIMIT_AS)
+limit_memory(2 * 1024**3)
+assert resource.getrlimit(resource.RLIMIT_DATA)[0] == 2 * 1024**3
+assert resource.getrlimit(resource.RLIMIT_AS) == as_limit
+import xarray
+threads = [threading.Thread(target=lambda: None) for _ in range(16)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+try:
+    bytearray(4 * 1024**3)
+except MemoryError:
+    print("limited")
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == "limited"
@@ -0,0 +1,98 @@
+from functools import partial
+import os
+import pytest
+import threading
+
+from mlde_data.scheduler import Stage, YearScheduler, memory_slots
+
+
+@pytest.mark.parametrize(
+    "workers,max_memory,job_memory,expected",
+    [
+        (4, None, None, 4),
+        (4, 64, 16, 4),
+        (8, 64, 16, 4),
+        (4, 8, 16, 1),
+    ],
+)
+def test_memory_slots(workers, max_memory, job_memory, expected):
+    assert memory_slots(workers, max_memory, job_memory) == expected
+
+
+def test_stages_overlap():
+    events = []
+    next_extract_started = threading.Event()
+
+    def extract(year):
+        events.append(("extract", year))
+        if year == 2001:
+            next_extract_started.set()
+
+    def create(year):
+        if year == 2000:
+            # only carries on if the next year's extract runs alongside this
+            assert next_extract_started.wait(timeout=10)
+        events.append(("create", year))
+
+    def clean(year):
+        events.append(("clean", year))
+
+    YearScheduler(
+        [Stage("extract", extract), Stage("create", create), Stage("clean", clean)]
+    ).run([2000, 2001, 2002])
+
+    for year in [2000, 2001, 2002]:
+        year_events = [stage for stage, event_year in events if event_year == year]
+        assert year_events == ["extract", "create", "clean"]
+    assert events.index(("extract", 2001)) < events.index(("create", 2000))
+
+
+def test_max_in_flight():
+    in_flight = set()
+    most_in_flight = []
+    lock = threading.Lock()
+
+    def start(year):
+        with lock:
+            in_flight.add(year)
+            most_in_flight.append(len(in_flight))
+
+    def finish(year):
+        with lock:
+            in_flight.remove(year)
+
+    YearScheduler(
+        [Stage("start", start, slots=4), Stage("finish", finish, slots=4)],
+        max_in_flight=2,
+    ).run(list(range(10)))
+
+    assert max(most_in_flight) <= 2
+
+
+def test_failed_year():
+    cleaned = []
+
+    def create(year):
+        if year == 2001:
+            raise ValueError("bad year")
+
+    with pytest.raises(RuntimeError, match="2001.*create: bad year"):
+        YearScheduler(
+            [Stage("create", create), Stage("clean", lambda year: cleaned.append(year))]
+        ).run([2000, 2001, 2002])
+
+    assert sorted(cleaned) == [2000, 2002]
+
+
+def _write_pid(output_dir, year):
+    (output_dir / str(year)).write_text(str(os.getpid()))
+
+
+@pytest.mark.parametrize("slots", [1, 2])
+def test_process_stage(tmp_path, slots):
+    YearScheduler(
+        [Stage("create", partial(_write_pid, tmp_path), slots=slots, in_process=True)]
+    ).run([2000, 2001, 2002])
+
+    pids = {int((tmp_path / str(year)).read_text()) for year in [2000, 2001, 2002]}
+    assert os.getpid() not in pids
@@ -0,0 +1,94 @@
+import json
+import os
+
+from mlde_data.scratch import ScratchSpace
+
+
+def make_entry(path, nbytes):
+    os.makedirs(path, exist_ok=True)
+    (path / "data.pp").write_bytes(b"x" * nbytes)
+    return path
+
+
+def test_register_and_usage(tmp_path):
+    scratch = ScratchSpace(tmp_path)
+    scratch.register(make_entry(tmp_path / "a", 100), kind="pp")
+    scratch.register(make_entry(tmp_path / "b", 50), kind="pp")
+    nc_path = tmp_path / "c.nc"
+    nc_path.write_bytes(b"x" * 10)
+    scratch.register(nc_path, kind="nc")
+
+    usage = scratch.usage()
+
+    assert usage["bytes"] == 160
+    assert usage["kinds"] == {
+        "pp": {"bytes": 150, "entries": 2},
+        "nc": {"bytes": 10, "entries": 1},
+    }
+
+
+def test_evict_least_recently_used(tmp_path):
+    scratch = ScratchSpace(tmp_path, budget=250)
+    oldest = make_entry(tmp_path / "oldest", 100)
+    middle = make_entry(tmp_path / "middle", 100)
+    newest = make_entry(tmp_path / "newest", 100)
+    for path in [oldest, middle, newest]:
+        scratch.register(path, kind="pp")
+
+    evicted = scratch.evict()
+
+    assert evicted == [str(oldest)]
+    assert not oldest.exists()
+    assert middle.exists() and newest.exists()
+
+
+def test_evict_keeps_reserved_entries(tmp_path):
+    scratch = ScratchSpace(tmp_path, budget=100)
+    needed = make_entry(tmp_path / "needed", 100)
+    unneeded = make_entry(tmp_path / "unneeded", 100)
+    scratch.register(needed, kind="pp")
+    scratch.register(unneeded, kind="pp")
+    scratch.reserve([needed], job="job-1")
+
+    assert scratch.evict() == [str(unneeded)]
+    assert needed.exists()
+
+    scratch.release("job-1")
+    scratch.register(make_entry(tmp_path / "new", 100), kind="pp")
+
+    assert scratch.evict() == [str(needed)]
+
+
+def test_contains(tmp_path):
+    scratch = ScratchSpace(tmp_path)
+    path = make_entry(tmp_path / "a", 1)
+
+    assert not scratch.contains(path)
+    scratch.register(path, kind="pp")
+    assert scratch.contains(path)
+
+
+def test_evict_releases_dead_jobs(tmp_path):
+    scratch = ScratchSpace(tmp_path, budget=100)
+    needed = make_entry(tmp_path / "needed", 100)
+    scratch.register(needed, kind="pp")
+    scratch.reserve([needed], job="dead-job")
+    # as if the job had been killed without releasing its reservations
+    index = json.loads(scratch.index_path.read_text())
+    index["jobs"]["dead-job"]["pid"] = 2**22 + 1
+    scratch.index_path.write_text(json.dumps(index))
+    scratch.register(make_entry(tmp_path / "new", 100), kind="pp")
+
+    assert scratch.evict() == [str(needed)]
+
+
+def test_release_stale_expired_jobs(tmp_path):
+    expired = ScratchSpace(tmp_path, reservation_ttl=0)
+    live = ScratchSpace(tmp_path)
+    first = make_entry(tmp_path / "first", 100)
+    second = make_entry(tmp_path / "second", 10)
+    expired.register(first, kind="pp", needed_by=["job-1"])
+    live.register(second, kind="pp", needed_by=["job-2"])
+
+    assert live.release_stale() == ["job-1"]
+    assert live.usage()["pinned_bytes"] == 10
@@ -0,0 +1,240 @@
+import dask
+import os
+import shutil
+import pytest
+import xarray as xr
+
+from mlde_data.staging import (
+    OutputStager,
+    SourceStager,
+    localize,
+    publish,
+    staged_path,
+)
+
+
+def make_files(dirpath, names, nbytes=100):
+    os.makedirs(dirpath, exist_ok=True)
+    for name in names:
+        (dirpath / name).write_bytes(b"x" * nbytes)
+    return [dirpath / name for name in names]
+
+
+def test_prefetch_and_localize(tmp_path):
+    src_paths = make_files(tmp_path / "src", ["a.nc", "b.nc"])
+    missing_path = tmp_path / "src" / "c.nc"
+
+    with SourceStager(tmp_path / "stage") as stager:
+        stager.prefetch("1981", src_paths)
+        assert stager.wait("1981")
+
+        local_paths = localize(src_paths + [missing_path], stager.stage_dir)
+
+    assert local_paths == [
+        staged_path(src_path, tmp_path / "stage") for src_path in src_paths
+    ] + [missing_path]
+    assert all(local_path.read_bytes() == b"x" * 100 for local_path in local_paths[:2])
+
+
+def test_prefetch_glob(tmp_path):
+    make_files(tmp_path / "src", ["x.p19801201.pp", "x.p19810101.pp", "x.p19821201.pp"])
+    patterns = [
+        str(tmp_path / "src" / "*198012*.pp"),
+        str(tmp_path / "src" / "*1981*.pp"),
+    ]
+
+    with SourceStager(tmp_path / "stage") as stager:
+        stager.prefetch("1981", patterns)
+        stager.wait("1981")
+
+        assert localize(patterns, stager.stage_dir) == [
+            str(staged_path(pattern, stager.stage_dir)) for pattern in patterns
+        ]
+        assert not staged_path(
+            tmp_path / "src" / "x.p19821201.pp", stager.stage_dir
+        ).exists()
+        # nothing staged for another year so its files are read from the source
+        other_year = [str(tmp_path / "src" / "*1982*.pp")]
+        assert localize(other_year, stager.stage_dir) == other_year
+
+
+def test_budget_evicts_released_groups(tmp_path):
+    year1 = make_files(tmp_path / "src", ["1.nc"])
+    year2 = make_files(tmp_path / "src", ["2.nc"])
+    year3 = make_files(tmp_path / "src", ["3.nc"])
+
+    with SourceStager(tmp_path / "stage", budget=200) as stager:
+        stager.prefetch("1", year1)
+        stager.prefetch("2", year2)
+        assert stager.wait("1") and stager.wait("2")
+
+        # neither earlier year has been released so there is no room
+        stager.prefetch("3", year3)
+        assert not stager.wait("3")
+        assert localize(year3, stager.stage_dir) == year3
+
+        stager.release("1")
+        stager.prefetch("4", year3)
+        assert stager.wait("4")
+        assert stager.used == 200
+        assert localize(year1, stager.stage_dir) == year1
+        assert localize(year2, stager.stage_dir) != year2
+
+
+def test_temporary_stage_dir_removed(tmp_path, monkeypatch):
+    monkeypatch.setenv("TMPDIR", str(tmp_path))
+    src_paths = make_files(tmp_path / "src", ["a.nc"])
+
+    with SourceStager() as stager:
+        stager.prefetch("1981", src_paths)
+        stager.wait("1981")
+        assert stager.stage_dir.parent == tmp_path
+
+    assert not stager.stage_dir.exists()
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_output_stager_write(tmp_path, background):
+    ds = xr.Dataset({"pr": ("time", [1.0, 2.0, 3.0])})
+    output_path = tmp_path / "output" / "pr.nc"
+    written_to = []
+
+    def to_netcdf(path):
+        written_to.append(path)
+        ds.to_netcdf(path)
+
+    with OutputStager(tmp_path / "stage", background=background) as stager:
+        stager.write(to_netcdf, output_path)
+        stager.flush()
+        assert output_path.exists()
+
+    assert written_to[0].is_relative_to(tmp_path / "stage")
+    assert not written_to[0].exists()
+    xr.testing.assert_identical(xr.open_dataset(output_path), ds)
+
+
+def test_output_stager_write_many(tmp_path):
+    ds = xr.Dataset({"pr": ("time", [1.0, 2.0, 3.0])})
+    output_paths = [
+        tmp_path / "output" / "a" / "pr.zarr",
+        tmp_path / "output" / "b.zarr",
+    ]
+
+    def to_zarr(paths):
+        dask.compute(*[ds.to_zarr(path, compute=False) for path in paths])
+
+    with OutputStager(tmp_path / "stage", background=True) as stager:
+        stager.write_many(to_zarr, output_paths)
+
+    for output_path in output_paths:
+        xr.testing.assert_identical(xr.open_zarr(output_path).load(), ds)
+
+
+def test_output_stager_failed_write(tmp_path):
+    output_path = tmp_path / "output" / "pr.nc"
+
+    def fail(path):
+        path.write_bytes(b"partial")
+        raise RuntimeError("write failed")
+
+    with pytest.raises(RuntimeError, match="write failed"):
+        with OutputStager(tmp_path / "stage", background=True) as stager:
+            stager.write(fail, output_path)
+
+    assert not output_path.exists()
+    assert not staged_path(output_path, tmp_path / "stage").exists()
+
+
+def test_output_stager_flush_raises_publish_error(tmp_path):
+    # a file where the output directory should be
+    (tmp_path / "output").write_bytes(b"")
+
+    stager = OutputStager(tmp_path / "stage", background=True)
+    stager.write(lambda path: path.write_bytes(b"data"), tmp_path / "output" / "a.nc")
+    with pytest.raises(OSError):
+        stager.flush()
+    stager.close()
+
+
+def test_publish_replaces_directory(tmp_path):
+    existing = make_files(tmp_path / "output" / "train.zarr", ["old"])[0].parent
+    new = make_files(tmp_path / "local" / "train.zarr", ["new"])[0].parent
+
+    publish(new, existing, if_exists="replace")
+
+    assert sorted(os.listdir(existing)) == ["new"]
+    assert not new.exists()
+    assert sorted(os.listdir(tmp_path / "output")) == ["train.zarr"]
+
+
+def test_publish_refuses_to_replace(tmp_path):
+    existing = make_files(tmp_path / "output" / "train.zarr", ["old"])[0].parent
+    new = make_files(tmp_path / "local" / "train.zarr", ["new"])[0].parent
+
+    with pytest.raises(FileExistsError):
+        publish(new, existing)
+
+    assert sorted(os.listdir(existing)) == ["old"]
+    assert sorted(os.listdir(tmp_path / "output")) == ["train.zarr"]
+
+
+def test_publish_keeps_existing(tmp_path):
+    existing = make_files(tmp_path / "output" / "train.zarr", ["old"])[0].parent
+    new = make_files(tmp_path / "local" / "train.zarr", ["new"])[0].parent
+
+    publish(new, existing, if_exists="skip")
+
+    assert sorted(os.listdir(existing)) == ["old"]
+    assert not new.exists()
+    assert sorted(os.listdir(tmp_path / "output")) == ["train.zarr"]
+
+
+def test_publish_refuses_file_published_meanwhile(tmp_path, monkeypatch):
+    path = tmp_path / "output" / "pr.nc"
+    local_path = tmp_path / "local.nc"
+    local_path.write_bytes(b"data")
+    move = shutil.move
+
+    def move_then_publish_other(src, dst):
+        move(src, dst)
+        # another job publishes the same path after the check
+        path.write_bytes(b"other")
+
+    monkeypatch.setattr(shutil, "move", move_then_publish_other)
+    with pytest.raises(FileExistsError):
+        publish(local_path, path)
+
+    assert path.read_bytes() == b"other"
+    assert sorted(os.listdir(tmp_path / "output")) == ["pr.nc"]
+
+
+def test_publish_keeps_directory_published_meanwhile(tmp_path, monkeypatch):
+    path = tmp_path / "output" / "train.zarr"
+    new = make_files(tmp_path / "local" / "train.zarr", ["new"])[0].parent
+    move = shutil.move
+
+    def move_then_publish_other(src, dst):
+        move(src, dst)
+        # another job publishes the same store after the check
+        make_files(path, ["other"])
+
+    monkeypatch.setattr(shutil, "move", move_then_publish_other)
+    publish(new, path, if_exists="skip")
+
+    assert sorted(os.listdir(path)) == ["other"]
+    assert sorted(os.listdir(tmp_path / "output")) == ["train.zarr"]
+
+
+def test_publish_leaves_others_temporary_files(tmp_path):
+    path = tmp_path / "output" / "pr.nc"
+    path.parent.mkdir()
+    # another job part-way through publishing the same path
+    other_tmp_path = path.with_name(f".{path.name}.tmp")
+    other_tmp_path.write_bytes(b"other")
+    local_path = tmp_path / "local.nc"
+    local_path.write_bytes(b"data")
+
+    publish(local_path, path)
+
+    assert path.read_bytes() == b"data"
+    assert other_tmp_path.read_bytes() == b"other"
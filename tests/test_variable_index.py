@@ -0,0 +1,143 @@
+import cftime
+from mlde_utils import VariableMetadata
+import numpy as np
+import os
+import pytest
+import xarray as xr
+
+from mlde_data import variable_index
+
+
+def year_ds(year):
+    times = xr.date_range(
+        cftime.Datetime360Day(year - 1, 12, 1, 12),
+        periods=360,
+        freq="D",
+        use_cftime=True,
+    )
+    ds = xr.Dataset(
+        data_vars={
+            "tas": (
+                ["time", "grid_latitude", "grid_longitude"],
+                np.random.randn(360, 4, 5).astype("float32"),
+                {"grid_mapping": "rotated_latitude_longitude", "units": "K"},
+            ),
+            "time_bnds": (["time", "bnds"], np.stack([times, times], axis=1)),
+            "rotated_latitude_longitude": (
+                [],
+                np.int32(0),
+                {"grid_mapping_name": "rotated_latitude_longitude"},
+            ),
+        },
+        coords=dict(
+            time=(["time"], times, {"bounds": "time_bnds"}),
+            grid_latitude=(["grid_latitude"], np.linspace(-1, 1, 4)),
+            grid_longitude=(["grid_longitude"], np.linspace(0, 1, 5)),
+        ),
+        attrs={"domain": "test", "history": f"created {year}"},
+    )
+    # each file has its own time units
+    ds["time"].encoding["units"] = f"hours since {year - 1}-12-01 00:00:00"
+    ds["tas"].encoding["_FillValue"] = np.float32(1e20)
+    return ds
+
+
+@pytest.fixture
+def dsmeta(tmp_path):
+    dsmeta = VariableMetadata(
+        tmp_path,
+        variable="tas",
+        frequency="day",
+        domain="test",
+        resolution="60km",
+        ensemble_member="01",
+        scenario="rcp85",
+        collection="land-gcm",
+    )
+    os.makedirs(dsmeta.dirpath())
+    for year in [1981, 1982, 1983]:
+        year_ds(year).to_netcdf(dsmeta.filepath(year))
+    return dsmeta
+
+
+def open_files(filepaths):
+    return xr.open_mfdataset(
+        filepaths,
+        data_vars="minimal",
+        combine="by_coords",
+        compat="no_conflicts",
+        combine_attrs="drop_conflicts",
+    )
+
+
+def test_open_indexed(dsmeta):
+    variable_index.update_index(dsmeta)
+
+    result = variable_index.open_indexed(dsmeta)
+
+    assert result["tas"].chunks[0] == (360, 360, 360)
+    xr.testing.assert_identical(
+        result.load(), open_files(dsmeta.existing_filepaths()).load()
+    )
+    assert result["tas"].encoding["_FillValue"] == np.float32(1e20)
+
+
+def test_open_indexed_years(dsmeta):
+    variable_index.update_index(dsmeta)
+
+    result = variable_index.open_indexed(dsmeta, years=[1982, 1983])
+
+    xr.testing.assert_identical(
+        result.load(),
+        open_files([dsmeta.filepath(1982), dsmeta.filepath(1983)]).load(),
+    )
+
+
+def test_update_index_reads_only_new_files(dsmeta, monkeypatch):
+    variable_index.update_index(dsmeta)
+    year_ds(1984).to_netcdf(dsmeta.filepath(1984))
+
+    scanned = []
+    scan_file = variable_index._scan_file
+    monkeypatch.setattr(
+        variable_index,
+        "_scan_file",
+        lambda filepath, *args: scanned.append(filepath) or scan_file(filepath, *args),
+    )
+    index = variable_index.update_index(dsmeta)
+
+    assert scanned == [dsmeta.filepath(1984)]
+    assert [entry["name"] for entry in index["files"]] == [
+        dsmeta.filename(year) for year in [1981, 1982, 1983, 1984]
+    ]
+    assert variable_index.open_indexed(dsmeta).sizes["time"] == 4 * 360
+
+
+def test_open_stale_index(dsmeta):
+    variable_index.update_index(dsmeta)
+    year_ds(1984).to_netcdf(dsmeta.filepath(1984))
+
+    assert variable_index.stale_files(dsmeta, variable_index.load_index(dsmeta)) == [
+        dsmeta.filename(1984)
+    ]
+    # years that are still up to date can be opened
+    assert variable_index.open_indexed(dsmeta, years=[1981]).sizes["time"] == 360
+    with pytest.raises(ValueError, match="out of date"):
+        variable_index.open_indexed(dsmeta)
+
+
+def test_update_index_inconsistent_grid(dsmeta):
+    variable_index.update_index(dsmeta)
+    year_ds(1984).assign_coords(grid_latitude=np.linspace(-2, 2, 4)).to_netcdf(
+        dsmeta.filepath(1984)
+    )
+
+    with pytest.raises(ValueError, match="grid_latitude in .*1984"):
+        variable_index.update_index(dsmeta)
+
+
+def test_update_indexes(tmp_path, dsmeta):
+    dsmetas = variable_index.update_indexes(tmp_path)
+
+    assert [dsmeta.dirpath() for dsmeta in dsmetas] == [dsmeta.dirpath()]
+    assert variable_index.index_path(dsmeta).exists()
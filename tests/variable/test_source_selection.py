@@ -0,0 +1,183 @@
+from importlib.resources import files
+from string import Template
+import yaml
+
+from mlde_data.variable import (
+    SourceSelection,
+    SourceVariableConfig,
+    SpatialExtent,
+    source_selection,
+)
+
+
+def config(*spec, sources=None):
+    return {"variable": "test", "spec": list(spec)} | (
+        {} if sources is None else {"sources": sources}
+    )
+
+
+CPM_SOURCES = {
+    SourceVariableConfig(
+        src_type="moose", collection="land-cpm", frequency="day", variable="mlqtw"
+    )
+}
+
+
+def drop(*variables):
+    return {"action": "drop-variables", "parameters": {"variables": list(variables)}}
+
+
+def query(**query):
+    return {"action": "query", "parameters": {"query": query}}
+
+
+def coarsen(scale_factor=4):
+    return {"action": "coarsen", "parameters": {"scale_factor": scale_factor}}
+
+
+def select_subdomain(domain="engwales"):
+    return {"action": "select-subdomain", "parameters": {"domain": domain}}
+
+
+def vorticity():
+    return {"action": "vorticity", "parameters": {"theta": 850}}
+
+
+def test_single_config():
+    selection = source_selection(
+        [config(drop("air_temperature", "specific_humidity"), query(pressure=850))]
+    )
+
+    assert selection == SourceSelection(
+        drop_variables=frozenset({"air_temperature", "specific_humidity"}),
+        query={"pressure": [850]},
+    )
+
+
+def test_only_leading_actions():
+    selection = source_selection(
+        [
+            config(
+                drop("air_temperature"), coarsen(), drop("x_wind"), query(pressure=850)
+            )
+        ]
+    )
+
+    assert selection == SourceSelection(
+        drop_variables=frozenset({"air_temperature"}), query={}
+    )
+
+
+def test_combined_configs():
+    selection = source_selection(
+        [
+            config(drop("x_wind", "y_wind", "specific_humidity"), query(pressure=250)),
+            config(drop("air_temperature", "specific_humidity"), query(pressure=850)),
+        ]
+    )
+
+    assert selection == SourceSelection(
+        drop_variables=frozenset({"specific_humidity"}),
+        query={"pressure": [250, 850]},
+    )
+
+
+def test_no_selection_when_any_config_needs_everything():
+    selection = source_selection(
+        [config(drop("x_wind"), query(pressure=250)), config(coarsen())]
+    )
+
+    assert not selection
+
+
+def test_extent():
+    selection = source_selection(
+        [
+            config(
+                drop("air_temperature"),
+                coarsen(),
+                vorticity(),
+                select_subdomain(),
+                sources=CPM_SOURCES,
+            )
+        ]
+    )
+
+    assert selection.extent == SpatialExtent(
+        domain="engwales", resolution="2.2km-coarsened-4x", align=4
+    )
+
+
+def test_extent_gcm_coarsening():
+    selection = source_selection(
+        [config(coarsen("gcm"), select_subdomain(), sources=CPM_SOURCES)]
+    )
+
+    assert selection.extent == SpatialExtent(
+        domain="engwales", resolution="2.2km-coarsened-gcm", align=1
+    )
+
+
+def test_no_extent():
+    # no subdomain selected
+    assert source_selection([config(coarsen(), sources=CPM_SOURCES)]).extent is None
+    # an action that may move the grid before the subdomain is selected
+    assert (
+        source_selection(
+            [
+                config(
+                    {"action": "shift_lon_break"},
+                    select_subdomain(),
+                    sources=CPM_SOURCES,
+                )
+            ]
+        ).extent
+        is None
+    )
+    # a subdomain selected from a regridded target grid
+    assert (
+        source_selection(
+            [
+                config(
+                    {"action": "regrid_to_target"},
+                    select_subdomain(),
+                    sources=CPM_SOURCES,
+                )
+            ]
+        ).extent
+        is None
+    )
+    # configs selecting different subdomains
+    assert (
+        source_selection(
+            [
+                config(coarsen(), select_subdomain(), sources=CPM_SOURCES),
+                config(coarsen(), select_subdomain("scotland"), sources=CPM_SOURCES),
+            ]
+        ).extent
+        is None
+    )
+
+
+def test_canari_config():
+    # the canari configs give their query's coordinates directly rather than as a query parameter
+    with open(
+        files("mlde_data").joinpath(
+            "../../config/variables/day/canari-le-sprint/temp250.yml"
+        )
+    ) as f:
+        canari_config = yaml.safe_load(Template(f.read()).substitute(domain="engwales"))
+    canari_config["sources"] = {
+        SourceVariableConfig(
+            src_type="canari-le-sprint",
+            collection="canari-le-sprint",
+            frequency="day",
+            variable="temp250",
+        )
+    }
+
+    assert source_selection([canari_config]) == SourceSelection()
+    assert (
+        source_selection([canari_config, config(drop("foo"), query(pressure=250))])
+        == SourceSelection()
+    )